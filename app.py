@@ -1,36 +1,30 @@
 import streamlit as st
-import pandas as pd
-import pydeck as pdk
-from geopy.distance import geodesic
-from gtts import gTTS
-import io
-import requests
-import polyline
 from streamlit_js_eval import get_geolocation
 import time
 
-from fetch_air_quality import fetch_air_quality
-from pm25_to_score import pm25_to_score
-
-# Clear cache only once at startup, not continuously
-if 'cache_cleared' not in st.session_state:
-    st.cache_data.clear()
-    st.session_state.cache_cleared = True
+from aq_grid import get_air_quality_many, get_snapshot
+from aq_providers import aq_budget
+from aq_refresher import AirQualityRefresher
+from geofence import Geofence
+from gps_tracker import SLIDER_ORIGIN, GpsTracker, slider_position
+from landmarks import landmark_set
+from metrics import METRICS_PORT, metrics, start_metrics_server
+import profiler
+from tts_cache import PRIORITY_ROUTE
+from walking_matrix import get_walking_matrix
+
+# Kernlogik (Laden, Filtern, Tour, AQ, Layer) liegt im Paket citytour, hier nur die Oberflaeche
+from citytour import (
+    aq_layers, build_avatar_layers, build_deck, current_version, default_caches, discovered_layers,
+    find_nearby, landmark_image, landmark_layers, load_dataset, route_layers, route_stops,
+    session_route, view_state,
+)
 
 # --- CONFIGURATION ---
 st.set_page_config(page_title="CityTour Munich", layout="centered")
 
-# MAPBOX TOKEN
-MAPBOX_API_KEY = ""
-
-# === IMAGE MAPPING - INSERT YOUR IMAGE URLS HERE ===
-LANDMARK_IMAGES = {
-    "Eisbachwelle": "https://a.travel-assets.com/findyours-php/viewfinder/images/res40/195000/195001.jpg",
-    "Monopteros": "https://www.muenchen.de/sites/default/files/styles/3_2_w1216/public/2022-06/210108_monopteros-herbst_Mde-MichaelHofmann.jpg.webp",
-    "Friedensengel": "https://de.wikipedia.org/wiki/Datei:M%C3%BCnchen_-_Friedensengel_mit_Font%C3%A4ne_(tone-mapping).jpg",
-    "Chinesischer Turm": "https://www.muenchen.de/sites/default/files/styles/3_2_w1216/public/2022-06/20201204-kocherlball-4-3.jpg.webp",
-    "Viktualienmarkt": "https://www.travelguide.de/media/1200x800/muenchen-viktualienmarkt-1200x800.avif",
-}
+# Profiler auf Abruf: CITYTOUR_PROFILE=N oder ?profile=N&profile_token=... (siehe profiler.py)
+rerun_profile = profiler.begin_rerun(st.session_state, st.query_params)
 
 # CSS (DARK MODE)
 st.markdown("""
@@ -93,90 +87,68 @@ if "user_interests" not in st.session_state:
 if "user_mode" not in st.session_state:
     st.session_state.user_mode = ""
 if "visited" not in st.session_state:
-    st.session_state.visited = []
+    st.session_state.visited = set()
 # GPS-spezifische States
 if "last_lat" not in st.session_state:
-    st.session_state.last_lat = 48.1370
+    st.session_state.last_lat = SLIDER_ORIGIN[0]
 if "last_lon" not in st.session_state:
-    st.session_state.last_lon = 11.5750
+    st.session_state.last_lon = SLIDER_ORIGIN[1]
 
 # getting data
-@st.cache_data
-def load_data():
-    try:
-        df = pd.read_csv("places-in-munich.csv")
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame()
-
-from landmarks import landmark_list
-
-@st.cache_data
-def load_air_quality_data():
-    try:
-        df = pd.read_csv("air_quality_stations.csv")
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame()
-
-df = load_data()
-aq_df = load_air_quality_data()
-
-# Debug output
-print(f"DEBUG: Places loaded: {len(df)}")
-print(f"DEBUG: Air quality stations loaded: {len(aq_df)}")
-if not aq_df.empty:
-    print(f"DEBUG: AQ columns: {aq_df.columns.tolist()}")
-
-def text_to_speech(text):
-    try:
-        tts = gTTS(text=text, lang='en')
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        return audio_fp
-    except:
-        return None
-
-@st.cache_data
-def get_osrm_route(locations):
-    if not locations: return []
-    try:
-        loc_string = ";".join([f"{lon},{lat}" for lat, lon in locations])
-        url = f"http://router.project-osrm.org/route/v1/foot/{loc_string}?overview=full&geometries=polyline"
-        r = requests.get(url, timeout=2)
-        if r.status_code == 200:
-            res = r.json()
-            encoded = res['routes'][0]['geometry']
-            decoded = polyline.decode(encoded)
-            return [[lon, lat] for lat, lon in decoded]
-    except:
-        pass
-    return [[lon, lat] for lat, lon in locations]
-
-def optimize_route_ordering(df):
+@st.cache_resource(max_entries=2)
+def get_dataset(version):
     """
-    Start point: Closest to Marienplatz.
-    Next point: Closest unvisited neighbor.
+    Places (POI store or CSV), loaded once per version and shared by all sessions.
+    Keyed on current_version(), so a newly written store is picked up on the next rerun.
     """
-    if len(df) < 3:
-        return df
-
-    points = df.to_dict('records')
-
-    marienplatz = (48.1372, 11.5755)
-    start_node = min(points, key=lambda p: geodesic((p['lat'], p['lon']), marienplatz).km)
+    return load_dataset()
+
+@st.cache_resource
+def start_aq_refresher():
+    """One background refresher per process, keeps the station grid up to date"""
+    return AirQualityRefresher().start()
+
+@st.cache_resource
+def prefetch_place_audio(dataset_version):
+    """Queues the descriptions of all places for background TTS, once per dataset version"""
+    return caches.audio.prefetch(set(get_dataset(dataset_version).descriptions()), 'en')
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Prometheus /metrics on CITYTOUR_METRICS_PORT, once per process (off without a port)"""
+    if not METRICS_PORT:
+        return None
+    return start_metrics_server("0.0.0.0", METRICS_PORT)[0]
 
-    # Greedy Algorithm
-    ordered_path = [start_node]
-    points.remove(start_node)
+caches = default_caches
+start_metrics_endpoint()
+dataset = get_dataset(current_version())
+df = dataset.places
+start_aq_refresher()
+prefetch_place_audio(dataset.version)
 
-    while points:
-        current = ordered_path[-1]
-        nearest = min(points, key=lambda p: geodesic((current['lat'], current['lon']), (p['lat'], p['lon'])).km)
-        ordered_path.append(nearest)
-        points.remove(nearest)
+def text_to_speech(text):
+    return caches.speech(text, 'en')
 
-    return pd.DataFrame(ordered_path)
+def find_nearby_places(place_index, places_df, user_lat, user_lon):
+    """
+    All places whose geofence the user is in, closest first, as [(place, dist_km), ...].
+    Enter events mark the place as visited and show a toast.
+    """
+    if 'geofence' not in st.session_state:
+        st.session_state.geofence = Geofence()
+    nearby, entered = find_nearby(st.session_state.geofence, place_index, places_df, user_lat, user_lon)
+    for place in entered:
+        st.session_state.visited.add(place['name'])
+        st.toast(f"📍 {place['name']}")
+    return nearby
+
+def get_route_session(places_df, walking_matrix=None):
+    """
+    The guided tour of this session, optimized once per dataset and filter
+    and then updated incrementally (see route_session.py).
+    """
+    return session_route(st.session_state, dataset, places_df, walking_matrix)
 
 # WELCOME SCREEN (SETUP)
 if not st.session_state.setup_complete:
@@ -228,15 +200,26 @@ else:
         st.error("CSV not found! Please check places-in-munich.csv")
     else:
         # filter input
-        filtered_df = df[df['category'].isin(st.session_state.user_interests)].copy()
+        with metrics.span("render.filter"):
+            filtered_df = dataset.filter(st.session_state.user_interests)
+            place_index = dataset.index(st.session_state.user_interests)
 
         # Reset Button (Top Right logic via Expander)
         with st.expander(f"👤 Profil: {st.session_state.user_name}", expanded=False):
             st.write(f"**Interests:** {', '.join(st.session_state.user_interests)}")
             st.write(f"**Mode:** {st.session_state.user_mode}")
+            if 'gps_tracker' in st.session_state:
+                gps_stats = st.session_state.gps_tracker.stats()
+                st.caption(f"Position updates: {gps_stats['processed']} processed, {gps_stats['skipped']} skipped "
+                           f"(poll every {gps_stats['poll_interval']} s)")
             if st.button("Reset Profile"):
                 st.session_state.setup_complete = False
-                st.session_state.visited = []
+                st.session_state.visited = set()
+                st.session_state.pop('gps_tracker', None)
+                st.session_state.pop('geofence', None)
+                st.session_state.pop('nearby_places', None)
+                st.session_state.pop('route_session', None)
+                st.session_state.pop('route_session_key', None)
                 st.rerun()
 
         st.markdown(f"## Your Munich Walk")
@@ -249,11 +232,21 @@ else:
         if st.session_state.user_mode == "Spontaneous":
             use_gps = st.toggle("🛰️ Use Real GPS", value=False)
 
+        # Positions-Pipeline pro Session: Glaettung, Bewegungsschwelle, Abfragerate
+        if 'gps_tracker' not in st.session_state:
+            st.session_state.gps_tracker = GpsTracker()
+        tracker = st.session_state.gps_tracker
+        poll_every = tracker.poll_interval() if use_gps else None
+
         # Fragment für dynamische Updates bei GPS
-        @st.fragment(run_every=3 if use_gps else None)
+        @st.fragment(run_every=poll_every)
+        @profiler.profiled("render_map_section", lambda: st.session_state)
+        @metrics.timed(f"render.{st.session_state.user_mode.lower()}")
+        @aq_budget()  # alle AQ-Abfragen eines Renders teilen sich CITYTOUR_AQ_BUDGET Sekunden
         def render_map_section():
             layers = []
-            view_state = pdk.ViewState(latitude=48.137, longitude=11.575, zoom=13, pitch=45)
+            route_df = filtered_df
+            view = view_state()
 
             # User Position bestimmen
             user_lat = st.session_state.last_lat
@@ -265,81 +258,48 @@ else:
 
                 if not filtered_df.empty:
                     # optimize the nodes
-                    optimized_df = optimize_route_ordering(filtered_df)
-
-                    # Fetch air quality data for each location
-                    for idx, row in optimized_df.iterrows():
-                        aq_data = fetch_air_quality(row['lat'], row['lon'])
-                        if aq_data:
-                            optimized_df.at[idx, 'pm25'] = aq_data.get('pm25', 0)
-                            optimized_df.at[idx, 'pm10'] = aq_data.get('pm10', 0)
-                            optimized_df.at[idx, 'no2'] = aq_data.get('no2', 0)
-                            optimized_df.at[idx, 'air_quality'] = pm25_to_score(optimized_df.at[idx, 'pm25'])
-                        else:
-                            optimized_df.at[idx, 'pm25'] = 0
-                            optimized_df.at[idx, 'pm10'] = 0
-                            optimized_df.at[idx, 'no2'] = 0
-                            optimized_df.at[idx, 'air_quality'] = 50
-
-                    # Calculate Route
-                    route_points = list(zip(optimized_df['lat'], optimized_df['lon']))
-                    real_path = get_osrm_route(route_points)
-
-                    # The Path
-                    layers.append(pdk.Layer(
-                        "PathLayer",
-                        data=[{"path": real_path}],
-                        get_path="path",
-                        get_color='[0, 150, 255, 200]',
-                        width_scale=10,
-                        width_min_pixels=3
-                    ))
-
-                    # Numbered Points
-                    optimized_df['idx'] = range(1, len(optimized_df) + 1)
-                    layers.append(pdk.Layer(
-                        "ScatterplotLayer",
-                        optimized_df,
-                        get_position='[lon, lat]',
-                        get_color="[noise_level * 2.5, (100 - noise_level) * 2.5, 50, 200]",
-                        get_line_color='[0, 150, 255]',
-                        get_line_width=20,
-                        get_radius=60,
-                        pickable=True
-                    ))
-                    layers.append(pdk.Layer(
-                        "TextLayer",
-                        optimized_df,
-                        get_position='[lon, lat]',
-                        get_text='idx',
-                        get_color=[0, 0, 0],
-                        get_size=18,
-                        get_alignment_baseline="'center'"
-                    ))
-
-                    # Center map on first point
-                    view_state.latitude = optimized_df.iloc[0]['lat']
-                    view_state.longitude = optimized_df.iloc[0]['lon']
+                    with metrics.span("render.optimize"):
+                        walking_matrix = get_walking_matrix(df['lat'].to_numpy(), df['lon'].to_numpy(),
+                                                            dataset.version)
+                        route = get_route_session(filtered_df, walking_matrix)
+                    # Stopps in Tour-Reihenfolge, AQ in einem Batch nur fuer neue Stopps
+                    with metrics.span("render.aq"):
+                        optimized_df = route_stops(filtered_df, route, get_air_quality_many)
+                    route_df = optimized_df
+
+                    if optimized_df.empty:
+                        st.success("You have seen all stops of your route! 🎉")
+                    else:
+                        # route stops before the rest of the dataset
+                        caches.audio.prefetch([dataset.desc(row) for _, row in optimized_df.iterrows()],
+                                              'en', priority=PRIORITY_ROUTE)
+
+                        # Calculate Route (only legs the session has not routed yet)
+                        with metrics.span("render.osrm"):
+                            real_path = route.path(caches.route_legs)
+
+                        # static until the stops or their AQ values change
+                        with metrics.span("render.layers"):
+                            layers.extend(route_layers(dataset.version, optimized_df, real_path, caches.layers))
+
+                        # Center map on first point
+                        view.latitude = optimized_df.iloc[0]['lat']
+                        view.longitude = optimized_df.iloc[0]['lon']
 
             # mode 2 -> spontaneous (explore as you go) mit GPS-Integration
             else:
+                fix = None
                 if use_gps:
-                    # GPS-Abfrage mit eindeutigem Key
+                    # GPS-Abfrage; neuer Key erst nachdem ein Fix angekommen ist
                     if 'gps_key' not in st.session_state:
                         st.session_state.gps_key = f"gps_{time.time()}"
 
                     loc = get_geolocation(component_key=st.session_state.gps_key)
 
                     if loc:
-                        user_lat = loc['coords']['latitude']
-                        user_lon = loc['coords']['longitude']
-                        # save location
-                        st.session_state.last_lat = user_lat
-                        st.session_state.last_lon = user_lon
-
-                        # generate new key for update
+                        fix = (loc['coords']['latitude'], loc['coords']['longitude'], loc['coords'].get('accuracy'))
+                        # generate new key for the next poll
                         st.session_state.gps_key = f"gps_{time.time()}"
-                        st.toast("📍 GPS Updated")
                     else:
                         st.warning("Waiting for GPS signal...")
                 else:
@@ -352,12 +312,17 @@ else:
                     with col_nav2:
                         lon_val = st.slider("↔️ West-Ost", 0, 100, 50, key='lon_slider')
 
-                    # User Position (Ursprung: Marienplatz Center)
-                    user_lat = 48.1370 + ((lat_val - 50) * 0.0004)
-                    user_lon = 11.5750 + ((lon_val - 50) * 0.0006)
+                    # User Position (Ursprung: Marienplatz Center), exakt -> Genauigkeit 0
+                    fix = (*slider_position(lat_val, lon_val), 0)
 
+                # kaum bewegt -> Nähe, Landmarks und AQ vom letzten verarbeiteten Tick weiterverwenden
+                moved = fix is not None and tracker.update(*fix)
+                if tracker.lat is not None:
+                    user_lat, user_lon = tracker.lat, tracker.lon
                     st.session_state.last_lat = user_lat
                     st.session_state.last_lon = user_lon
+                if moved and use_gps:
+                    st.toast("📍 GPS Updated")
 
                 # Init last update wenn nicht vorhanden
                 if 'last_landmark_update' not in st.session_state:
@@ -365,83 +330,55 @@ else:
 
                 current_time = time.time()
 
-                if current_time - st.session_state.last_landmark_update > 15:
-                    for lm in landmark_list:
-                        lm.get_scaled_radius(user_lat, user_lon)  # Trigger berechnung
+                if (moved and current_time - st.session_state.last_landmark_update > 15) or 'landmark_records' not in st.session_state:
+                    # alle Landmarks in einem vektorisierten Durchlauf skalieren
+                    with metrics.span("render.landmarks"):
+                        st.session_state.landmark_records = landmark_set.to_layer_data(user_lat, user_lon)
+                    st.session_state.landmark_position = (user_lat, user_lon)
                     st.session_state.last_landmark_update = current_time
 
-                # Check Proximity Logic
-                nearby_place = None
-                for _, row in filtered_df.iterrows():
-                    if geodesic((row['lat'], row['lon']), (user_lat, user_lon)).km < 0.25:  # 250m radius
-                        # Create a copy of the row as a dict to avoid Series reference issues
-                        nearby_place = row.to_dict()
-
-                        if row['name'] not in st.session_state.visited:
-                            st.session_state.visited.append(row['name'])
-
-                        # Fetch air quality data for the nearby place
-                        aq_data = fetch_air_quality(row['lat'], row['lon'])
-                        if aq_data:
-                            nearby_place['pm25'] = aq_data.get('pm25', 0)
-                            nearby_place['pm10'] = aq_data.get('pm10', 0)
-                            nearby_place['no2'] = aq_data.get('no2', 0)
-                            nearby_place['air_quality'] = pm25_to_score(nearby_place['pm25'])
-                        else:
-                            nearby_place['pm25'] = 0
-                            nearby_place['pm10'] = 0
-                            nearby_place['no2'] = 0
-                            nearby_place['air_quality'] = 50
-
-                        break  # Stop after finding the first nearby place
-
-                # Layer 1: User Avatar
-                layers.append(pdk.Layer(
-                    "ScatterplotLayer",
-                    data=[{"lon": user_lon, "lat": user_lat, "noise_level": 50}],
-                    get_position='[lon, lat]',
-                    get_color="[100, 150, 255, 220]",
-                    get_radius=20,
-                ))
-                layers.append(pdk.Layer(
-                    "ScatterplotLayer",
-                    data=[{"lon": user_lon, "lat": user_lat, "noise_level": 50}],
-                    get_position='[lon, lat]',
-                    get_color="[0, 150, 255, 220]",
-                    get_radius=5,
-                ))
-
-                # Discovered points (Green)
-                discovered_df = filtered_df[filtered_df['name'].isin(st.session_state.visited)]
-                if not discovered_df.empty:
-                    layers.append(pdk.Layer(
-                        "ScatterplotLayer",
-                        discovered_df,
-                        get_position='[lon, lat]',
-                        get_color="[100, 200, 100, 220]",
-                        get_radius=60,
-                        pickable=True
-                    ))
+                # Geofences (250 m rein, 300 m raus), AQ und Bild nur beim Betreten
+                if moved or 'nearby_places' not in st.session_state:
+                    with metrics.span("render.proximity"):
+                        st.session_state.nearby_places = find_nearby_places(place_index, filtered_df,
+                                                                            user_lat, user_lon)
+                nearby_places = st.session_state.nearby_places
+                nearby_place = nearby_places[0][0] if nearby_places else None
+
+                with metrics.span("render.layers"):
+                    # Layer 1: User Avatar
+                    layers.extend(build_avatar_layers(user_lat, user_lon))
+
+                    # Landmarks, skaliert nach Entfernung (neu alle 15 s)
+                    landmark_records = st.session_state.landmark_records
+                    layers.extend(landmark_layers(st.session_state.landmark_position, landmark_records,
+                                                  caches.layers))
+
+                    # Discovered points (Green), neu nur wenn ein Ort dazukommt
+                    discovered_df = filtered_df[filtered_df['name'].isin(st.session_state.visited)]
+                    layers.extend(discovered_layers(dataset.version, discovered_df, caches.layers))
 
                 # follow user as they move
-                view_state.latitude = user_lat
-                view_state.longitude = user_lon
-                view_state.zoom = 15
-                view_state.bearing = 0
+                view.latitude = user_lat
+                view.longitude = user_lon
+                view.zoom = 15
+                view.bearing = 0
 
                 # === NOTIFICATIONS WITH IMAGES ===
                 if nearby_place is not None:
                     st.success(f"Found: {nearby_place['name']}!")
+                    if len(nearby_places) > 1:
+                        st.caption("Also nearby: " + ", ".join(
+                            f"{place['name']} ({dist_km * 1000:.0f} m)" for place, dist_km in nearby_places[1:]))
 
                     # Create two columns: one for image, one for info
                     col_img, col_info = st.columns([1, 1])
 
                     with col_img:
-                        # Display image if available in the mapping
-                        place_name = nearby_place['name']
-                        if place_name in LANDMARK_IMAGES and LANDMARK_IMAGES[place_name] != "YOUR_IMAGE_URL_HERE":
+                        # Display image if available in the mapping (looked up on enter)
+                        if nearby_place.get('image'):
                             st.markdown(
-                                f'<img src="{LANDMARK_IMAGES[place_name]}" class="landmark-image" width="100%">',
+                                f'<img src="{nearby_place["image"]}" class="landmark-image" width="100%">',
                                 unsafe_allow_html=True
                             )
                         else:
@@ -461,108 +398,31 @@ else:
                         """)
 
                     if st.button("🔊 Listen the information"):
-                        aud = text_to_speech(nearby_place.get('desc', 'No description available'))
+                        aud = text_to_speech(dataset.desc(nearby_place))
                         if aud: st.audio(aud, format='audio/mp3')
 
-            # Add Air Quality Grid Layer (for both modes)
-            if show_aq and not aq_df.empty:
-                aq_df_copy = aq_df.copy()
-
-                # Color mapping for PM2.5 levels
-                def get_color_for_pm25(pm25):
-                    if pm25 < 12:
-                        return [0, 220, 100, 80]  # Green - Good
-                    elif pm25 < 35:
-                        return [255, 220, 0, 80]  # Yellow - Moderate
-                    elif pm25 < 55:
-                        return [255, 140, 0, 80]  # Orange - Unhealthy for Sensitive
-                    else:
-                        return [255, 50, 50, 80]  # Red - Unhealthy
-
-                aq_df_copy['color'] = aq_df_copy['pm25'].apply(get_color_for_pm25)
-
-                # Create grid cells using ColumnLayer for fixed visible grid
-                layers.append(pdk.Layer(
-                    "ColumnLayer",
-                    aq_df_copy,
-                    get_position='[lon, lat]',
-                    get_elevation='pm25 * 50',  # Height based on PM2.5
-                    elevation_scale=1,
-                    radius=400,  # Size of each grid cell
-                    get_fill_color='color',
-                    pickable=True,
-                    auto_highlight=True,
-                    extruded=True,
-                    coverage=1,
-                    opacity=0.01
-                ))
-
-                # Add grid borders/outlines for better visibility
-                layers.append(pdk.Layer(
-                    "ScatterplotLayer",
-                    aq_df_copy,
-                    get_position='[lon, lat]',
-                    get_fill_color='[50, 50, 50, 0]',  # Transparent fill
-                    get_line_color='[255, 255, 255, 180]',  # White border
-                    get_radius=400,
-                    line_width_min_pixels=2,
-                    stroked=True,
-                    filled=False,
-                    pickable=True
-                ))
-
-                # Add text labels showing PM2.5 values on each grid cell
-                layers.append(pdk.Layer(
-                    "TextLayer",
-                    aq_df_copy,
-                    get_position='[lon, lat]',
-                    get_text='pm25',
-                    get_color=[255, 255, 255, 255],
-                    get_size=14,
-                    get_alignment_baseline="'center'",
-                    get_pixel_offset=[0, 0],
-                    billboard=True
-                ))
-
-            # Map Rendering
-            if MAPBOX_API_KEY:
-                map_style = "mapbox://styles/mapbox/dark-v10"
-                api_keys = {"mapbox": MAPBOX_API_KEY}
-            else:
-                map_style = "https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json"
-                api_keys = None
+            # Add Air Quality Grid Layer (for both modes), built once per AQ snapshot
+            if show_aq:
+                with metrics.span("render.layers"):
+                    layers.extend(aq_layers(get_snapshot(), caches.layers))
 
             # === RENDER MAP ===
-            st.pydeck_chart(pdk.Deck(
-                map_style=map_style,
-                initial_view_state=view_state,
-                layers=layers,
-                api_keys=api_keys,
-                tooltip={
-                    "html": """
-                    <b>{name}</b><br/>
-                    <b style='color: #00d4ff'>PM2.5:</b> {pm25} µg/m³<br/>
-                    <b style='color: #00d4ff'>PM10:</b> {pm10} µg/m³<br/>
-                    <b style='color: #00d4ff'>NO2:</b> {no2} µg/m³<br/>
-                    <b style='color: #00ff88'>Quality:</b> {quality_category}
-                    """,
-                    "style": {
-                        "backgroundColor": "rgba(0, 0, 0, 0.8)",
-                        "color": "white",
-                        "fontSize": "12px",
-                        "padding": "10px",
-                        "borderRadius": "5px"
-                    }
-                }
-            ), height=400)
-
-            return filtered_df  # Return für weitere Verwendung
+            # cached layers go out as pre-serialized JSON, only the avatar is serialized per tick
+            # (DeckSpec.to_json is timed as deck.serialize)
+            st.pydeck_chart(build_deck(layers, view), height=400)
+
+            # Abfragerate hat sich mit der Geschwindigkeit geaendert -> Fragment neu anlegen
+            if use_gps and tracker.poll_interval() != poll_every:
+                st.rerun(scope="app")
+
+            return route_df  # Return für weitere Verwendung (Guided: Stopps in Tour-Reihenfolge)
 
         # Fragment ausführen
         current_filtered_df = render_map_section()
 
         # Air Quality Legend
-        if show_aq and not aq_df.empty:
+        aq_snapshot = get_snapshot()
+        if show_aq and aq_snapshot is not None and not aq_snapshot.df.empty:
             st.markdown("### 🌫️ Air Quality Legend")
             col1, col2, col3, col4 = st.columns(4)
             with col1:
@@ -577,17 +437,21 @@ else:
         # LIST OF STOPS (WITH IMAGES IN GUIDED MODE)
         if st.session_state.user_mode == "Guided":
             st.markdown("### Your route")
+            if 'route_session' in st.session_state and (st.session_state.route_session.visited
+                                                        or st.session_state.route_session.skipped):
+                st.caption(f"Visited: {len(st.session_state.route_session.visited)}, "
+                           f"skipped: {len(st.session_state.route_session.skipped)}")
             for idx, row in current_filtered_df.reset_index(drop=True).iterrows():
                 with st.expander(f"{idx+1}. {row['name']}"):
                     # Show image in expander if available
-                    place_name = row['name']
-                    if place_name in LANDMARK_IMAGES and LANDMARK_IMAGES[place_name] != "YOUR_IMAGE_URL_HERE":
+                    image = landmark_image(row['name'])
+                    if image:
                         st.markdown(
-                            f'<img src="{LANDMARK_IMAGES[place_name]}" class="landmark-image" width="100%">',
+                            f'<img src="{image}" class="landmark-image" width="100%">',
                             unsafe_allow_html=True
                         )
 
-                    st.write(row.get('desc', 'No description available'))
+                    st.write(dataset.desc(row))
                     st.markdown(f"""
                     **Umwelt-Info:**  
                     - Lärm: {row.get('noise_level', 'N/A')} / 100 🔊
@@ -599,5 +463,16 @@ else:
                     - NO2: {row.get('no2', 'N/A')} µg/m³
                     """)
                     if st.button("🔊 Audio", key=f"btn_{idx}"):
-                        aud = text_to_speech(row.get('desc', 'No description available'))
-                        if aud: st.audio(aud, format='audio/mp3')
\ No newline at end of file
+                        aud = text_to_speech(dataset.desc(row))
+                        if aud: st.audio(aud, format='audio/mp3')
+
+                    # Tour lokal anpassen statt neu zu berechnen (route_session.py)
+                    col_visit, col_skip = st.columns(2)
+                    if col_visit.button("✅ Visited", key=f"visit_{row['route_pos']}"):
+                        st.session_state.route_session.visit(int(row['route_pos']))
+                        st.rerun()
+                    if col_skip.button("⏭️ Skip", key=f"skip_{row['route_pos']}"):
+                        st.session_state.route_session.skip(int(row['route_pos']))
+                        st.rerun()
+
+profiler.finish(rerun_profile, st.session_state)
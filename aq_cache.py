@@ -0,0 +1,120 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Open-Meteo aktualisiert stuendlich, Aufloesung ca. 1 km (~0.01°)
+DEFAULT_CELL_DEG = float(os.environ.get("CITYTOUR_AQ_CELL_DEG", 0.01))
+DEFAULT_TTL = float(os.environ.get("CITYTOUR_AQ_TTL", 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("CITYTOUR_AQ_MAX_ENTRIES", 4096))
+DEFAULT_DB_PATH = os.environ.get("CITYTOUR_AQ_CACHE_DB") or None
+
+
+class AirQualityCache:
+    """
+    Thread-safe cache for air quality measurements.
+    - Coordinates snap to a grid cell of cell_deg degrees
+    - Entries expire after ttl seconds
+    - At most max_entries cells are kept in memory (LRU eviction)
+    - Optional SQLite file (db_path) so entries survive restarts
+    """
+
+    def __init__(self, cell_deg=DEFAULT_CELL_DEG, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, db_path=None):
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS aq_cache ("
+                " cell_lat INTEGER, cell_lon INTEGER,"
+                " pm25 REAL, pm10 REAL, no2 REAL, fetched_at REAL,"
+                " PRIMARY KEY (cell_lat, cell_lon))"
+            )
+            self._db.commit()
+
+    def cell(self, lat, lon):
+        """Grid cell (row, col) a coordinate falls into"""
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def get(self, lat, lon):
+        """Cached measurements for the cell of (lat, lon), or None"""
+        key = self.cell(lat, lon)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+
+            entry = self._load(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._store(key, entry)
+                self.hits += 1
+                return dict(entry[0])
+
+            self.misses += 1
+            return None
+
+    def set(self, lat, lon, measurements, fetched_at=None):
+        """Stores measurements for the cell of (lat, lon)"""
+        key = self.cell(lat, lon)
+        entry = (dict(measurements), fetched_at if fetched_at is not None else time.time())
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                values = entry[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO aq_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key[0], key[1], values.get('pm25'), values.get('pm10'), values.get('no2'), entry[1])
+                )
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM aq_cache")
+                self._db.commit()
+
+    def stats(self):
+        """Hit / miss counters for monitoring"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT pm25, pm10, no2, fetched_at FROM aq_cache WHERE cell_lat = ? AND cell_lon = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        return {'pm25': row[0], 'pm10': row[1], 'no2': row[2]}, row[3]
+
+
+# Ein Cache pro Prozess -> wird von allen Streamlit-Sessions geteilt
+aq_cache = AirQualityCache(db_path=DEFAULT_DB_PATH)
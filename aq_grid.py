@@ -0,0 +1,185 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aq_providers import build_chain
+from metrics import metrics
+
+AQ_GRID_CSV = "air_quality_stations.csv"
+# versionierte Dateien des Hintergrund-Refreshers (aq_refresher.py)
+AQ_SNAPSHOT_DIR = "aq_snapshots"
+POLLUTANTS = ("pm25", "pm10", "no2")
+
+# Primaere Quelle fuer Punktabfragen:
+# - "api":  Open-Meteo, dann WAQI, dann das Grid (default)
+# - "grid": interpolierte Werte aus air_quality_stations.csv, APIs nur ausserhalb des Grids
+AQ_SOURCE = os.environ.get("CITYTOUR_AQ_SOURCE", "api")
+DEFAULT_PROVIDERS = {
+    "api": "open_meteo,waqi,grid,fallback",
+    "grid": "grid,open_meteo,waqi,fallback",
+}
+# Reihenfolge der Provider-Kette (aq_providers.py), ueberschreibt AQ_SOURCE
+AQ_PROVIDERS = os.environ.get("CITYTOUR_AQ_PROVIDERS") or DEFAULT_PROVIDERS.get(AQ_SOURCE, DEFAULT_PROVIDERS["api"])
+
+
+class AirQualityGrid:
+    """
+    Regular lat/lon grid of PM2.5, PM10 and NO2 values (the station cells of
+    air_quality_stations.csv), held as one (rows, cols, 3) NumPy array.
+    Point queries are bilinearly interpolated between the 4 surrounding cells.
+    """
+
+    def __init__(self, lat0, lon0, lat_step, lon_step, values):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.lat_step = lat_step
+        self.lon_step = lon_step
+        self.values = np.asarray(values, dtype=np.float64)
+        self.rows, self.cols = self.values.shape[:2]
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Builds the grid from rows with grid_row, grid_col, lat, lon and the pollutant columns"""
+        rows = int(df['grid_row'].max()) + 1
+        cols = int(df['grid_col'].max()) + 1
+        values = np.full((rows, cols, len(POLLUTANTS)), np.nan)
+        values[df['grid_row'].to_numpy(), df['grid_col'].to_numpy()] = df[list(POLLUTANTS)].to_numpy(dtype=np.float64)
+
+        lat0 = float(df.loc[df['grid_row'] == 0, 'lat'].iloc[0])
+        lon0 = float(df.loc[df['grid_col'] == 0, 'lon'].iloc[0])
+        lat_step = (float(df['lat'].max()) - lat0) / max(rows - 1, 1)
+        lon_step = (float(df['lon'].max()) - lon0) / max(cols - 1, 1)
+        return cls(lat0, lon0, lat_step, lon_step, values)
+
+    @classmethod
+    def from_csv(cls, path=AQ_GRID_CSV):
+        return cls.from_dataframe(pd.read_csv(path))
+
+    def query_many(self, lats, lons):
+        """
+        Interpolated (n, 3) array of pm25, pm10, no2 for many points.
+        Rows are NaN for points more than half a cell outside the grid
+        or next to a missing cell.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        fr = (lats - self.lat0) / self.lat_step
+        fc = (lons - self.lon0) / self.lon_step
+        inside = (fr >= -0.5) & (fr <= self.rows - 0.5) & (fc >= -0.5) & (fc <= self.cols - 0.5)
+
+        fr = np.clip(fr, 0, self.rows - 1)
+        fc = np.clip(fc, 0, self.cols - 1)
+        r0 = np.clip(np.floor(fr).astype(np.int64), 0, max(self.rows - 2, 0))
+        c0 = np.clip(np.floor(fc).astype(np.int64), 0, max(self.cols - 2, 0))
+        r1 = np.minimum(r0 + 1, self.rows - 1)
+        c1 = np.minimum(c0 + 1, self.cols - 1)
+        tr = (fr - r0)[:, None]
+        tc = (fc - c0)[:, None]
+
+        v = self.values
+        out = ((1 - tr) * (1 - tc) * v[r0, c0] + (1 - tr) * tc * v[r0, c1]
+               + tr * (1 - tc) * v[r1, c0] + tr * tc * v[r1, c1])
+        out[~inside] = np.nan
+        return out
+
+    def query(self, lat, lon):
+        """Interpolated measurements dict for one point, or None outside the grid"""
+        # skalarer Pfad ohne Array-Overhead, gleiche Rechnung wie query_many
+        fr = (lat - self.lat0) / self.lat_step
+        fc = (lon - self.lon0) / self.lon_step
+        if not (-0.5 <= fr <= self.rows - 0.5 and -0.5 <= fc <= self.cols - 0.5):
+            return None
+
+        fr = min(max(fr, 0.0), self.rows - 1)
+        fc = min(max(fc, 0.0), self.cols - 1)
+        r0 = min(int(fr), max(self.rows - 2, 0))
+        c0 = min(int(fc), max(self.cols - 2, 0))
+        r1 = min(r0 + 1, self.rows - 1)
+        c1 = min(c0 + 1, self.cols - 1)
+        tr = fr - r0
+        tc = fc - c0
+
+        v = self.values
+        row = ((1 - tr) * (1 - tc) * v[r0, c0] + (1 - tr) * tc * v[r0, c1]
+               + tr * (1 - tc) * v[r1, c0] + tr * tc * v[r1, c1])
+        return _to_measurements(row)
+
+
+def _to_measurements(row):
+    """(pm25, pm10, no2) row -> measurements dict like fetch_air_quality, None if NaN"""
+    if np.isnan(row).any():
+        return None
+    return {name: round(float(val), 1) for name, val in zip(POLLUTANTS, row)}
+
+
+class AirQualitySnapshot:
+    """
+    One immutable version of the station data: the DataFrame for the map
+    layers plus the interpolation grid built from it. Readers hold a
+    reference to a snapshot, refreshes publish a new one via swap_snapshot.
+    """
+
+    def __init__(self, df, version=None, path=None):
+        self.df = df
+        self.version = version
+        self.path = path
+        self.grid = AirQualityGrid.from_dataframe(df)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def latest_snapshot_path():
+    """Newest versioned file written by the refresher, else the shipped CSV"""
+    try:
+        versions = sorted(f for f in os.listdir(AQ_SNAPSHOT_DIR) if f.endswith(".csv"))
+    except FileNotFoundError:
+        versions = []
+    if versions:
+        return os.path.join(AQ_SNAPSHOT_DIR, versions[-1])
+    return AQ_GRID_CSV
+
+
+def get_snapshot():
+    """Current station snapshot, loaded once per process (None if no CSV exists)"""
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                path = latest_snapshot_path()
+                try:
+                    df = pd.read_csv(path)
+                except FileNotFoundError:
+                    return None
+                _snapshot = AirQualitySnapshot(df, version=os.path.basename(path), path=path)
+    return _snapshot
+
+
+def swap_snapshot(snapshot):
+    """Publishes a fully built snapshot; a single reference assignment, so readers never block"""
+    global _snapshot
+    _snapshot = snapshot
+
+
+def get_grid():
+    """The current station grid (None if no CSV exists)"""
+    snapshot = get_snapshot()
+    return snapshot.grid if snapshot is not None else None
+
+
+aq_chain = build_chain([name.strip() for name in AQ_PROVIDERS.split(",") if name.strip()], get_grid)
+# Latenz, Fehler und Circuit-Breaker-Zustand pro Provider als citytour_aq_provider_<stat>
+metrics.register("aq_provider", aq_chain.stats)
+
+
+def get_air_quality(lat, lon):
+    """Air quality for one point from the provider chain (cache, AQ_PROVIDERS in order, fallback)"""
+    return aq_chain.get(lat, lon)
+
+
+def get_air_quality_many(coords):
+    """Batch version of get_air_quality, returns a list of dicts in the order of coords"""
+    return aq_chain.get_many(coords)
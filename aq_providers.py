@@ -0,0 +1,431 @@
+"""
+Air quality from a chain of providers, tried in order until every point has a value:
+
+    open_meteo   Open-Meteo API (fetch_air_quality.py)
+    waqi         nearest WAQI station (only with CITYTOUR_WAQI_TOKEN)
+    grid         interpolated station grid (aq_grid.py)
+    fallback     plausible random values, always answers
+
+CITYTOUR_AQ_PROVIDERS="grid,open_meteo,fallback" changes the order; the
+default follows CITYTOUR_AQ_SOURCE (see aq_grid.py).
+
+So that a degraded API cannot stall the map:
+- budget: all AQ lookups of one render share AQ_BUDGET seconds
+  (aq_budget(), also usable as a decorator); remote providers only get
+  what is left of it, once it is used up the local providers answer
+- hedging: a remote request that takes longer than the provider's recent
+  p95 (HEDGE_AFTER until there are enough samples) is sent a second time,
+  the first answer wins
+- circuit breaker: BREAKER_FAILURES failures in a row (errors, or timeouts
+  with at least the provider's hedge window to answer) skip the provider
+  for BREAKER_COOLDOWN seconds, then a single trial call decides whether
+  it is used again
+
+Remote answers go into aq_cache (late ones too), concurrent lookups of the
+same cells share one resolution (singleflight.py) for as long as the
+waiter's own budget lasts. ProviderChain.stats()
+has calls, errors, timeouts, hedges, breaker state and latency
+percentiles per provider, exported as citytour_aq_provider_<stat>.
+"""
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from aq_cache import aq_cache
+from fetch_air_quality import (
+    WAQI_TOKEN, _generate_fallback_data, fetch_air_quality_many, fetch_air_quality_waqi,
+)
+from metrics import metrics
+from singleflight import group
+
+# Sekunden, die alle AQ-Abfragen eines Renders zusammen warten duerfen
+AQ_BUDGET = float(os.environ.get("CITYTOUR_AQ_BUDGET", 2.0))
+# Obergrenze pro Request, auch wenn das Budget mehr hergibt
+REMOTE_TIMEOUT = 10
+HEDGE_AFTER = float(os.environ.get("CITYTOUR_AQ_HEDGE_AFTER", 0.5))
+MIN_HEDGE_AFTER = 0.05
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = float(os.environ.get("CITYTOUR_AQ_BREAKER_COOLDOWN", 30))
+MAX_WORKERS = 16
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failures failures in a row it opens and
+    allow() is False for cooldown seconds; then one caller gets a trial
+    call (half open), its success closes the breaker, its failure reopens it.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened = 0
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._consecutive = 0
+            self._trial_running = False
+
+    def release(self):
+        """Call ended without a verdict on the provider (e.g. no time for it): frees the trial slot"""
+        with self._lock:
+            self._trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self._consecutive >= self.failures:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+
+class LatencyBudget:
+    """Seconds of AQ waiting left for one render"""
+
+    def __init__(self, seconds=AQ_BUDGET):
+        self.seconds = seconds
+        self.spent = 0.0
+
+    def remaining(self):
+        return max(self.seconds - self.spent, 0.0)
+
+    def charge(self, seconds):
+        self.spent += seconds
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def aq_budget(seconds=AQ_BUDGET):
+    """
+    One LatencyBudget for all AQ lookups of this thread inside the block
+    (a render, a service request). Nested blocks share the outer budget.
+    """
+    if getattr(_local, "budget", None) is not None:
+        yield _local.budget
+        return
+    _local.budget = LatencyBudget(seconds)
+    try:
+        yield _local.budget
+    finally:
+        _local.budget = None
+
+
+def current_budget():
+    """The budget of the surrounding aq_budget() block, else a fresh one for this lookup"""
+    budget = getattr(_local, "budget", None)
+    return budget if budget is not None else LatencyBudget()
+
+
+class Provider:
+    """
+    One source of measurements.
+    fetch_many(coords, timeout) returns a list aligned with coords (None =
+    no value for that point) and raises on failure. remote providers run
+    in the chain's pool with deadline, hedging and caching; local ones are
+    called directly.
+    """
+    name = "provider"
+    remote = False
+    available = True
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.no_data = 0
+        self.skipped = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def fetch_many(self, coords, timeout):
+        raise NotImplementedError
+
+    def timed_fetch(self, coords, timeout):
+        """fetch_many, recording latency and errors"""
+        t0 = time.perf_counter()
+        try:
+            results = self.fetch_many(coords, timeout)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        with self._lock:
+            self._latencies.append(time.perf_counter() - t0)
+            if any(res is None for res in results):
+                self.no_data += 1
+        return results
+
+    def hedge_after(self):
+        """Seconds before a second request is sent: p95 of recent latencies"""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return HEDGE_AFTER
+            return max(float(np.percentile(self._latencies, 95)), MIN_HEDGE_AFTER)
+
+    def count(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def stats(self):
+        """
+        calls / skipped (breaker open, budget used up) by the chain, errors of
+        single requests (hedges included), timeouts = lookups that gave up
+        waiting, latency percentiles of the last LATENCY_WINDOW answers
+        """
+        with self._lock:
+            latencies = np.asarray(self._latencies) * 1000
+            stats = {
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "no_data": self.no_data,
+                "skipped": self.skipped,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "breaker_open": int(self.breaker.state != CLOSED),
+                "breaker_opened": self.breaker.opened,
+                "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+                "max_ms": float(latencies.max()) if len(latencies) else 0.0,
+            }
+        stats["state"] = self.breaker.state
+        return stats
+
+
+class OpenMeteoProvider(Provider):
+    name = "open_meteo"
+    remote = True
+
+    def fetch_many(self, coords, timeout):
+        return fetch_air_quality_many(coords, timeout)
+
+
+class WaqiProvider(Provider):
+    """One request per point, so only worth it for few points (geofence enters)"""
+    name = "waqi"
+    remote = True
+
+    def __init__(self, token=WAQI_TOKEN):
+        super().__init__()
+        self.token = token
+        self.available = bool(token)
+
+    def fetch_many(self, coords, timeout):
+        deadline = time.monotonic() + timeout
+        results = []
+        for lat, lon in coords:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"WAQI deadline passed after {len(results)} of {len(coords)} points")
+            results.append(fetch_air_quality_waqi(lat, lon, remaining, self.token))
+        return results
+
+
+class GridProvider(Provider):
+    """Station grid of the current snapshot; None outside the grid"""
+    name = "grid"
+
+    def __init__(self, get_grid):
+        super().__init__()
+        self.get_grid = get_grid
+
+    def fetch_many(self, coords, timeout):
+        grid = self.get_grid()
+        if grid is None:
+            return [None] * len(coords)
+        return [grid.query(lat, lon) for lat, lon in coords]
+
+
+class FallbackProvider(Provider):
+    name = "fallback"
+
+    def fetch_many(self, coords, timeout):
+        return [_generate_fallback_data(lat, lon) for lat, lon in coords]
+
+
+class ProviderChain:
+    """get / get_many: cached values, else the providers in order (see module docstring)"""
+
+    def __init__(self, providers, cache=aq_cache, workers=MAX_WORKERS):
+        self.providers = list(providers)
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aq-provider")
+        self._flight = group("air_quality")
+
+    def get(self, lat, lon):
+        return self.get_many([(lat, lon)])[0]
+
+    def get_many(self, coords):
+        """Measurements for every (lat, lon), a list in the order of coords"""
+        coords = list(coords)
+        results = [self.cache.get(lat, lon) for lat, lon in coords]
+        missing = [i for i, res in enumerate(results) if res is None]
+        if not missing:
+            return results
+
+        budget = current_budget()
+        started = time.monotonic()
+        key = tuple(self.cache.cell(*coords[i]) for i in missing)
+        subset = [coords[i] for i in missing]
+        try:
+            # wer auf eine laufende Abfrage wartet, wartet nur so lange wie sein eigenes Budget reicht
+            fetched = self._flight.do_timeout(key, budget.remaining(), self._resolve, subset,
+                                              started + budget.remaining())
+        except TimeoutError:
+            fetched = self._resolve(subset, time.monotonic())  # nur noch die lokalen Provider
+        finally:
+            budget.charge(time.monotonic() - started)
+        for i, measurements in zip(missing, fetched):
+            results[i] = measurements
+        return results
+
+    def _resolve(self, coords, deadline):
+        results = [None] * len(coords)
+        pending = list(range(len(coords)))
+        for provider in self.providers:
+            if not pending:
+                break
+            if not provider.available:
+                continue
+            remaining = deadline - time.monotonic()
+            if provider.remote and remaining <= 0:
+                metrics.inc("aq.budget_exhausted")
+                provider.count("skipped")
+                continue
+            if not provider.breaker.allow():
+                provider.count("skipped")
+                continue
+
+            provider.count("calls")
+            subset = [coords[i] for i in pending]
+            try:
+                if provider.remote:
+                    answers = self._call_remote(provider, subset, min(remaining, REMOTE_TIMEOUT))
+                else:
+                    answers = provider.timed_fetch(subset, REMOTE_TIMEOUT)
+            except TimeoutError:
+                provider.count("timeouts")
+                timeout = min(remaining, REMOTE_TIMEOUT) if provider.remote else REMOTE_TIMEOUT
+                if timeout >= min(provider.hedge_after(), REMOTE_TIMEOUT):
+                    provider.breaker.failure()
+                else:
+                    # fast aufgebrauchtes Budget sagt nichts ueber den Provider
+                    metrics.inc("aq.budget_exhausted")
+                    provider.breaker.release()
+                print(f"AQ provider {provider.name} missed the deadline ({timeout:.2f} s) for {len(subset)} points")
+                continue
+            except Exception as e:
+                provider.breaker.failure()
+                print(f"AQ provider {provider.name} failed for {len(subset)} points: {e}")
+                continue
+
+            provider.breaker.success()
+            still_pending = []
+            for i, measurements in zip(pending, answers):
+                if measurements is None:
+                    still_pending.append(i)
+                else:
+                    results[i] = measurements
+            pending = still_pending
+        for i in pending:
+            # nur moeglich ohne FallbackProvider in der Kette
+            results[i] = _generate_fallback_data(*coords[i])
+        return results
+
+    def _call_remote(self, provider, coords, timeout):
+        """
+        Runs provider.fetch_many in the pool; sends a hedged second request
+        after provider.hedge_after() and returns the first answer.
+        Raises TimeoutError if none arrives within timeout.
+        """
+        deadline = time.monotonic() + timeout
+        first = self._pool.submit(self._fetch_and_cache, provider, coords, timeout)
+        futures = [first]
+        done, _ = wait(futures, timeout=min(provider.hedge_after(), timeout))
+        remaining = deadline - time.monotonic()
+        if not done and remaining > 0:
+            provider.count("hedges")
+            futures.append(self._pool.submit(self._fetch_and_cache, provider, coords, remaining))
+
+        errors = []
+        while futures:
+            remaining = deadline - time.monotonic()
+            done, _ = wait(futures, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    if future is not first:
+                        provider.count("hedge_wins")
+                    return future.result()
+                errors.append(future.exception())
+        if errors and not futures:
+            raise errors[0]
+        raise TimeoutError(f"{provider.name}: no answer within {timeout:.2f} s")
+
+    def _fetch_and_cache(self, provider, coords, timeout):
+        # auch verspaetete Antworten fuellen den Cache fuer die naechsten Abfragen
+        results = provider.timed_fetch(coords, timeout)
+        for (lat, lon), measurements in zip(coords, results):
+            if measurements is not None:
+                self.cache.set(lat, lon, measurements)
+        return results
+
+    def stats(self):
+        return {provider.name: provider.stats() for provider in self.providers if provider.available}
+
+
+PROVIDERS = {
+    "open_meteo": OpenMeteoProvider,
+    "waqi": WaqiProvider,
+    "grid": GridProvider,
+    "fallback": FallbackProvider,
+}
+
+
+def build_chain(names, get_grid, cache=aq_cache):
+    """ProviderChain of the providers called names (PROVIDERS keys), in that order"""
+    providers = []
+    for name in names:
+        if name not in PROVIDERS:
+            raise ValueError(f"unknown AQ provider {name!r}, expected one of {', '.join(PROVIDERS)}")
+        providers.append(GridProvider(get_grid) if name == "grid" else PROVIDERS[name]())
+    return ProviderChain(providers, cache)
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+import requests
+
+from aq_cache import aq_cache
+from aq_grid import AQ_SNAPSHOT_DIR, AirQualitySnapshot, get_snapshot, swap_snapshot
+from fetch_air_quality import AQ_API_URL, AQ_CURRENT_FIELDS, _parse_current
+from metrics import metrics
+from pm25_to_score import pm25_to_score, quality_category
+
+# Sekunden zwischen zwei Refreshes, 0 = aus (Open-Meteo aktualisiert stuendlich)
+REFRESH_INTERVAL = float(os.environ.get("CITYTOUR_AQ_REFRESH_INTERVAL", 3600))
+# Koordinaten pro Sammelabfrage
+BATCH_SIZE = 100
+# so viele versionierte Dateien bleiben liegen
+KEEP_VERSIONS = 5
+
+
+def fetch_grid_measurements(lats, lons, timeout=30):
+    """
+    Bulk-fetches current values for all grid cells, BATCH_SIZE coordinates per request.
+    Returns a list aligned with lats/lons; cells without usable data are None
+    (no random fallback here, those cells simply keep their old values).
+    """
+    results = []
+    for start in range(0, len(lats), BATCH_SIZE):
+        batch_lats = lats[start:start + BATCH_SIZE]
+        batch_lons = lons[start:start + BATCH_SIZE]
+        params = {
+            "latitude": ",".join(str(lat) for lat in batch_lats),
+            "longitude": ",".join(str(lon) for lon in batch_lons),
+            "current": AQ_CURRENT_FIELDS,
+            "timezone": "Europe/Berlin"
+        }
+        with metrics.span("external.open_meteo_grid"):
+            resp = requests.get(AQ_API_URL, params=params, timeout=timeout)
+            resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, dict):
+            data = [data]
+        if len(data) != len(batch_lats):
+            raise ValueError(f"expected {len(batch_lats)} locations, got {len(data)}")
+        results.extend(_parse_current(item, lat, lon) for item, lat, lon in zip(data, batch_lats, batch_lons))
+    return results
+
+
+def refresh_snapshot(snapshot, fetch=fetch_grid_measurements):
+    """
+    Builds the next snapshot from snapshot: new pm25/pm10/no2 per cell,
+    recomputed air_quality_score and quality_category.
+    Returns None if nothing could be fetched.
+    """
+    df = snapshot.df.copy()
+    measurements = fetch(df['lat'].tolist(), df['lon'].tolist())
+    if not any(measurements):
+        return None
+
+    for idx, values in zip(df.index, measurements):
+        if values is None:
+            continue
+        df.at[idx, 'pm25'] = values['pm25']
+        df.at[idx, 'pm10'] = values['pm10']
+        df.at[idx, 'no2'] = values['no2']
+        aq_cache.set(df.at[idx, 'lat'], df.at[idx, 'lon'], values)
+
+    df['air_quality_score'] = df['pm25'].apply(pm25_to_score)
+    df['quality_category'] = df['pm25'].apply(quality_category)
+
+    version = time.strftime("%Y%m%d-%H%M%S")
+    path = write_version(df, version)
+    return AirQualitySnapshot(df, version=version, path=path)
+
+
+def write_version(df, version):
+    """
+    Writes air_quality_stations-<version>.csv into AQ_SNAPSHOT_DIR.
+    The file is written under a temporary name and renamed, so a restart
+    never picks up a half-written version. Old versions are pruned.
+    """
+    os.makedirs(AQ_SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(AQ_SNAPSHOT_DIR, f"air_quality_stations-{version}.csv")
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+    versions = sorted(f for f in os.listdir(AQ_SNAPSHOT_DIR) if f.endswith(".csv"))
+    for old in versions[:-KEEP_VERSIONS]:
+        os.remove(os.path.join(AQ_SNAPSHOT_DIR, old))
+    return path
+
+
+class AirQualityRefresher:
+    """
+    Daemon thread that refreshes the station grid every interval seconds
+    and swaps the new snapshot in. Readers keep using the old snapshot
+    until the new one is complete.
+    """
+
+    def __init__(self, interval=REFRESH_INTERVAL, fetch=fetch_grid_measurements):
+        self.interval = interval
+        self.fetch = fetch
+        self.refreshes = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="aq-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh_now(self):
+        """One refresh cycle, returns True if a new snapshot was published"""
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return False
+        try:
+            new_snapshot = refresh_snapshot(snapshot, fetch=self.fetch)
+        except Exception as e:
+            print(f"AQ grid refresh failed: {e}")
+            self.failures += 1
+            return False
+        if new_snapshot is None:
+            print("AQ grid refresh returned no data, keeping current snapshot")
+            self.failures += 1
+            return False
+
+        swap_snapshot(new_snapshot)
+        self.refreshes += 1
+        print(f"✓ AQ grid refreshed, version {new_snapshot.version}")
+        return True
+
+    def _run(self):
+        self.refresh_now()
+        while not self._stop.wait(self.interval):
+            self.refresh_now()
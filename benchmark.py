@@ -0,0 +1,324 @@
+"""
+Benchmarks of the hot paths on synthetic datasets.
+
+    python benchmark.py                                  # all cases, 100 .. 1M places
+    python benchmark.py --sizes 100,10000 --only optimize,proximity
+    python benchmark.py --baseline bench_results/<older run>.json --threshold 0.2
+
+Places are drawn uniformly inside the osm_to_csv bbox. Every case reports
+latency percentiles (ms) and the peak Python heap of one extra run traced
+with tracemalloc; optimize also reports the tour length (tour_km).
+Results go to bench_results/bench-<time>.json; with --baseline, cases
+whose p50 or peak memory grew by more than --threshold (tour_km by more
+than TOUR_THRESHOLD) are listed and the exit code is 1, so a CI job can
+gate on it.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from landmarks import Landmark, LandmarkSet
+from layer_cache import layer_json
+from osm_to_csv import MUNICH_BBOX
+from poi_store import write_poi_store
+from spatial_index import SpatialIndex
+
+from citytour.dataset import Dataset
+from citytour.enrich import apply_air_quality, enrich_place
+from citytour.layers import build_discovered_layers, build_route_layers
+from citytour.tour import plan_route
+
+RESULTS_DIR = "bench_results"
+DEFAULT_SIZES = (100, 1000, 10000, 100000, 1000000)
+CATEGORIES = ("Nature", "Historical", "Art", "Food", "Culture")
+# pro Fall mindestens so viele Laeufe, danach Schluss sobald das Zeitbudget verbraucht ist
+MIN_RUNS = 3
+MAX_RUNS = 20
+TIME_BUDGET = 2.0
+PROXIMITY_QUERIES = 500
+# Faelle mit quadratischem Aufwand / einem Dict pro Ort nur bis zu dieser Groesse
+MAX_SIZE = {
+    "optimize": 2000,
+    "enrich_loop": 10000,
+    "landmarks": 100000,
+    "layers": 100000,
+}
+DEFAULT_THRESHOLD = 0.2
+# Tourlaenge ist ohne Zeitbudget deterministisch, schon kleine Verschlechterungen zaehlen
+TOUR_THRESHOLD = 0.01
+# kleinere Unterschiede (ms) sind Messrauschen, auch wenn sie relativ gross sind
+MIN_DELTA_MS = 1.0
+
+
+def synthetic_places(n, seed=0, bbox=MUNICH_BBOX):
+    """n places uniformly inside bbox (south, west, north, east), same columns as the places CSV plus scores"""
+    rng = np.random.default_rng(seed)
+    south, west, north, east = bbox
+    return pd.DataFrame({
+        "name": [f"Place {i}" for i in range(n)],
+        "lat": rng.uniform(south, north, n),
+        "lon": rng.uniform(west, east, n),
+        "category": pd.Categorical.from_codes(rng.integers(0, len(CATEGORIES), n), categories=CATEGORIES),
+        "desc": [f"Synthetic place number {i}." for i in range(n)],
+        "noise_level": rng.integers(0, 101, n),
+        "shade_score": rng.integers(0, 101, n),
+        "barrier_free_score": rng.integers(0, 101, n),
+        "poi_id": np.arange(n),
+    })
+
+
+def random_points(n, seed=1, bbox=MUNICH_BBOX):
+    rng = np.random.default_rng(seed)
+    south, west, north, east = bbox
+    return rng.uniform(south, north, n), rng.uniform(west, east, n)
+
+
+def mock_air_quality(lat, lon):
+    """Deterministic stand-in for fetch_air_quality, no network"""
+    pm25 = round(5 + (lat * 1000 + lon * 1000) % 40, 1)
+    return {"pm25": pm25, "pm10": round(pm25 * 1.6, 1), "no2": round(pm25 * 1.2, 1)}
+
+
+def mock_air_quality_many(coords):
+    return [mock_air_quality(lat, lon) for lat, lon in coords]
+
+
+def percentiles(times_ms):
+    t = np.asarray(times_ms)
+    return {
+        "runs": len(t),
+        "mean_ms": float(t.mean()),
+        "p50_ms": float(np.percentile(t, 50)),
+        "p90_ms": float(np.percentile(t, 90)),
+        "p99_ms": float(np.percentile(t, 99)),
+        "max_ms": float(t.max()),
+    }
+
+
+def measure(run, runs=None):
+    """
+    Times run(i) MIN_RUNS..MAX_RUNS times within TIME_BUDGET (or exactly runs times),
+    then traces one more call for the peak heap.
+    """
+    times = []
+    started = time.perf_counter()
+    i = 0
+    while True:
+        t0 = time.perf_counter()
+        run(i)
+        times.append((time.perf_counter() - t0) * 1000)
+        i += 1
+        if runs is not None:
+            if i >= runs:
+                break
+        elif i >= MAX_RUNS or (i >= MIN_RUNS and time.perf_counter() - started > TIME_BUDGET):
+            break
+
+    tracemalloc.start()
+    try:
+        run(i)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result = percentiles(times)
+    result["peak_mb"] = peak / 2 ** 20
+    return result
+
+
+# --- cases: setup(places, workdir) returns run(i) ---
+
+def case_optimize(places, workdir):
+    """
+    Tour planning: distance matrix, nearest neighbour, 2-opt / Or-opt until no
+    move helps. Without the app's time budget the latency is the optimizer's
+    work, not the budget; run.extra["tour_km"] tracks the result quality.
+    """
+    def run(i):
+        return plan_route(places, time_budget=None)
+    run.extra = {"tour_km": run(0).length()}
+    return run
+
+
+def case_proximity(places, workdir):
+    """One 250 m radius query against the spatial index (index built once, like get_place_index)"""
+    index = SpatialIndex(places["lat"].to_numpy(), places["lon"].to_numpy())
+    lats, lons = random_points(PROXIMITY_QUERIES)
+    return lambda i: index.query_radius(lats[i % len(lats)], lons[i % len(lons)], 0.25)
+
+
+def case_index_build(places, workdir):
+    return lambda i: SpatialIndex(places["lat"].to_numpy(), places["lon"].to_numpy())
+
+
+def case_landmarks(places, workdir):
+    """Distance scaling of every landmark against the user position (LandmarkSet.to_layer_data)"""
+    landmarks = LandmarkSet(Landmark(name, lat, lon, "") for name, lat, lon in
+                            zip(places["name"], places["lat"].tolist(), places["lon"].tolist()))
+    lats, lons = random_points(MAX_RUNS + 1)
+    return lambda i: landmarks.to_layer_data(lats[i], lons[i])
+
+
+def case_enrich_loop(places, workdir):
+    """enrich_place per place (the geofence enter path) with a mocked AQ fetcher"""
+    return lambda i: [enrich_place(row, get_aq=mock_air_quality) for _, row in places.iterrows()]
+
+
+def case_enrich_batch(places, workdir):
+    """AQ columns for a whole stop table at once (the guided route path) with a mocked batch fetcher"""
+    coords = list(zip(places["lat"].tolist(), places["lon"].tolist()))
+    return lambda i: apply_air_quality(places.copy(), mock_air_quality_many(coords))
+
+
+def case_layers(places, workdir):
+    """Route and discovered layers built and serialized, i.e. a layer cache miss"""
+    stops = places.copy()
+    apply_air_quality(stops, mock_air_quality_many(zip(stops["lat"], stops["lon"])))
+    path = [[lon, lat] for lat, lon in zip(stops["lat"].tolist(), stops["lon"].tolist())]
+
+    def run(i):
+        return [layer_json(layer) for layer in build_route_layers(stops, path) + build_discovered_layers(stops)]
+    return run
+
+
+def case_load_csv(places, workdir):
+    csv_path = os.path.join(workdir, "places.csv")
+    places.drop(columns=["poi_id"]).to_csv(csv_path, index=False)
+    missing_store = os.path.join(workdir, "no-store")
+    return lambda i: Dataset.load(store_dir=missing_store, csv_path=csv_path)
+
+
+def case_load_store(places, workdir):
+    """Opening the memory-mapped POI store and wrapping it in a DataFrame"""
+    store_dir = os.path.join(workdir, "store")
+    write_poi_store(places.drop(columns=["poi_id"]), store_dir)
+    return lambda i: Dataset.load(store_dir=store_dir)
+
+
+CASES = {
+    "optimize": case_optimize,
+    "proximity": case_proximity,
+    "index_build": case_index_build,
+    "landmarks": case_landmarks,
+    "enrich_loop": case_enrich_loop,
+    "enrich_batch": case_enrich_batch,
+    "layers": case_layers,
+    "load_csv": case_load_csv,
+    "load_store": case_load_store,
+}
+# Faelle, bei denen ein Lauf eine einzelne Abfrage ist: feste Anzahl statt Zeitbudget
+FIXED_RUNS = {"proximity": PROXIMITY_QUERIES}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, only=None):
+    """{"<case>/<size>": result} for all cases and sizes (cases above their MAX_SIZE are skipped)"""
+    results = {}
+    for n in sizes:
+        places = synthetic_places(n)
+        for name, setup in CASES.items():
+            if only and name not in only:
+                continue
+            if n > MAX_SIZE.get(name, n):
+                continue
+            with tempfile.TemporaryDirectory() as workdir:
+                run = setup(places, workdir)
+                result = measure(run, FIXED_RUNS.get(name))
+            result.update(getattr(run, "extra", {}))
+            key = f"{name}/{n}"
+            results[key] = result
+            extra = "".join(f"  {metric} {value:.3f}" for metric, value in getattr(run, "extra", {}).items())
+            print(f"{key:24s} p50 {result['p50_ms']:10.3f} ms  p99 {result['p99_ms']:10.3f} ms  "
+                  f"peak {result['peak_mb']:8.1f} MB  ({result['runs']} runs){extra}")
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(results, path=None):
+    """Writes {"environment", "results"} as JSON (temp file + rename), returns the path"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Regressions against a baseline run: [(case, metric, old, new), ...] for
+    every case in both runs whose p50 or peak memory grew by more than
+    threshold, or whose tour_km grew by more than TOUR_THRESHOLD.
+    """
+    regressions = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if new["p50_ms"] > old["p50_ms"] * (1 + threshold) and new["p50_ms"] - old["p50_ms"] > MIN_DELTA_MS:
+            regressions.append((key, "p50_ms", old["p50_ms"], new["p50_ms"]))
+        if new["peak_mb"] > old["peak_mb"] * (1 + threshold) and new["peak_mb"] - old["peak_mb"] > 1:
+            regressions.append((key, "peak_mb", old["peak_mb"], new["peak_mb"]))
+        if "tour_km" in new and "tour_km" in old and new["tour_km"] > old["tour_km"] * (1 + TOUR_THRESHOLD):
+            regressions.append((key, "tour_km", old["tour_km"], new["tour_km"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic city datasets")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="comma-separated numbers of places")
+    parser.add_argument("--only", default="", help="comma-separated cases: " + ", ".join(CASES))
+    parser.add_argument("--output", help="result file (default: bench_results/bench-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown counted as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    only = {name for name in args.only.split(",") if name}
+    unknown = only - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks([int(n) for n in args.sizes.split(",")], only)
+    print(f"Results written to {save_results(results, args.output)}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for key, metric, old, new in regressions:
+            print(f"REGRESSION {key} {metric}: {old:.3f} -> {new:.3f} ({(new / old - 1) * 100:+.0f}%)")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
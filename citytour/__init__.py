@@ -0,0 +1,29 @@
+"""
+Headless core of CityTour Munich: load and filter the places, optimize the
+guided tour, enrich places with air quality, build the map layers.
+
+Nothing here imports streamlit or does work on import beyond what the
+underlying modules do; app.py and citytour.service are front ends over it.
+"""
+from citytour.caches import Caches, default_caches
+from citytour.dataset import LANDMARK_IMAGES, Dataset, current_version, landmark_image, load_dataset
+from citytour.enrich import air_quality_fields, apply_air_quality, enrich_place, find_nearby
+from citytour.layers import (
+    aq_layers, build_aq_layers, build_avatar_layers, build_deck, build_discovered_layers,
+    build_landmark_layers, build_route_layers, discovered_layers, get_color_for_pm25,
+    landmark_layers, route_layers, view_state,
+)
+from citytour.tour import (
+    MARIENPLATZ, plan_route, route_key, route_stops, session_route, start_position, use_walking_matrix,
+)
+
+__all__ = [
+    "Caches", "default_caches",
+    "LANDMARK_IMAGES", "Dataset", "current_version", "landmark_image", "load_dataset",
+    "air_quality_fields", "apply_air_quality", "enrich_place", "find_nearby",
+    "aq_layers", "build_aq_layers", "build_avatar_layers", "build_deck", "build_discovered_layers",
+    "build_landmark_layers", "build_route_layers", "discovered_layers", "get_color_for_pm25",
+    "landmark_layers", "route_layers", "view_state",
+    "MARIENPLATZ", "plan_route", "route_key", "route_stops", "session_route", "start_position",
+    "use_walking_matrix",
+]
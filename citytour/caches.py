@@ -0,0 +1,54 @@
+"""
+The process-wide caches the core works with, in one object.
+
+Front ends (Streamlit, the JSON service, benchmarks) pass a Caches around
+instead of reaching for the module singletons, so a worker or a test can
+run against its own instances.
+"""
+import io
+
+from aq_cache import aq_cache
+from layer_cache import layer_cache
+from metrics import metrics
+from route_cache import route_cache, route_legs_with_sources
+from tts_cache import DEFAULT_LANG, audio_cache
+
+
+class Caches:
+    """
+    - layers: serialized map layers (LayerCache)
+    - routes: walking legs (RouteCache)
+    - audio: spoken descriptions (AudioCache)
+    - air_quality: AQ measurements per grid cell (AirQualityCache, used by the AQ provider chain)
+    """
+
+    def __init__(self, layers=layer_cache, routes=route_cache, audio=audio_cache, air_quality=aq_cache):
+        self.layers = layers
+        self.routes = routes
+        self.audio = audio
+        self.air_quality = air_quality
+
+    def route_legs(self, locations):
+        """get_legs for RouteSession.path, backed by this route cache: (legs, sources)"""
+        return route_legs_with_sources(locations, self.routes)
+
+    def speech(self, text, lang=DEFAULT_LANG):
+        """MP3 of text as a file object, None if synthesis fails"""
+        # usually pre-rendered by the background workers, see tts_cache.py
+        audio = self.audio.get_or_create(text, lang)
+        if audio is None:
+            return None
+        return io.BytesIO(audio)
+
+    def stats(self):
+        return {
+            "layers": self.layers.stats(),
+            "routes": self.routes.stats(),
+            "audio": self.audio.stats(),
+            "air_quality": self.air_quality.stats(),
+        }
+
+
+default_caches = Caches()
+# Trefferquoten aller Caches als Gauges citytour_cache_<metric>{cache="..."}
+metrics.register("cache", default_caches.stats)
@@ -0,0 +1,133 @@
+"""
+The places a tour is built from.
+
+A Dataset is one version of the POIs: the memory-mapped POI store if it was
+written (see poi_store.py), else places-in-munich.csv. Filtering by category
+and the spatial index per filter are derived from it and kept on the object.
+"""
+import os
+import threading
+
+import pandas as pd
+
+from poi_store import PLACES_CSV, POI_STORE_DIR, PoiStore
+from spatial_index import SpatialIndex
+
+NO_DESCRIPTION = "No description available"
+
+# === IMAGE MAPPING - INSERT YOUR IMAGE URLS HERE ===
+LANDMARK_IMAGES = {
+    "Eisbachwelle": "https://a.travel-assets.com/findyours-php/viewfinder/images/res40/195000/195001.jpg",
+    "Monopteros": "https://www.muenchen.de/sites/default/files/styles/3_2_w1216/public/2022-06/210108_monopteros-herbst_Mde-MichaelHofmann.jpg.webp",
+    "Friedensengel": "https://de.wikipedia.org/wiki/Datei:M%C3%BCnchen_-_Friedensengel_mit_Font%C3%A4ne_(tone-mapping).jpg",
+    "Chinesischer Turm": "https://www.muenchen.de/sites/default/files/styles/3_2_w1216/public/2022-06/20201204-kocherlball-4-3.jpg.webp",
+    "Viktualienmarkt": "https://www.travelguide.de/media/1200x800/muenchen-viktualienmarkt-1200x800.avif",
+}
+
+
+def landmark_image(name):
+    """Image URL of a place, None if there is none"""
+    image = LANDMARK_IMAGES.get(name)
+    return image if image != "YOUR_IMAGE_URL_HERE" else None
+
+
+def read_places_csv(path=PLACES_CSV):
+    """Places CSV with a poi_id column (row position), empty DataFrame if the file is missing"""
+    try:
+        df = pd.read_csv(path)
+    except FileNotFoundError:
+        return pd.DataFrame()
+    df['poi_id'] = range(len(df))
+    return df
+
+
+class Dataset:
+    """
+    One version of the places, shared read-only by all sessions and workers.
+    - places: DataFrame with poi_id, name, category, lat, lon, scores (desc only for CSV data)
+    - version: POI store version or CSV mtime; part of every cache key built from the places
+    - store: the PoiStore, or None for CSV data
+    """
+
+    def __init__(self, places, version=0, store=None):
+        self.places = places
+        self.version = version
+        self.store = store
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, store_dir=POI_STORE_DIR, csv_path=PLACES_CSV):
+        """The POI store if there is one, else the CSV"""
+        try:
+            store = PoiStore(store_dir)
+        except FileNotFoundError:
+            store = None
+        if store is not None:
+            # zero-copy, shared by all sessions
+            return cls(store.to_dataframe(), version=store.version, store=store)
+        try:
+            version = os.path.getmtime(csv_path)
+        except OSError:
+            version = 0
+        return cls(read_places_csv(csv_path), version=version)
+
+    def __len__(self):
+        return len(self.places)
+
+    @property
+    def empty(self):
+        return self.places.empty
+
+    def categories(self):
+        return list(self.places['category'].unique()) if not self.places.empty else []
+
+    def filter(self, categories):
+        """Places of the given categories, in dataset order"""
+        return self.places[self.places['category'].isin(list(categories))].copy()
+
+    def index(self, categories):
+        """Spatial index over filter(categories), built once per filter"""
+        key = tuple(sorted(categories))
+        with self._lock:
+            index = self._indexes.get(key)
+        if index is None:
+            places = self.places[self.places['category'].isin(key)]
+            index = SpatialIndex(places['lat'].to_numpy(), places['lon'].to_numpy())
+            with self._lock:
+                index = self._indexes.setdefault(key, index)
+        return index
+
+    def desc(self, place):
+        """Description of a place (row or dict), read lazily from the POI store"""
+        desc = place.get('desc')
+        if isinstance(desc, str):
+            return desc
+        if self.store is not None and 'poi_id' in place:
+            return self.store.desc(place['poi_id'])
+        return NO_DESCRIPTION
+
+    def descriptions(self):
+        """All descriptions, e.g. to pre-render their audio"""
+        if self.store is not None:
+            return self.store.text['desc'].to_list() if 'desc' in self.store.text else []
+        if 'desc' not in self.places:
+            return []
+        return self.places['desc'].dropna().tolist()
+
+
+def current_version(store_dir=POI_STORE_DIR, csv_path=PLACES_CSV):
+    """Version load_dataset() would load now; cheap enough to check on every rerun"""
+    try:
+        with open(os.path.join(store_dir, "CURRENT")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        return os.path.getmtime(csv_path)
+    except OSError:
+        return 0
+
+
+def load_dataset(store_dir=POI_STORE_DIR, csv_path=PLACES_CSV):
+    return Dataset.load(store_dir, csv_path)
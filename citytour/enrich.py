@@ -0,0 +1,62 @@
+"""
+Per-place extras: air quality and image.
+
+Cheap enough for a batch of route stops (apply_air_quality), but for the
+spontaneous mode only fetched when the user enters a place's geofence
+(find_nearby).
+"""
+from aq_grid import get_air_quality
+from geofence import ENTER
+from pm25_to_score import pm25_to_score
+
+from citytour.dataset import landmark_image
+
+# Score ohne Messwert: neutral
+DEFAULT_AIR_QUALITY = 50
+
+
+def air_quality_fields(aq_data):
+    """pm25 / pm10 / no2 / air_quality score of one AQ dict (None -> zeros and the neutral score)"""
+    if not aq_data:
+        return {'pm25': 0, 'pm10': 0, 'no2': 0, 'air_quality': DEFAULT_AIR_QUALITY}
+    pm25 = aq_data.get('pm25', 0)
+    return {
+        'pm25': pm25,
+        'pm10': aq_data.get('pm10', 0),
+        'no2': aq_data.get('no2', 0),
+        'air_quality': pm25_to_score(pm25),
+    }
+
+
+def apply_air_quality(df, aq_results):
+    """Adds the AQ columns to df in place, aq_results in row order"""
+    fields = [air_quality_fields(aq) for aq in aq_results]
+    for column in ('pm25', 'pm10', 'no2', 'air_quality'):
+        df[column] = [f[column] for f in fields]
+    return df
+
+
+def enrich_place(row, get_aq=get_air_quality):
+    """
+    Place as dict with its AQ values and image; expensive, fetched once
+    when the user enters the place's geofence.
+    """
+    # Create a copy of the row as a dict to avoid Series reference issues
+    place = row.to_dict() if hasattr(row, 'to_dict') else dict(row)
+    place.update(air_quality_fields(get_aq(place['lat'], place['lon'])))
+    place['image'] = landmark_image(place['name'])
+    return place
+
+
+def find_nearby(geofence, index, places, lat, lon, enrich=enrich_place):
+    """
+    Places whose geofence the user is in, closest first, as [(place, dist_km), ...],
+    plus the places entered with this update. index must be built over places.
+    """
+    in_range, events = geofence.update(
+        index, places['poi_id'].tolist(), lat, lon,
+        on_enter=lambda pos: enrich(places.iloc[pos])
+    )
+    payloads = {key: place for key, _, place in in_range}
+    entered = [payloads[key] for event, key in events if event == ENTER]
+    return [(place, dist_km) for _, dist_km, place in in_range], entered
@@ -0,0 +1,246 @@
+"""
+pydeck layers of the tour map.
+
+build_*_layers() create the pdk.Layers from plain data; the *_layers()
+helpers next to them go through a LayerCache with a key that captures
+everything the layers depend on. build_deck() wraps a layer list into the
+spec st.pydeck_chart (or any other deck.gl client) renders.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pydeck as pdk
+
+from layer_cache import DeckSpec, layer_cache
+
+# MAPBOX TOKEN
+MAPBOX_API_KEY = os.environ.get("CITYTOUR_MAPBOX_API_KEY", "")
+FALLBACK_MAP_STYLE = "https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json"
+
+# only the columns the layers and the tooltip use
+AQ_LAYER_COLUMNS = ['name', 'lat', 'lon', 'pm25', 'pm10', 'no2', 'quality_category']
+
+TOOLTIP = {
+    "html": """
+    <b>{name}</b><br/>
+    <b style='color: #00d4ff'>PM2.5:</b> {pm25} µg/m³<br/>
+    <b style='color: #00d4ff'>PM10:</b> {pm10} µg/m³<br/>
+    <b style='color: #00d4ff'>NO2:</b> {no2} µg/m³<br/>
+    <b style='color: #00ff88'>Quality:</b> {quality_category}
+    """,
+    "style": {
+        "backgroundColor": "rgba(0, 0, 0, 0.8)",
+        "color": "white",
+        "fontSize": "12px",
+        "padding": "10px",
+        "borderRadius": "5px"
+    }
+}
+
+
+# Color mapping for PM2.5 levels
+def get_color_for_pm25(pm25):
+    if pm25 < 12:
+        return [0, 220, 100, 80]  # Green - Good
+    elif pm25 < 35:
+        return [255, 220, 0, 80]  # Yellow - Moderate
+    elif pm25 < 55:
+        return [255, 140, 0, 80]  # Orange - Unhealthy for Sensitive
+    else:
+        return [255, 50, 50, 80]  # Red - Unhealthy
+
+
+def build_aq_layers(aq_data):
+    """Air quality grid layers"""
+    records = aq_data[[c for c in AQ_LAYER_COLUMNS if c in aq_data.columns]].to_dict(orient='records')
+    for record in records:
+        record['color'] = get_color_for_pm25(record['pm25'])
+
+    return [
+        # Create grid cells using ColumnLayer for fixed visible grid
+        pdk.Layer(
+            "ColumnLayer",
+            records,
+            get_position='[lon, lat]',
+            get_elevation='pm25 * 50',  # Height based on PM2.5
+            elevation_scale=1,
+            radius=400,  # Size of each grid cell
+            get_fill_color='color',
+            pickable=True,
+            auto_highlight=True,
+            extruded=True,
+            coverage=1,
+            opacity=0.01
+        ),
+        # Add grid borders/outlines for better visibility
+        pdk.Layer(
+            "ScatterplotLayer",
+            records,
+            get_position='[lon, lat]',
+            get_fill_color='[50, 50, 50, 0]',  # Transparent fill
+            get_line_color='[255, 255, 255, 180]',  # White border
+            get_radius=400,
+            line_width_min_pixels=2,
+            stroked=True,
+            filled=False,
+            pickable=True
+        ),
+        # Add text labels showing PM2.5 values on each grid cell
+        pdk.Layer(
+            "TextLayer",
+            records,
+            get_position='[lon, lat]',
+            get_text='pm25',
+            get_color=[255, 255, 255, 255],
+            get_size=14,
+            get_alignment_baseline="'center'",
+            get_pixel_offset=[0, 0],
+            billboard=True
+        ),
+    ]
+
+
+def build_route_layers(route_df, real_path):
+    """Path plus numbered stops of the guided route"""
+    route_df = route_df.drop(columns=['desc'], errors='ignore').copy()
+    route_df['idx'] = range(1, len(route_df) + 1)
+    records = route_df.to_dict(orient='records')
+    return [
+        # The Path
+        pdk.Layer(
+            "PathLayer",
+            data=[{"path": real_path}],
+            get_path="path",
+            get_color='[0, 150, 255, 200]',
+            width_scale=10,
+            width_min_pixels=3
+        ),
+        # Numbered Points
+        pdk.Layer(
+            "ScatterplotLayer",
+            records,
+            get_position='[lon, lat]',
+            get_color="[noise_level * 2.5, (100 - noise_level) * 2.5, 50, 200]",
+            get_line_color='[0, 150, 255]',
+            get_line_width=20,
+            get_radius=60,
+            pickable=True
+        ),
+        pdk.Layer(
+            "TextLayer",
+            records,
+            get_position='[lon, lat]',
+            get_text='idx',
+            get_color=[0, 0, 0],
+            get_size=18,
+            get_alignment_baseline="'center'"
+        ),
+    ]
+
+
+def build_landmark_layers(records):
+    """Landmarks, skaliert nach Entfernung (records from LandmarkSet.to_layer_data)"""
+    return [
+        pdk.Layer(
+            "ScatterplotLayer",
+            data=records,
+            get_position='[lon, lat]',
+            get_fill_color='color',
+            get_radius='radius',
+            opacity=0.6,
+            pickable=True
+        ),
+        pdk.Layer(
+            "TextLayer",
+            data=records,
+            get_position='[lon, lat]',
+            get_text='text',
+            get_size='icon_size',
+            size_scale=4,
+            character_set="auto",  # Emojis sind nicht im Standard-Zeichensatz
+        ),
+    ]
+
+
+def build_discovered_layers(discovered_df):
+    """Discovered points (Green)"""
+    return [pdk.Layer(
+        "ScatterplotLayer",
+        discovered_df.drop(columns=['desc'], errors='ignore').to_dict(orient='records'),
+        get_position='[lon, lat]',
+        get_color="[100, 200, 100, 220]",
+        get_radius=60,
+        pickable=True
+    )]
+
+
+def build_avatar_layers(lat, lon):
+    """User Avatar; changes every tick, so never cached"""
+    data = [{"lon": lon, "lat": lat, "noise_level": 50}]
+    return [
+        pdk.Layer(
+            "ScatterplotLayer",
+            data=data,
+            get_position='[lon, lat]',
+            get_color="[100, 150, 255, 220]",
+            get_radius=20,
+        ),
+        pdk.Layer(
+            "ScatterplotLayer",
+            data=data,
+            get_position='[lon, lat]',
+            get_color="[0, 150, 255, 220]",
+            get_radius=5,
+        ),
+    ]
+
+
+def aq_layers(snapshot, cache=layer_cache):
+    """AQ layers of a station snapshot, built once per snapshot ([] without data)"""
+    if snapshot is None or snapshot.df.empty:
+        return []
+    return cache.get(('aq', snapshot.version, snapshot.path), lambda: build_aq_layers(snapshot.df))
+
+
+def route_layers(dataset_version, stops, real_path, cache=layer_cache):
+    """Route layers, static until the stops, their AQ values or the path geometry change"""
+    pm25 = tuple(stops['pm25'].round(1)) if 'pm25' in stops else ()
+    # Geometrie hashen: neu geroutete Legs (OSRM statt Luftlinie) haben oft gleich viele Punkte
+    path_hash = hashlib.sha1(np.asarray(real_path, dtype=np.float64).tobytes()).hexdigest()
+    key = ('route', dataset_version, tuple(stops['poi_id']), pm25, path_hash)
+    return cache.get(key, lambda: build_route_layers(stops, real_path))
+
+
+def landmark_layers(position, records, cache=layer_cache):
+    """Landmark layers; position is where records were scaled for"""
+    return cache.get(('landmarks', position), lambda: build_landmark_layers(records))
+
+
+def discovered_layers(dataset_version, discovered_df, cache=layer_cache):
+    """Discovered places, rebuilt only when one is added ([] for none)"""
+    if discovered_df.empty:
+        return []
+    key = ('discovered', dataset_version, tuple(discovered_df['poi_id']))
+    return cache.get(key, lambda: build_discovered_layers(discovered_df))
+
+
+def view_state(lat=48.137, lon=11.575, zoom=13, pitch=45, bearing=0):
+    return pdk.ViewState(latitude=lat, longitude=lon, zoom=zoom, pitch=pitch, bearing=bearing)
+
+
+def build_deck(layers, initial_view_state=None, mapbox_api_key=MAPBOX_API_KEY):
+    """Map spec of cached JSON layers and live pdk.Layers (see layer_cache.DeckSpec)"""
+    if mapbox_api_key:
+        map_style = "mapbox://styles/mapbox/dark-v10"
+        api_keys = {"mapbox": mapbox_api_key}
+    else:
+        map_style = FALLBACK_MAP_STYLE
+        api_keys = None
+    return DeckSpec(
+        map_style=map_style,
+        initial_view_state=initial_view_state or view_state(),
+        layers=layers,
+        api_keys=api_keys,
+        tooltip=TOOLTIP,
+    )
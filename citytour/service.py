@@ -0,0 +1,287 @@
+"""
+Small local HTTP/JSON service over the core, for clients other than the
+Streamlit app (workers, load tests, a mobile front end).
+
+    python -m citytour.service --port 8700
+
+    GET  /health       dataset version and size
+    GET  /categories   categories of the dataset
+    GET  /stats        cache counters
+    GET  /metrics      spans and counters, Prometheus text (see metrics.py)
+    POST /route        {"categories": [...], "visited": [poi_id, ...], "skipped": [...]}
+    POST /nearby       {"categories": [...], "lat": .., "lon": ..}
+    POST /air-quality  {"coords": [[lat, lon], ...]}
+    POST /map          {"categories": [...], "lat": .., "lon": .., "route": true, "show_aq": true}
+
+Requests are served by a fixed pool of worker threads instead of one
+thread per connection, so a burst of clients queues up instead of
+starting hundreds of concurrent OSRM / Open-Meteo calls. Request fields
+are validated up front: malformed requests get 400 (BadRequest), any
+other exception is a bug and gets 500.
+"""
+import argparse
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from aq_grid import get_air_quality_many, get_snapshot
+from aq_providers import aq_budget
+from geofence import Geofence
+from landmarks import landmark_set
+from metrics import metrics
+from walking_matrix import get_walking_matrix
+
+from citytour.caches import default_caches
+from citytour.dataset import load_dataset
+from citytour.enrich import find_nearby
+from citytour.layers import (
+    aq_layers, build_avatar_layers, build_deck, landmark_layers, route_layers, view_state,
+)
+from citytour.tour import plan_route, route_stops
+
+MAX_WORKERS = 4
+# groesster akzeptierter Request-Body (Bytes)
+MAX_BODY = 1 << 20
+# hoechstens so viele Koordinaten pro /air-quality
+MAX_COORDS = 1000
+
+
+class BadRequest(Exception):
+    """The request is malformed; answered with 400 and the message"""
+
+
+def _number(request, name, low=None, high=None):
+    """request[name] as float; BadRequest if missing, not a number or outside [low, high]"""
+    value = request.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise BadRequest(f"{name} must be a number")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return float(value)
+
+
+def _position(request):
+    return _number(request, "lat", -90, 90), _number(request, "lon", -180, 180)
+
+
+def _list(request, name, item_type, default=()):
+    """request[name] as a list of item_type values (default if missing)"""
+    values = request.get(name)
+    if values is None:
+        return list(default)
+    if not isinstance(values, list) or not all(isinstance(v, item_type) and not isinstance(v, bool)
+                                               for v in values):
+        raise BadRequest(f"{name} must be a list of {item_type.__name__}")
+    return values
+
+
+def _coords(request):
+    """request["coords"] as [(lat, lon), ...]"""
+    coords = request.get("coords")
+    if not isinstance(coords, list) or len(coords) > MAX_COORDS:
+        raise BadRequest(f"coords must be a list of at most {MAX_COORDS} [lat, lon] pairs")
+    result = []
+    for pair in coords:
+        if not isinstance(pair, list) or len(pair) != 2:
+            raise BadRequest("coords must contain [lat, lon] pairs")
+        result.append(_position({"lat": pair[0], "lon": pair[1]}))
+    return result
+
+
+def _default(value):
+    """numpy scalars (and anything else json does not know) in responses"""
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def records(df):
+    """JSON-ready rows of a DataFrame (NaN -> null, no desc blobs)"""
+    return json.loads(df.drop(columns=['desc'], errors='ignore').to_json(orient='records'))
+
+
+class CityTourService:
+    """The endpoints as plain methods: request dict in, response dict out"""
+
+    def __init__(self, dataset, caches=default_caches):
+        self.dataset = dataset
+        self.caches = caches
+
+    def health(self, request=None):
+        return {"status": "ok", "dataset_version": self.dataset.version, "places": len(self.dataset)}
+
+    def categories(self, request=None):
+        return {"categories": self.dataset.categories()}
+
+    def stats(self, request=None):
+        return self.caches.stats()
+
+    def _places(self, request):
+        categories = _list(request, "categories", str) or self.dataset.categories()
+        return categories, self.dataset.filter(categories)
+
+    def _route(self, request):
+        """Planned RouteSession with the request's visits / skips applied, and its stops"""
+        visited = _list(request, "visited", int)
+        skipped = _list(request, "skipped", int)
+        _, places = self._places(request)
+        places_df = self.dataset.places
+        walking_matrix = get_walking_matrix(places_df['lat'].to_numpy(), places_df['lon'].to_numpy(),
+                                            self.dataset.version)
+        route = plan_route(places, walking_matrix)
+        positions = {poi_id: pos for pos, poi_id in enumerate(places['poi_id'].tolist())}
+        for poi_id in visited:
+            if poi_id in positions:
+                route.visit(positions[poi_id])
+        for poi_id in skipped:
+            if poi_id in positions:
+                route.skip(positions[poi_id])
+        return route, route_stops(places, route, get_air_quality_many)
+
+    def route(self, request):
+        route, stops = self._route(request)
+        return {
+            "stops": records(stops),
+            "path": route.path(self.caches.route_legs),
+            "length_km": float(route.length()),
+        }
+
+    def nearby(self, request):
+        lat, lon = _position(request)
+        categories, places = self._places(request)
+        # zustandslos: jeder Request betritt die Orte neu
+        nearby, _ = find_nearby(Geofence(), self.dataset.index(categories), places, lat, lon)
+        return {"places": [dict(place, dist_km=dist_km) for place, dist_km in nearby]}
+
+    def air_quality(self, request):
+        coords = _coords(request)
+        return {"results": get_air_quality_many(coords)}
+
+    def map(self, request):
+        """deck.gl spec of the map, the same layers the Streamlit app draws"""
+        position = _position(request) if "lat" in request or "lon" in request else None
+        layers = []
+        state = view_state()
+        if request.get("route"):
+            route, stops = self._route(request)
+            if not stops.empty:
+                layers.extend(route_layers(self.dataset.version, stops, route.path(self.caches.route_legs),
+                                           self.caches.layers))
+                state = view_state(float(stops.iloc[0]['lat']), float(stops.iloc[0]['lon']))
+        if position is not None:
+            lat, lon = position
+            layers.extend(build_avatar_layers(lat, lon))
+            layers.extend(landmark_layers((lat, lon), landmark_set.to_layer_data(lat, lon), self.caches.layers))
+            state = view_state(lat, lon, zoom=15)
+        if request.get("show_aq", True):
+            layers.extend(aq_layers(get_snapshot(), self.caches.layers))
+        return json.loads(build_deck(layers, state).to_json())
+
+
+GET_ROUTES = {"/health": "health", "/categories": "categories", "/stats": "stats"}
+POST_ROUTES = {"/route": "route", "/nearby": "nearby", "/air-quality": "air_quality", "/map": "map"}
+
+
+class CityTourHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            self._send_metrics()
+            return
+        self._dispatch(GET_ROUTES, {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self._send(413, {"error": "request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send(400, {"error": f"invalid JSON: {e}"})
+            return
+        if not isinstance(request, dict):
+            self._send(400, {"error": "request body must be a JSON object"})
+            return
+        self._dispatch(POST_ROUTES, request)
+
+    def _send_metrics(self):
+        payload = metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _dispatch(self, routes, request):
+        name = routes.get(self.path.split("?")[0])
+        if name is None:
+            self._send(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        try:
+            # ein AQ-Latenzbudget pro Request, wie pro Render in app.py
+            with metrics.span(f"service.{name}"), aq_budget():
+                body = getattr(self.server.service, name)(request)
+        except BadRequest as e:
+            self._send(400, {"error": f"bad request: {e}"})
+            return
+        except Exception as e:
+            print(f"citytour service: {name} failed: {e}")
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body, default=_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands each connection to a fixed ThreadPoolExecutor"""
+
+    def __init__(self, address, handler, service, workers=MAX_WORKERS):
+        super().__init__(address, handler)
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="citytour-worker")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def start_service(dataset=None, host="127.0.0.1", port=0, workers=MAX_WORKERS, caches=default_caches):
+    """Starts the service in a daemon thread, returns (server, base_url); port=0 picks a free port"""
+    service = CityTourService(dataset if dataset is not None else load_dataset(), caches)
+    server = PooledHTTPServer((host, port), CityTourHandler, service, workers=workers)
+    threading.Thread(target=server.serve_forever, name="citytour-service", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local CityTour JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+    dataset = load_dataset()
+    server = PooledHTTPServer((args.host, args.port), CityTourHandler, CityTourService(dataset),
+                              workers=args.workers)
+    print(f"CityTour service ({len(dataset)} places) listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,77 @@
+"""
+Guided tour over the filtered places.
+
+plan_route() optimizes the tour once (RouteSession), session_route() keeps
+one per front-end session; route_stops() turns the session's current order
+into the stop table the map and the stop list show, with the AQ values of
+every stop.
+"""
+from distance import distance_matrix_km, distances_km
+from route_session import RouteSession
+
+from citytour.enrich import apply_air_quality
+
+# Startpunkt der Tour: der Ort naechst am Marienplatz
+MARIENPLATZ = (48.1372, 11.5755)
+
+
+def start_position(places, origin=MARIENPLATZ):
+    """Position (into places) of the place closest to origin, None for no places"""
+    if places.empty:
+        return None
+    return int(distances_km(origin[0], origin[1], places['lat'].to_numpy(), places['lon'].to_numpy()).argmin())
+
+
+def route_key(dataset, places):
+    """Identifies the tour of a filter: a session is re-planned when this changes"""
+    return (dataset.version, tuple(places['poi_id']))
+
+
+def plan_route(places, walking_matrix=None, origin=MARIENPLATZ, time_budget=0.05):
+    """
+    Optimized RouteSession over places.
+    Distances: walking distances if a walking matrix is available, else straight-line distances.
+    """
+    lats = places['lat'].to_numpy()
+    lons = places['lon'].to_numpy()
+    if walking_matrix is not None:
+        dist = walking_matrix.submatrix(places['poi_id'].to_numpy())
+    else:
+        dist = distance_matrix_km(lats, lons)
+    return RouteSession(lats, lons, dist, start=start_position(places, origin), time_budget=time_budget,
+                        walking=walking_matrix is not None)
+
+
+def use_walking_matrix(route, places, walking_matrix):
+    """
+    Moves a route planned on straight-line distances onto the walking matrix
+    once it is there (it is built in the background); progress is kept.
+    """
+    if walking_matrix is not None and not route.walking:
+        route.set_distances(walking_matrix.submatrix(places['poi_id'].to_numpy()))
+    return route
+
+
+def session_route(state, dataset, places, walking_matrix=None):
+    """
+    The guided tour kept in state (st.session_state or any dict): planned once
+    per route_key, afterwards only updated (visits, skips, walking distances).
+    """
+    key = route_key(dataset, places)
+    if state.get('route_session_key') != key or state.get('route_session') is None:
+        state['route_session'] = plan_route(places, walking_matrix)
+        state['route_session_key'] = key
+    return use_walking_matrix(state['route_session'], places, walking_matrix)
+
+
+def route_stops(places, route, fetch_many=None):
+    """
+    The remaining stops of route in walking order, with route_pos (position
+    in places, for visit / skip) and - if fetch_many is given - the AQ columns.
+    """
+    stops = places.iloc[route.order].reset_index(drop=True)
+    stops['route_pos'] = route.order
+    if fetch_many is not None and not stops.empty:
+        # one batched request for stops the session has no values for yet
+        apply_air_quality(stops, route.air_quality(fetch_many))
+    return stops
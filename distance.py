@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+from geopy.distance import geodesic
+
+# Mittlerer Erdradius (WGS84), passend zu geopy.distance.EARTH_RADIUS
+EARTH_RADIUS_KM = 6371.009
+
+# Accuracy mode for all distance calls:
+# - "haversine": great-circle distance, vectorized (default, <0.5% off geodesic)
+# - "equirectangular": flat-earth approximation, fastest, fine for city scale
+# - "geodesic": exact ellipsoid via geopy, one pair at a time (for validation)
+DISTANCE_MODES = ("haversine", "equirectangular", "geodesic")
+DISTANCE_MODE = os.environ.get("CITYTOUR_DISTANCE_MODE", "haversine")
+
+
+def set_distance_mode(mode):
+    """
+    Switch the accuracy mode used by distance_km / distances_km / distance_matrix_km.
+    Useful to check the fast kernels against geodesic.
+    """
+    global DISTANCE_MODE
+    if mode not in DISTANCE_MODES:
+        raise ValueError(f"Unknown distance mode '{mode}', expected one of {DISTANCE_MODES}")
+    DISTANCE_MODE = mode
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    One-to-many (or element-wise) haversine distance in km.
+    lat/lon can be scalars or arrays broadcastable against lats/lons.
+    """
+    lat1 = np.radians(lat)
+    lon1 = np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def equirectangular_km(lat, lon, lats, lons):
+    """
+    One-to-many (or element-wise) equirectangular approximation in km.
+    Good enough within a city, about 3x cheaper than haversine.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+
+    x = np.radians(lons - lon) * np.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS_KM * np.sqrt(x * x + y * y)
+
+
+def geodesic_km(lat, lon, lats, lons):
+    """
+    Reference implementation using geopy geodesic, one pair at a time.
+    Slow - only meant for checking the vectorized kernels.
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    lat_arr, lon_arr, lats, lons = np.broadcast_arrays(lat, lon, lats, lons)
+    out = np.empty(lats.shape, dtype=np.float64)
+    for i in np.ndindex(lats.shape):
+        out[i] = geodesic((lat_arr[i], lon_arr[i]), (lats[i], lons[i])).km
+    return out
+
+
+_KERNELS = {
+    "haversine": haversine_km,
+    "equirectangular": equirectangular_km,
+    "geodesic": geodesic_km,
+}
+
+
+def distances_km(lat, lon, lats, lons, mode=None):
+    """
+    Distances in km from one point (lat, lon) to many points (lats, lons).
+    Returns a NumPy array with the shape of lats.
+    """
+    kernel = _KERNELS[mode or DISTANCE_MODE]
+    return kernel(lat, lon, lats, lons)
+
+
+def distance_km(lat1, lon1, lat2, lon2, mode=None):
+    """Distance in km between two points, drop-in for geodesic(...).km"""
+    return float(np.asarray(distances_km(lat1, lon1, lat2, lon2, mode=mode)).reshape(-1)[0])
+
+
+def distance_matrix_km(lats, lons, lats2=None, lons2=None, mode=None):
+    """
+    Many-to-many distances in km.
+    Returns an (n, m) matrix between (lats, lons) and (lats2, lons2),
+    or the symmetric (n, n) matrix if the second set is omitted.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if lats2 is None or lons2 is None:
+        lats2, lons2 = lats, lons
+    else:
+        lats2 = np.asarray(lats2, dtype=np.float64)
+        lons2 = np.asarray(lons2, dtype=np.float64)
+
+    kernel = _KERNELS[mode or DISTANCE_MODE]
+    return kernel(lats[:, None], lons[:, None], lats2[None, :], lons2[None, :])
@@ -0,0 +1,89 @@
+"""
+Local stand-in for the Open-Meteo air quality API, for working offline and
+in load tests. Answers /v1/air-quality for one or many (comma separated)
+coordinates with deterministic values; --delay adds API latency.
+
+    python fake_open_meteo.py --port 5001
+    CITYTOUR_AQ_API_URL=http://localhost:5001/v1/air-quality streamlit run app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def current_values(lat, lon):
+    """Plausible Munich values that only depend on the coordinates"""
+    pm25 = round(6 + (lat * 997 + lon * 991) % 20, 1)
+    return {
+        "pm2_5": pm25,
+        "pm10": round(pm25 * 1.7, 1),
+        "nitrogen_dioxide": round(12 + (lat * 613 + lon * 617) % 30, 1),
+    }
+
+
+def air_quality_response(lats, lons):
+    """One object for one coordinate, a list of objects for several (like Open-Meteo)"""
+    items = [
+        {"latitude": lat, "longitude": lon, "current": current_values(lat, lon)}
+        for lat, lon in zip(lats, lons)
+    ]
+    return items[0] if len(items) == 1 else items
+
+
+class FakeOpenMeteoHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/v1/air-quality":
+            self.send_error(404, f"unknown endpoint {url.path}")
+            return
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            lats = [float(v) for v in query["latitude"].split(",")]
+            lons = [float(v) for v in query["longitude"].split(",")]
+            if len(lats) != len(lons):
+                raise ValueError("latitude and longitude lists differ in length")
+        except (KeyError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+
+        if self.delay:
+            time.sleep(self.delay)
+        payload = json.dumps(air_quality_response(lats, lons)).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client hat wegen --delay schon aufgegeben (Timeout, Deadline)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _handler(delay):
+    return type("FakeOpenMeteoHandler", (FakeOpenMeteoHandler,), {"delay": delay})
+
+
+def start_fake_open_meteo(host="127.0.0.1", port=0, delay=0.0):
+    """Starts the server in a daemon thread, returns (server, api_url); port=0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), _handler(delay))
+    threading.Thread(target=server.serve_forever, name="fake-open-meteo", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1/air-quality"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Open-Meteo air quality server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), _handler(args.delay))
+    print(f"Fake Open-Meteo listening on http://{args.host}:{args.port}/v1/air-quality")
+    server.serve_forever()
@@ -0,0 +1,117 @@
+"""
+Local stand-in for the OSRM HTTP API, for working offline and in tests.
+Answers /route/v1/foot and /table/v1/foot with straight-line distances
+times a detour factor.
+
+    python fake_osrm.py --port 5000
+    CITYTOUR_OSRM_URL=http://localhost:5000 streamlit run app.py
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import polyline
+
+from distance import distance_matrix_km
+
+# Fusswege sind im Schnitt ca. 30% laenger als die Luftlinie
+DETOUR_FACTOR = 1.3
+WALKING_SPEED_MPS = 1.4
+
+
+def _parse_coords(path_part):
+    coords = []
+    for pair in path_part.split(";"):
+        lon, lat = pair.split(",")
+        coords.append((float(lat), float(lon)))
+    return coords
+
+
+def _index_list(value, n):
+    if not value or value == "all":
+        return list(range(n))
+    return [int(i) for i in value.split(";")]
+
+
+def table_response(coords, sources, destinations):
+    lats = np.array([c[0] for c in coords])
+    lons = np.array([c[1] for c in coords])
+    dist_m = distance_matrix_km(lats[sources], lons[sources], lats[destinations], lons[destinations]) * 1000 * DETOUR_FACTOR
+    return {
+        "code": "Ok",
+        "distances": dist_m.round(1).tolist(),
+        "durations": (dist_m / WALKING_SPEED_MPS).round(1).tolist(),
+    }
+
+
+def route_response(coords):
+    legs = []
+    total = 0.0
+    for a, b in zip(coords[:-1], coords[1:]):
+        dist_m = float(distance_matrix_km([a[0]], [a[1]], [b[0]], [b[1]])[0, 0]) * 1000 * DETOUR_FACTOR
+        total += dist_m
+        legs.append({
+            "distance": dist_m,
+            "duration": dist_m / WALKING_SPEED_MPS,
+            "steps": [{"geometry": polyline.encode([a, b]), "distance": dist_m}],
+        })
+    return {
+        "code": "Ok",
+        "routes": [{
+            "distance": total,
+            "duration": total / WALKING_SPEED_MPS,
+            "geometry": polyline.encode(coords),
+            "legs": legs,
+        }],
+    }
+
+
+class FakeOSRMHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            service, coords = parts[0], _parse_coords(parts[3])
+            if service == "table":
+                body = table_response(coords, _index_list(query.get("sources"), len(coords)),
+                                      _index_list(query.get("destinations"), len(coords)))
+            elif service == "route":
+                body = route_response(coords)
+            else:
+                self.send_error(404, f"unknown service {service}")
+                return
+        except (IndexError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_osrm(host="127.0.0.1", port=0):
+    """Starts the server in a daemon thread, returns (server, base_url); port=0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), FakeOSRMHandler)
+    threading.Thread(target=server.serve_forever, name="fake-osrm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake OSRM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), FakeOSRMHandler)
+    print(f"Fake OSRM listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,124 @@
+"""
+Local stand-in for the Overpass API, for working offline and in tests.
+Serves fixture elements for the bbox / newer filters of the POI queries
+built by osm_to_csv.build_query.
+
+    python fake_overpass.py --port 5001 [--fixture elements.json]
+    python osm_to_csv.py --url http://localhost:5001/api/interpreter [--incremental]
+
+Without --fixture the elements are generated from places-in-munich.csv.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+PLACES_CSV = "places-in-munich.csv"
+FIXTURE_TIMESTAMP = "2024-01-01T00:00:00Z"
+
+BBOX_RE = re.compile(r"\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+NEWER_RE = re.compile(r'\(newer:"([^"]+)"\)')
+
+# Rueckwaerts-Abbildung unserer Kategorien auf OSM-Tags
+CATEGORY_TAGS = {
+    "Art": {"tourism": "museum"},
+    "Historical": {"historic": "monument"},
+    "Nature": {"leisure": "park"},
+    "Sight": {"tourism": "attraction"},
+}
+
+
+def elements_from_csv(path=PLACES_CSV):
+    """Overpass-style node elements for every row of the places CSV"""
+    df = pd.read_csv(path)
+    elements = []
+    for i, row in enumerate(df.itertuples(index=False)):
+        tags = dict(CATEGORY_TAGS.get(row.category, {"tourism": "viewpoint"}))
+        tags["name"] = row.name
+        if isinstance(row.desc, str) and row.desc != "No description available":
+            tags["description"] = row.desc
+        elements.append({"type": "node", "id": i + 1, "lat": row.lat, "lon": row.lon,
+                         "timestamp": FIXTURE_TIMESTAMP, "tags": tags})
+    return elements
+
+
+def query_response(elements, query):
+    """Elements matching the bbox (and newer filter) of an Overpass QL query"""
+    match = BBOX_RE.search(query)
+    if match is None:
+        raise ValueError("no bbox in query")
+    south, west, north, east = (float(v) for v in match.groups())
+    newer = NEWER_RE.search(query)
+    ids_only = re.search(r"out\s+ids", query) is not None
+
+    result = []
+    for e in elements:
+        if not (south <= e["lat"] <= north and west <= e["lon"] <= east):
+            continue
+        # ISO-Zeitstempel sind lexikografisch vergleichbar
+        if newer and e.get("timestamp", FIXTURE_TIMESTAMP) <= newer.group(1):
+            continue
+        result.append({"type": e["type"], "id": e["id"]} if ids_only else e)
+    return {"version": 0.6, "generator": "fake_overpass", "elements": result}
+
+
+class FakeOverpassHandler(BaseHTTPRequestHandler):
+    elements = []
+    fail_rate = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        # requests schickt den String roh, Formulare als data=...
+        form = parse_qs(body)
+        query = form["data"][0] if "data" in form else body
+
+        if random.random() < self.fail_rate:
+            self.send_error(429, "Too Many Requests")
+            return
+        try:
+            payload = json.dumps(query_response(self.elements, query)).encode()
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _handler(elements, fail_rate):
+    return type("Handler", (FakeOverpassHandler,), {"elements": elements, "fail_rate": fail_rate})
+
+
+def start_fake_overpass(elements, host="127.0.0.1", port=0, fail_rate=0.0):
+    """Starts the server in a daemon thread, returns (server, url); port=0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), _handler(elements, fail_rate))
+    threading.Thread(target=server.serve_forever, name="fake-overpass", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/interpreter"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Overpass server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--fixture", help="JSON file with a list of Overpass elements")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 429")
+    args = parser.parse_args()
+    if args.fixture:
+        with open(args.fixture) as f:
+            fixture = json.load(f)
+    else:
+        fixture = elements_from_csv()
+    server = ThreadingHTTPServer((args.host, args.port), _handler(fixture, args.fail_rate))
+    print(f"Fake Overpass listening on http://{args.host}:{args.port}/api/interpreter")
+    server.serve_forever()
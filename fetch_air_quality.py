@@ -1,60 +1,91 @@
+"""
+Requests against the air quality APIs, one provider each:
+
+- fetch_air_quality / fetch_air_quality_many: Open-Meteo (free, no auth)
+- fetch_air_quality_waqi: World Air Quality Index (needs CITYTOUR_WAQI_TOKEN)
+- _generate_fallback_data: plausible Munich values without any network
+
+The fetch functions return None for a point without usable data and raise
+on transport errors; caching, deadlines, hedging and falling back to the
+next provider are up to the provider chain in aq_providers.py.
+"""
+import os
 import requests
-from geopy.distance import geodesic
 import random
 
+from distance import distance_km
+from metrics import metrics
 
-def fetch_air_quality(lat=None, lon=None):
-    """
-    Fetches air quality data using the Open-Meteo Air Quality API (free, no auth required).
-    Returns a dict with pm25, pm10, and no2 values, or None if failed.
-    """
-    if lat is None or lon is None:
-        return _generate_fallback_data(lat, lon)
 
-    # Open-Meteo Air Quality API (free, no authentication needed)
-    url = "https://air-quality-api.open-meteo.com/v1/air-quality"
+AQ_API_URL = os.environ.get("CITYTOUR_AQ_API_URL", "https://air-quality-api.open-meteo.com/v1/air-quality")
+AQ_CURRENT_FIELDS = "pm10,pm2_5,nitrogen_dioxide"
+WAQI_API_URL = os.environ.get("CITYTOUR_WAQI_URL", "https://api.waqi.info/feed")
+# Token von https://aqicn.org/data-platform/token/, ohne Token bleibt WAQI aus
+WAQI_TOKEN = os.environ.get("CITYTOUR_WAQI_TOKEN", "")
 
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "pm10,pm2_5,nitrogen_dioxide",
-        "timezone": "Europe/Berlin"
-    }
+# US-EPA-Stuetzstellen (Konzentration, Index) zum Zurueckrechnen der WAQI-Indizes
+# PM in µg/m³, NO2 in ppb
+EPA_BREAKPOINTS = {
+    "pm25": ((0.0, 0), (12.0, 50), (35.4, 100), (55.4, 150), (150.4, 200), (250.4, 300), (500.4, 500)),
+    "pm10": ((0.0, 0), (54.0, 50), (154.0, 100), (254.0, 150), (354.0, 200), (424.0, 300), (604.0, 500)),
+    "no2": ((0.0, 0), (53.0, 50), (100.0, 100), (360.0, 150), (649.0, 200), (1249.0, 300), (2049.0, 500)),
+}
+NO2_UG_PER_PPB = 1.88
 
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-
-        current = data.get("current", {})
 
-        if not current:
-            print(f"No air quality data in response for {lat}, {lon}")
-            return _generate_fallback_data(lat, lon)
+def fetch_air_quality(lat, lon, timeout=10):
+    """Open-Meteo measurements (pm25, pm10, no2) for one point, None if the response has no usable data"""
+    return fetch_air_quality_many([(lat, lon)], timeout)[0]
 
-        measurements = {
-            'pm25': current.get('pm2_5', 0),
-            'pm10': current.get('pm10', 0),
-            'no2': current.get('nitrogen_dioxide', 0)
-        }
 
-        # Check if we got valid data
-        if all(v == 0 for v in measurements.values()):
-            print(f"All zero values received, using fallback for {lat}, {lon}")
-            return _generate_fallback_data(lat, lon)
+def fetch_air_quality_many(coords, timeout=10):
+    """
+    Open-Meteo measurements for many (lat, lon) pairs in one request
+    (comma separated lists), a list aligned with coords with None where
+    the response has no usable data.
+    """
+    coords = list(coords)
+    params = {
+        "latitude": ",".join(str(lat) for lat, _ in coords),
+        "longitude": ",".join(str(lon) for _, lon in coords),
+        "current": AQ_CURRENT_FIELDS,
+        "timezone": "Europe/Berlin"
+    }
+    with metrics.span("external.open_meteo"):
+        resp = requests.get(AQ_API_URL, params=params, timeout=timeout)
+        resp.raise_for_status()
+    data = resp.json()
+    # eine Koordinate -> Objekt, mehrere -> Liste von Objekten
+    if isinstance(data, dict):
+        data = [data]
+    if len(data) != len(coords):
+        raise ValueError(f"expected {len(coords)} locations, got {len(data)}")
+    if len(coords) > 1:
+        print(f"✓ Air quality data retrieved for {len(coords)} locations in one request")
+    return [_parse_current(item, lat, lon) for item, (lat, lon) in zip(data, coords)]
+
+
+def _parse_current(data, lat, lon):
+    """Turns one Open-Meteo response object into our measurement dict, None if unusable"""
+    current = data.get("current", {})
+
+    if not current:
+        print(f"No air quality data in response for {lat}, {lon}")
+        return None
+
+    measurements = {
+        'pm25': current.get('pm2_5', 0),
+        'pm10': current.get('pm10', 0),
+        'no2': current.get('nitrogen_dioxide', 0)
+    }
 
-        print(f"✓ Air quality data retrieved for {lat:.4f}, {lon:.4f}: PM2.5={measurements['pm25']}, PM10={measurements['pm10']}, NO2={measurements['no2']}")
-        return measurements
+    # Check if we got valid data
+    if all(v == 0 for v in measurements.values()):
+        print(f"All zero values received, using fallback for {lat}, {lon}")
+        return None
 
-    except requests.exceptions.Timeout:
-        print(f"Timeout while fetching air quality data for {lat}, {lon}")
-        return _generate_fallback_data(lat, lon)
-    except requests.exceptions.RequestException as e:
-        print(f"AQ API request failed for {lat}, {lon}: {e}")
-        return _generate_fallback_data(lat, lon)
-    except Exception as e:
-        print(f"Unexpected error in fetch_air_quality: {e}")
-        return _generate_fallback_data(lat, lon)
+    print(f"✓ Air quality data retrieved for {lat:.4f}, {lon:.4f}: PM2.5={measurements['pm25']}, PM10={measurements['pm10']}, NO2={measurements['no2']}")
+    return measurements
 
 
 def _generate_fallback_data(lat=None, lon=None):
@@ -62,6 +93,8 @@ def _generate_fallback_data(lat=None, lon=None):
     Generate realistic fallback air quality data for Munich.
     Based on typical air quality values for Munich.
     """
+    metrics.inc("aq.fallback")
+
     # Munich typical air quality ranges:
     # PM2.5: 8-25 µg/m³ (generally good to moderate)
     # PM10: 15-40 µg/m³
@@ -72,12 +105,12 @@ def _generate_fallback_data(lat=None, lon=None):
     if lat and lon:
         # Distance from city center (Marienplatz)
         marienplatz = (48.1372, 11.5755)
-        distance_km = geodesic((lat, lon), marienplatz).km
+        distance_km_center = distance_km(lat, lon, marienplatz[0], marienplatz[1])
 
         # City center tends to have slightly worse air quality
-        if distance_km < 1:
+        if distance_km_center < 1:
             location_factor = 1.3  # 30% worse in center
-        elif distance_km < 3:
+        elif distance_km_center < 3:
             location_factor = 1.1  # 10% worse in inner city
         else:
             location_factor = 0.9  # 10% better in suburbs/parks
@@ -101,15 +134,40 @@ def _generate_fallback_data(lat=None, lon=None):
     }
 
 
-def fetch_air_quality_waqi(lat=None, lon=None):
+def fetch_air_quality_waqi(lat, lon, timeout=10, token=None):
     """
-    Alternative implementation using World Air Quality Index API.
-    Requires API token from https://aqicn.org/data-platform/token/
-    Keep this as a backup option.
+    Measurements of the nearest WAQI station, None if it reports no PM2.5.
+    WAQI publishes US EPA sub-indices, they are converted back to
+    concentrations so the values compare with Open-Meteo's.
     """
-    # You would need to get a free API token from WAQI
-    # TOKEN = "your_token_here"
-    # url = f"https://api.waqi.info/feed/geo:{lat};{lon}/?token={TOKEN}"
-
-    # For now, just return fallback
-    return _generate_fallback_data(lat, lon)
\ No newline at end of file
+    token = token or WAQI_TOKEN
+    if not token:
+        raise ValueError("no WAQI token configured (CITYTOUR_WAQI_TOKEN)")
+    with metrics.span("external.waqi"):
+        resp = requests.get(f"{WAQI_API_URL}/geo:{lat};{lon}/", params={"token": token}, timeout=timeout)
+        resp.raise_for_status()
+    data = resp.json()
+    if data.get("status") != "ok":
+        raise ValueError(f"WAQI error: {data.get('data')}")
+
+    iaqi = data["data"].get("iaqi", {})
+    indices = {name: iaqi.get(name, {}).get("v") for name in EPA_BREAKPOINTS}
+    if indices["pm25"] is None:
+        print(f"No PM2.5 from WAQI for {lat}, {lon}")
+        return None
+    measurements = {name: _epa_concentration(name, index) for name, index in indices.items()}
+    if measurements["no2"] is not None:
+        measurements["no2"] = round(measurements["no2"] * NO2_UG_PER_PPB, 1)
+    print(f"✓ WAQI data retrieved for {lat:.4f}, {lon:.4f}: PM2.5={measurements['pm25']}")
+    return measurements
+
+
+def _epa_concentration(pollutant, index):
+    """US EPA sub-index -> concentration, linear between the breakpoints; None stays None"""
+    if index is None:
+        return None
+    points = EPA_BREAKPOINTS[pollutant]
+    for (c_lo, i_lo), (c_hi, i_hi) in zip(points[:-1], points[1:]):
+        if index <= i_hi:
+            return round(c_lo + (max(index, i_lo) - i_lo) * (c_hi - c_lo) / (i_hi - i_lo), 1)
+    return points[-1][0]
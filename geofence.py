@@ -0,0 +1,63 @@
+"""
+Geofences around places with enter / exit hysteresis.
+
+A place is entered once the user comes within ENTER_RADIUS_KM and only
+left again beyond EXIT_RADIUS_KM, so GPS jitter at the edge does not
+toggle it. Expensive per-place work (AQ lookup, image) runs once on the
+enter event and is kept while the user stays inside.
+"""
+ENTER_RADIUS_KM = 0.25
+EXIT_RADIUS_KM = 0.3
+
+ENTER = "enter"
+EXIT = "exit"
+
+
+class Geofence:
+    """
+    Per-session geofence state.
+    - inside: key -> payload returned by on_enter, for every place the user is in
+    - visited: keys of all places ever entered
+    """
+
+    def __init__(self, enter_radius_km=ENTER_RADIUS_KM, exit_radius_km=EXIT_RADIUS_KM):
+        if exit_radius_km < enter_radius_km:
+            raise ValueError("exit radius must not be smaller than the enter radius")
+        self.enter_radius_km = enter_radius_km
+        self.exit_radius_km = exit_radius_km
+        self.inside = {}
+        self.visited = set()
+
+    def update(self, index, keys, lat, lon, on_enter=None):
+        """
+        Checks the position against all places of a SpatialIndex;
+        keys[pos] identifies the place at index position pos.
+        on_enter(pos) is called once per enter event, its result becomes the payload.
+
+        Returns (in_range, events):
+        - in_range: [(key, dist_km, payload), ...] of the places the user is in, closest first
+        - events: [(ENTER | EXIT, key), ...]
+        """
+        # Kandidaten im groesseren Radius, schon nach Entfernung sortiert
+        positions, dist_km = index.query_radius(lat, lon, self.exit_radius_km)
+        events = []
+        in_range = []
+        inside = {}
+        for pos, d in zip(positions.tolist(), dist_km.tolist()):
+            key = keys[pos]
+            if key in self.inside:
+                payload = self.inside[key]
+            elif d <= self.enter_radius_km:
+                payload = on_enter(pos) if on_enter is not None else None
+                self.visited.add(key)
+                events.append((ENTER, key))
+            else:
+                continue
+            inside[key] = payload
+            in_range.append((key, d, payload))
+
+        for key in self.inside:
+            if key not in inside:
+                events.append((EXIT, key))
+        self.inside = inside
+        return in_range, events
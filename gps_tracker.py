@@ -0,0 +1,140 @@
+"""
+Position pipeline for the spontaneous mode.
+
+Raw fixes are smoothed with a small Kalman filter (noise taken from the
+reported accuracy), the walking speed is estimated from the smoothed
+track, and a tick is only "processed" (proximity scan, landmark scaling,
+AQ lookup) once the user has moved MOVE_THRESHOLD_M from the last
+processed position. The poll interval follows the speed.
+"""
+import os
+import time
+from collections import deque
+
+from distance import distance_km
+
+# unter dieser Bewegung (Meter) wird nichts neu berechnet
+MOVE_THRESHOLD_M = float(os.environ.get("CITYTOUR_GPS_MOVE_THRESHOLD_M", 15))
+# Prozessrauschen des Filters: wie schnell sich die Position plausibel aendert (m/s)
+PROCESS_SPEED_MPS = 3.0
+DEFAULT_ACCURACY_M = 20.0
+# Geschwindigkeitsstufen (m/s) -> Abfrageintervall (s)
+STATIONARY_SPEED_MPS = 0.5
+FAST_SPEED_MPS = 2.0
+POLL_STATIONARY = 10
+POLL_WALKING = 3
+POLL_FAST = 2
+# Geschwindigkeit ueber dieses Zeitfenster (s), einzelne verrauschte Fixes mitteln sich raus
+SPEED_WINDOW = 15
+# Slider-Modus: 0..100 je Achse, 50/50 = Marienplatz, ein Schritt = so viele Grad
+SLIDER_ORIGIN = (48.1370, 11.5750)
+SLIDER_STEP = (0.0004, 0.0006)
+
+
+def slider_position(lat_val, lon_val):
+    """(lat, lon) of the slider values (ints or, for synthetic traces, floats)"""
+    return (SLIDER_ORIGIN[0] + (lat_val - 50) * SLIDER_STEP[0],
+            SLIDER_ORIGIN[1] + (lon_val - 50) * SLIDER_STEP[1])
+
+
+class PositionFilter:
+    """
+    Kalman filter on (lat, lon) with a shared variance in m².
+    accuracy_m=0 marks an exact position (e.g. the slider) and resets the filter to it.
+    """
+
+    def __init__(self, process_speed=PROCESS_SPEED_MPS):
+        self.process_var = process_speed ** 2
+        self.lat = None
+        self.lon = None
+        self.variance = None
+        self.timestamp = None
+
+    def update(self, lat, lon, accuracy_m=None, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        accuracy_m = DEFAULT_ACCURACY_M if accuracy_m is None else accuracy_m
+        measurement_var = accuracy_m ** 2
+        if self.lat is None or measurement_var == 0:
+            self.lat, self.lon, self.variance = lat, lon, measurement_var
+        else:
+            # Vorhersage: Unsicherheit waechst mit der Zeit seit dem letzten Fix
+            self.variance += self.process_var * max(timestamp - self.timestamp, 0.0)
+            gain = self.variance / (self.variance + measurement_var)
+            self.lat += gain * (lat - self.lat)
+            self.lon += gain * (lon - self.lon)
+            self.variance *= 1 - gain
+        self.timestamp = timestamp
+        return self.lat, self.lon
+
+
+class GpsTracker:
+    """
+    Per-session position state:
+    - update() feeds a fix and says whether the tick needs processing
+    - lat / lon: smoothed position
+    - speed: estimated walking speed in m/s
+    - poll_interval(): seconds until the next GPS poll
+    - processed / skipped: tick counters
+    """
+
+    def __init__(self, move_threshold_m=MOVE_THRESHOLD_M):
+        self.move_threshold_m = move_threshold_m
+        self.filter = PositionFilter()
+        self.speed = 0.0
+        self.processed = 0
+        self.skipped = 0
+        self._processed_at = None  # (lat, lon) des letzten verarbeiteten Ticks
+        self._track = deque()  # (lat, lon, timestamp) der geglaetteten Fixes im SPEED_WINDOW
+
+    @property
+    def lat(self):
+        return self.filter.lat
+
+    @property
+    def lon(self):
+        return self.filter.lon
+
+    def update(self, lat, lon, accuracy_m=None, timestamp=None):
+        """Feeds one fix; True if the user moved far enough to recompute, else the tick counts as skipped"""
+        timestamp = time.time() if timestamp is None else timestamp
+        lat, lon = self.filter.update(lat, lon, accuracy_m, timestamp)
+
+        if accuracy_m == 0:
+            # exakte Position (Slider): Sprung, keine Bewegung
+            self._track.clear()
+        self._track.append((lat, lon, timestamp))
+        while len(self._track) > 2 and timestamp - self._track[1][2] >= SPEED_WINDOW:
+            self._track.popleft()
+        first = self._track[0]
+        if timestamp > first[2]:
+            self.speed = distance_km(first[0], first[1], lat, lon) * 1000 / (timestamp - first[2])
+        else:
+            self.speed = 0.0
+
+        if self._processed_at is not None:
+            moved_m = distance_km(self._processed_at[0], self._processed_at[1], lat, lon) * 1000
+            if moved_m < self.move_threshold_m:
+                self.skipped += 1
+                return False
+        self._processed_at = (lat, lon)
+        self.processed += 1
+        return True
+
+    def poll_interval(self):
+        if not self._track:
+            return POLL_WALKING
+        if self.speed < STATIONARY_SPEED_MPS:
+            return POLL_STATIONARY
+        if self.speed > FAST_SPEED_MPS:
+            return POLL_FAST
+        return POLL_WALKING
+
+    def stats(self):
+        total = self.processed + self.skipped
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / total if total else 0.0,
+            "speed_mps": round(self.speed, 2),
+            "poll_interval": self.poll_interval(),
+        }
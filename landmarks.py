@@ -1,5 +1,34 @@
-from geopy.distance import geodesic
-import pydeck as pdk
+import numpy as np
+
+from distance import distance_km, distances_km
+from spatial_index import SpatialIndex
+
+# (Stichwort in Icon-URL, Stichwort im Namen, Symbol fuer den TextLayer)
+ICON_SYMBOLS = [
+    ("wave", "eisbach", "🌊"),
+    ("temple", "monopteros", "🏛️"),
+    ("angel", "friedens", "👼"),
+    ("tower", "turm", "🗼"),
+    ("market", "markt", "🛒"),
+]
+DEFAULT_SYMBOL = "📍"
+
+
+def icon_symbol(name, icon_url):
+    """Emoji/Symbol basierend auf dem Icon-Typ"""
+    icon_url = icon_url.lower()
+    name = name.lower()
+    for url_key, name_key, symbol in ICON_SYMBOLS:
+        if url_key in icon_url or name_key in name:
+            return symbol
+    return DEFAULT_SYMBOL
+
+
+def _scale(dist_km, near_value, far_value, min_distance, max_distance):
+    """Linear from near_value at min_distance to far_value at max_distance, clamped outside"""
+    t = np.clip((np.asarray(dist_km) - min_distance) / (max_distance - min_distance), 0.0, 1.0)
+    return near_value - t * (near_value - far_value)
+
 
 class Landmark:
     def __init__(self, name, lat, lon, desc, category=None, icon_data=None, icon_color=[0, 200, 100], base_radius=50):
@@ -16,6 +45,7 @@ class Landmark:
             "width": 128,
             "height": 128
         }
+        self.icon_symbol = icon_symbol(name, self.icon_data["url"])
 
     def get_scaled_radius(self, user_lat, user_lon, max_radius=150, min_distance=0.05, max_distance=0.5):
         """
@@ -23,7 +53,7 @@ class Landmark:
         - min_distance: Entfernung unterhalb derer das Icon max_radius hat
         - max_distance: Entfernung oberhalb derer das Icon min_radius hat
         """
-        dist_km = geodesic((self.lat, self.lon), (user_lat, user_lon)).km
+        dist_km = distance_km(self.lat, self.lon, user_lat, user_lon)
         if dist_km <= min_distance:
             return max_radius
         elif dist_km >= max_distance:
@@ -37,7 +67,7 @@ class Landmark:
         """
         Skaliert die Icon-Größe (für IconLayer) abhängig von der Entfernung.
         """
-        dist_km = geodesic((self.lat, self.lon), (user_lat, user_lon)).km
+        dist_km = distance_km(self.lat, self.lon, user_lat, user_lon)
         if dist_km <= 0.05:  # Weniger als 50m
             return max_size
         elif dist_km >= 0.5:  # Mehr als 500m
@@ -49,19 +79,6 @@ class Landmark:
 
     def to_layer_data(self, user_lat, user_lon):
         """Gibt Daten-Dict für pydeck Layer zurück"""
-        # Emoji/Symbol basierend auf dem Icon-Typ
-        icon_symbol = "📍"  # Default
-        if "wave" in self.icon_data["url"].lower() or "eisbach" in self.name.lower():
-            icon_symbol = "🌊"
-        elif "temple" in self.icon_data["url"].lower() or "monopteros" in self.name.lower():
-            icon_symbol = "🏛️"
-        elif "angel" in self.icon_data["url"].lower() or "friedens" in self.name.lower():
-            icon_symbol = "👼"
-        elif "tower" in self.icon_data["url"].lower() or "turm" in self.name.lower():
-            icon_symbol = "🗼"
-        elif "market" in self.icon_data["url"].lower() or "markt" in self.name.lower():
-            icon_symbol = "🛒"
-
         return {
             "lon": self.lon,
             "lat": self.lat,
@@ -71,10 +88,75 @@ class Landmark:
             "desc": self.desc,
             "color": self.icon_color,
             "icon": self.icon_data["url"],
-            "text": icon_symbol  # Für TextLayer
+            "text": self.icon_symbol  # Für TextLayer
         }
 
 
+class LandmarkSet:
+    """
+    All landmarks as parallel NumPy arrays (struct of arrays).
+    Radii, icon sizes and layer records are computed for every landmark
+    against a user position in one vectorized pass; icon symbols are
+    resolved once here instead of on every to_layer_data call.
+    """
+
+    def __init__(self, landmarks):
+        self.landmarks = list(landmarks)
+        self.names = [lm.name for lm in self.landmarks]
+        self.descs = [lm.desc for lm in self.landmarks]
+        self.colors = [lm.icon_color for lm in self.landmarks]
+        self.icons = [lm.icon_data["url"] for lm in self.landmarks]
+        self.symbols = [lm.icon_symbol for lm in self.landmarks]
+        self.lat = np.array([lm.lat for lm in self.landmarks], dtype=np.float64)
+        self.lon = np.array([lm.lon for lm in self.landmarks], dtype=np.float64)
+        self.base_radius = np.array([lm.base_radius for lm in self.landmarks], dtype=np.float64)
+        # Positionen im Index = Positionen in diesem Set
+        self.index = SpatialIndex(self.lat, self.lon)
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def __getitem__(self, i):
+        return self.landmarks[i]
+
+    def distances(self, user_lat, user_lon):
+        return distances_km(user_lat, user_lon, self.lat, self.lon)
+
+    def scaled_radii(self, user_lat, user_lon, max_radius=150, min_distance=0.05, max_distance=0.5, dist_km=None):
+        """Landmark.get_scaled_radius for all landmarks at once"""
+        if dist_km is None:
+            dist_km = self.distances(user_lat, user_lon)
+        return _scale(dist_km, max_radius, self.base_radius, min_distance, max_distance)
+
+    def icon_sizes(self, user_lat, user_lon, max_size=8, min_size=3, dist_km=None):
+        """Landmark.get_icon_size for all landmarks at once"""
+        if dist_km is None:
+            dist_km = self.distances(user_lat, user_lon)
+        return _scale(dist_km, max_size, min_size, 0.05, 0.5)
+
+    def to_layer_data(self, user_lat, user_lon):
+        """Layer records of all landmarks (same dicts as Landmark.to_layer_data), one distance pass"""
+        dist_km = self.distances(user_lat, user_lon)
+        radii = self.scaled_radii(user_lat, user_lon, dist_km=dist_km).tolist()
+        sizes = self.icon_sizes(user_lat, user_lon, dist_km=dist_km).tolist()
+        lats = self.lat.tolist()
+        lons = self.lon.tolist()
+        return [
+            {
+                "lon": lons[i],
+                "lat": lats[i],
+                "radius": radii[i],
+                "icon_size": sizes[i],
+                "name": self.names[i],
+                "desc": self.descs[i],
+                "color": self.colors[i],
+                "icon": self.icons[i],
+                "text": self.symbols[i],
+            }
+            for i in range(len(self))
+        ]
+
+
 # Icons URLs - direkt hardcoded (funktionieren garantiert)
 ICON_WAVE = {
     "url": "https://cdn-icons-png.flaticon.com/128/4150/4150884.png",  # Wave
@@ -159,4 +241,8 @@ landmark_list = [
         icon_color=[255, 100, 100],
         base_radius=55
     )
-]
\ No newline at end of file
+]
+
+landmark_set = LandmarkSet(landmark_list)
+# Raeumlicher Index ueber alle Landmarks (Positionen = Index in landmark_list)
+landmark_index = landmark_set.index
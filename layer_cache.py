@@ -0,0 +1,95 @@
+"""
+Pre-serialized pydeck layers.
+
+Layers that only change with their data (AQ grid, route, discovered places)
+are built and serialized once per key and reused as JSON strings; a map
+render then only serializes the per-tick layers (user avatar) and the view
+state. DeckSpec splices both into the spec st.pydeck_chart sends.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import pydeck as pdk
+from pydeck.bindings.json_tools import default_serialize
+
+from metrics import metrics
+
+MAX_ENTRIES = 64
+
+
+def layer_json(layer):
+    """Compact JSON of one pdk.Layer, the same fields pydeck itself emits"""
+    return json.dumps(layer, default=default_serialize, separators=(",", ":"))
+
+
+class LayerCache:
+    """
+    Thread-safe LRU of serialized layers, shared by all sessions.
+    Keys must capture everything the layers depend on (dataset version,
+    snapshot version, visited places, ...).
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """JSON strings of the layers for key; build() returns the pdk.Layers on a miss"""
+        with self._lock:
+            parts = self._entries.get(key)
+            if parts is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return parts
+            self.misses += 1
+
+        # ausserhalb des Locks bauen, im schlimmsten Fall zweimal
+        with metrics.span("layers.build"):
+            parts = [layer_json(layer) for layer in build()]
+        with self._lock:
+            self._entries[key] = parts
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return parts
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+
+layer_cache = LayerCache()
+
+
+class DeckSpec:
+    """
+    Stand-in for pdk.Deck in st.pydeck_chart whose layers may be cached
+    JSON strings (from LayerCache) mixed with live pdk.Layers, in draw order.
+    """
+
+    def __init__(self, layers, **deck_kwargs):
+        self._deck = pdk.Deck(layers=[], **deck_kwargs)
+        self.parts = layers
+        # st.pydeck_chart liest diese Attribute direkt
+        self.layers = [part for part in layers if not isinstance(part, str)]
+        self.mapbox_key = getattr(self._deck, "mapbox_key", None)
+        self.deck_widget = getattr(self._deck, "deck_widget", None)
+        self._tooltip = getattr(self._deck, "_tooltip", None)
+        self.width = getattr(self._deck, "width", None)
+
+    @metrics.timed("deck.serialize")
+    def to_json(self):
+        spec = json.loads(self._deck.to_json())  # ohne Layer, nur ein paar hundert Bytes
+        spec.pop("layers", None)
+        layers = ",".join(part if isinstance(part, str) else layer_json(part) for part in self.parts)
+        head = json.dumps(spec, separators=(",", ":"))
+        return f'{head[:-1]},"layers":[{layers}]}}'
@@ -0,0 +1,413 @@
+"""
+Load test: many walkers at once, replaying GPS traces through the app.
+
+    python loadtest.py                                    # 1, 5, 10, 25 sessions, both modes, headless
+    python loadtest.py --sessions 1,50 --mode guided --ticks 100
+    python loadtest.py --driver apptest --sessions 1,4    # the real app.py through streamlit AppTest
+    python loadtest.py --trace walk.csv --interval 3      # replay recorded lat,lon fixes, one every 3 s
+
+Traces use the slider scheme of the spontaneous mode (50/50 = Marienplatz,
+see gps_tracker.slider_position): a synthetic walker drifts through slider
+space at walking speed, a replayed trace is a CSV with lat,lon columns.
+
+Drivers:
+- headless: every session runs the same core calls as one fragment rerun
+  of app.py (citytour package, GpsTracker, Geofence, layer cache, deck JSON)
+- apptest:  every session is a streamlit AppTest of app.py; spontaneous
+  ticks move the sliders, guided ticks rerun and press "Visited" every
+  --visit-every ticks
+
+Open-Meteo, OSRM and gTTS are replaced by local stubs (fake_open_meteo.py,
+fake_osrm.py, CITYTOUR_TTS=stub; route cache and audio in a temp dir)
+unless --no-stubs is given. The AQ grid refresher stays off: it runs once
+per process, not per session.
+
+For each session count the sessions run concurrently (one thread each) and
+the report lists tick latency percentiles, CPU seconds per session and the
+growth of the process RSS, followed by how many Open-Meteo, OSRM and TTS
+calls the sessions shared (singleflight.py); --output writes the same as JSON.
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fake_open_meteo import start_fake_open_meteo
+from fake_osrm import start_fake_osrm
+from gps_tracker import SLIDER_ORIGIN, SLIDER_STEP, slider_position
+
+DEFAULT_SESSIONS = (1, 5, 10, 25)
+DEFAULT_TICKS = 50
+MODES = ("spontaneous", "guided")
+DRIVERS = ("headless", "apptest")
+DEFAULT_INTERESTS = ("Nature", "Historical", "Art")
+# simulierte Zeit zwischen zwei Fixes (s) und Gehgeschwindigkeit (m/s)
+TICK_SECONDS = 3.0
+WALKING_SPEED_MPS = 1.4
+# Guided: alle so viele Ticks wird der naechste Stopp als besucht markiert
+VISIT_EVERY = 10
+# wie app.py: Landmarks nur alle 15 s neu skalieren
+LANDMARK_INTERVAL = 15
+APPTEST_TIMEOUT = 60
+
+
+def start_stubs(workdir):
+    """Starts the OSRM / Open-Meteo stubs and points the app's env config at them and at workdir"""
+    _, osrm_url = start_fake_osrm()
+    _, aq_url = start_fake_open_meteo()
+    os.environ.update({
+        "CITYTOUR_OSRM_URL": osrm_url,
+        "CITYTOUR_AQ_API_URL": aq_url,
+        "CITYTOUR_TTS": "stub",
+        "CITYTOUR_TTS_DIR": os.path.join(workdir, "tts_cache"),
+        "CITYTOUR_ROUTE_CACHE_DB": os.path.join(workdir, "route_cache.db"),
+        "CITYTOUR_MATRIX_DIR": os.path.join(workdir, "matrices"),
+    })
+    return {"osrm": osrm_url, "open_meteo": aq_url}
+
+
+# --- traces: [(lat, lon, timestamp, accuracy_m), ...] ---
+
+def synthesize_trace(ticks, seed=0, tick_seconds=TICK_SECONDS, speed_mps=WALKING_SPEED_MPS):
+    """
+    Walk from Marienplatz in slider space: the heading drifts a little every
+    tick and turns back at the edges of the 0..100 slider range.
+    """
+    rng = np.random.default_rng(seed)
+    lat_val = lon_val = 50.0
+    heading = rng.uniform(0, 2 * np.pi)
+    # ein Slider-Schritt: 0.0004 deg lat ~ 44 m, 0.0006 deg lon ~ 44 m in Muenchen
+    step = speed_mps * tick_seconds / 44.0
+    trace = []
+    for i in range(ticks):
+        lat, lon = slider_position(lat_val, lon_val)
+        # Slider-Positionen sind exakt -> Genauigkeit 0 wie in app.py
+        trace.append((lat, lon, i * tick_seconds, 0))
+        heading += rng.normal(0, 0.4)
+        lat_val += step * np.cos(heading)
+        lon_val += step * np.sin(heading)
+        if not 0 <= lat_val <= 100 or not 0 <= lon_val <= 100:
+            heading += np.pi
+            lat_val = min(max(lat_val, 0.0), 100.0)
+            lon_val = min(max(lon_val, 0.0), 100.0)
+    return trace
+
+
+def load_trace(path, tick_seconds=TICK_SECONDS):
+    """Recorded fixes from a CSV with lat, lon (and optionally timestamp, accuracy) columns"""
+    trace = []
+    with open(path, newline="") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            timestamp = float(row["timestamp"]) if row.get("timestamp") else i * tick_seconds
+            accuracy = float(row["accuracy"]) if row.get("accuracy") else None
+            trace.append((float(row["lat"]), float(row["lon"]), timestamp, accuracy))
+    if not trace:
+        raise ValueError(f"{path} contains no fixes")
+    return trace
+
+
+def slider_values(lat, lon):
+    """Inverse of slider_position, rounded and clamped to the integer slider range"""
+    lat_val = round(50 + (lat - SLIDER_ORIGIN[0]) / SLIDER_STEP[0])
+    lon_val = round(50 + (lon - SLIDER_ORIGIN[1]) / SLIDER_STEP[1])
+    return min(max(lat_val, 0), 100), min(max(lon_val, 0), 100)
+
+
+# --- sessions: tick(lat, lon, timestamp, accuracy_m) runs one rerun ---
+
+@functools.lru_cache(maxsize=None)
+def shared_dataset():
+    """One Dataset per process for all headless sessions, like get_dataset in app.py"""
+    from citytour import load_dataset
+    return load_dataset()
+
+
+class HeadlessSession:
+    """The per-session state and calls of one app.py session, without Streamlit"""
+
+    def __init__(self, mode, interests=DEFAULT_INTERESTS, visit_every=VISIT_EVERY):
+        from citytour import default_caches
+        from geofence import Geofence
+        from gps_tracker import GpsTracker
+
+        self.mode = mode
+        self.visit_every = visit_every
+        self.caches = default_caches
+        self.dataset = shared_dataset()
+        self.places = self.dataset.filter(list(interests))
+        self.index = self.dataset.index(list(interests))
+        self.tracker = GpsTracker()
+        self.geofence = Geofence()
+        self.visited = set()
+        self.route = None
+        self.ticks = 0
+        self.landmark_records = None
+        self.landmark_position = None
+        self.last_landmark_update = None
+        self.view = None
+
+    def tick(self, lat, lon, timestamp, accuracy_m=None):
+        from citytour import aq_layers, build_deck, view_state
+        from aq_grid import get_snapshot
+        from aq_providers import aq_budget
+
+        self.ticks += 1
+        self.view = view_state()
+        with aq_budget():
+            layers = self._guided() if self.mode == "guided" else self._spontaneous(lat, lon, timestamp, accuracy_m)
+        layers.extend(aq_layers(get_snapshot(), self.caches.layers))
+        return build_deck(layers, self.view).to_json()
+
+    def _guided(self):
+        from aq_grid import get_air_quality_many
+        from citytour import plan_route, route_layers, route_stops, use_walking_matrix
+        from tts_cache import PRIORITY_ROUTE
+        from walking_matrix import get_walking_matrix
+
+        places = self.dataset.places
+        walking_matrix = get_walking_matrix(places['lat'].to_numpy(), places['lon'].to_numpy(),
+                                            self.dataset.version)
+        if self.route is None:
+            self.route = plan_route(self.places, walking_matrix)
+        else:
+            # Matrix aus dem Hintergrund-Build: Fortschritt behalten, nur die Reststopps neu ordnen
+            use_walking_matrix(self.route, self.places, walking_matrix)
+            if self.ticks % self.visit_every == 0 and self.route.order:
+                self.route.visit(self.route.order[0])
+
+        stops = route_stops(self.places, self.route, get_air_quality_many)
+        if stops.empty:
+            return []
+        self.caches.audio.prefetch([self.dataset.desc(row) for _, row in stops.iterrows()],
+                                   'en', priority=PRIORITY_ROUTE)
+        real_path = self.route.path(self.caches.route_legs)
+        self.view.latitude = stops.iloc[0]['lat']
+        self.view.longitude = stops.iloc[0]['lon']
+        return list(route_layers(self.dataset.version, stops, real_path, self.caches.layers))
+
+    def _spontaneous(self, lat, lon, timestamp, accuracy_m):
+        from citytour import build_avatar_layers, discovered_layers, find_nearby, landmark_layers
+        from landmarks import landmark_set
+
+        moved = self.tracker.update(lat, lon, accuracy_m, timestamp)
+        lat, lon = self.tracker.lat, self.tracker.lon
+        if self.landmark_records is None or (moved and timestamp - self.last_landmark_update > LANDMARK_INTERVAL):
+            self.landmark_records = landmark_set.to_layer_data(lat, lon)
+            self.landmark_position = (lat, lon)
+            self.last_landmark_update = timestamp
+        if moved or self.ticks == 1:
+            _, entered = find_nearby(self.geofence, self.index, self.places, lat, lon)
+            for place in entered:
+                self.visited.add(place['name'])
+                # "Listen" auf jedem neu entdeckten Ort
+                self.caches.speech(self.dataset.desc(place), 'en')
+
+        layers = build_avatar_layers(lat, lon)
+        layers.extend(landmark_layers(self.landmark_position, self.landmark_records, self.caches.layers))
+        discovered = self.places[self.places['name'].isin(self.visited)]
+        layers.extend(discovered_layers(self.dataset.version, discovered, self.caches.layers))
+        self.view.latitude, self.view.longitude, self.view.zoom = lat, lon, 15
+        return layers
+
+
+class AppTestSession:
+    """One app.py session in a streamlit AppTest, set up past the welcome screen"""
+
+    def __init__(self, mode, interests=DEFAULT_INTERESTS, visit_every=VISIT_EVERY, timeout=APPTEST_TIMEOUT):
+        from streamlit.testing.v1 import AppTest
+
+        self.mode = mode
+        self.visit_every = visit_every
+        self.ticks = 0
+        self.at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"),
+                                    default_timeout=timeout)
+        self.at.session_state.setup_complete = True
+        self.at.session_state.user_name = "loadtest"
+        self.at.session_state.user_interests = list(interests)
+        self.at.session_state.user_mode = "Guided" if mode == "guided" else "Spontaneous"
+        # erster Lauf beim Anlegen (nacheinander): Streamlit kompiliert das Skript dabei und
+        # ast.parse ist unter CPython 3.11 nicht threadsicher
+        self._run()
+
+    def _run(self, at=None):
+        (at or self.at).run()
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+
+    def tick(self, lat, lon, timestamp, accuracy_m=None):
+        self.ticks += 1
+        if self.mode == "guided":
+            visit = [b for b in self.at.button if b.key and b.key.startswith("visit_")]
+            if visit and self.ticks % self.visit_every == 0:
+                self._run(visit[0].click())
+            else:
+                self._run()
+        else:
+            lat_val, lon_val = slider_values(lat, lon)
+            self.at.slider(key="lat_slider").set_value(lat_val)
+            self.at.slider(key="lon_slider").set_value(lon_val)
+            self._run()
+
+
+SESSIONS = {"headless": HeadlessSession, "apptest": AppTestSession}
+
+
+# --- measurement ---
+
+def rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def run_session(session, trace, interval, start_barrier):
+    """Plays trace through session; returns (tick times in ms, thread CPU seconds, error or None)"""
+    times = []
+    start_barrier.wait()
+    cpu = time.thread_time()
+    try:
+        for fix in trace:
+            t0 = time.perf_counter()
+            session.tick(*fix)
+            elapsed = time.perf_counter() - t0
+            times.append(elapsed * 1000)
+            if interval:
+                time.sleep(max(interval - elapsed, 0))
+    except Exception as e:
+        return times, time.thread_time() - cpu, f"{type(e).__name__}: {e}"
+    return times, time.thread_time() - cpu, None
+
+
+def run_phase(n, mode, driver, traces, interval=0.0, visit_every=VISIT_EVERY):
+    """n concurrent sessions, session i plays traces[i % len(traces)]"""
+    sessions = [SESSIONS[driver](mode, visit_every=visit_every) for _ in range(n)]
+    barrier = threading.Barrier(n)
+    rss_before = rss_mb()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n, thread_name_prefix="loadtest") as pool:
+        futures = [pool.submit(run_session, session, traces[i % len(traces)], interval, barrier)
+                   for i, session in enumerate(sessions)]
+        outcomes = [future.result() for future in futures]
+    wall = time.perf_counter() - started
+    process_cpu = time.process_time() - cpu_before
+    rss_after = rss_mb()
+
+    times = np.concatenate([np.asarray(t, dtype=np.float64) for t, _, _ in outcomes])
+    ticks = len(times)
+    # AppTest fuehrt das Skript in eigenen Threads aus: dort zaehlt nur die Prozess-CPU
+    cpu = ([c for _, c, _ in outcomes] if driver == "headless" else [process_cpu / n] * n)
+    errors = [error for _, _, error in outcomes if error]
+    result = {
+        "sessions": n,
+        "ticks": ticks,
+        "errors": errors,
+        "p50_ms": float(np.percentile(times, 50)) if ticks else None,
+        "p90_ms": float(np.percentile(times, 90)) if ticks else None,
+        "p99_ms": float(np.percentile(times, 99)) if ticks else None,
+        "max_ms": float(times.max()) if ticks else None,
+        "cpu_s_per_session": float(np.mean(cpu)),
+        "cpu_ms_per_tick": sum(cpu) * 1000 / ticks if ticks else None,
+        "process_cpu_s": process_cpu,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": rss_after,
+        "rss_growth_mb": rss_after - rss_before,
+        "rss_growth_per_session_mb": (rss_after - rss_before) / n,
+        "ticks_per_s": ticks / wall if wall else None,
+        "wall_s": wall,
+    }
+    del sessions
+    return result
+
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else "-".rjust(len(format(0.0, spec)))
+
+
+def print_table(mode, results):
+    print(f"\n{mode}")
+    print("sessions   p50 ms   p90 ms   p99 ms  cpu s/sess  cpu ms/tick  rss +MB  +MB/sess  ticks/s  errors")
+    for r in results:
+        print(f"{r['sessions']:8d} {_fmt(r['p50_ms'], '8.1f')} {_fmt(r['p90_ms'], '8.1f')} "
+              f"{_fmt(r['p99_ms'], '8.1f')} {r['cpu_s_per_session']:11.3f} {_fmt(r['cpu_ms_per_tick'], '12.2f')} "
+              f"{r['rss_growth_mb']:8.1f} {r['rss_growth_per_session_mb']:9.2f} {_fmt(r['ticks_per_s'], '8.1f')} "
+              f"{len(r['errors']):7d}")
+        for error in sorted(set(r['errors'])):
+            print(f"         ! {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent walkers replaying GPS traces through the app")
+    parser.add_argument("--sessions", default=",".join(str(n) for n in DEFAULT_SESSIONS),
+                        help="comma-separated session counts, one phase each")
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--driver", choices=DRIVERS, default="headless")
+    parser.add_argument("--ticks", type=int, default=DEFAULT_TICKS, help="fixes per synthetic trace")
+    parser.add_argument("--trace", action="append", default=[],
+                        help="CSV with lat,lon[,timestamp] to replay instead of synthetic walks (repeatable)")
+    parser.add_argument("--interval", type=float, default=0.0,
+                        help="real seconds between ticks of a session (default 0: as fast as possible)")
+    parser.add_argument("--visit-every", type=int, default=VISIT_EVERY,
+                        help="guided: mark the next stop visited every N ticks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-stubs", action="store_true", help="talk to the real Open-Meteo, OSRM and gTTS")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.sessions.split(",") if n]
+    if not counts or min(counts) < 1:
+        parser.error("--sessions needs positive session counts")
+
+    with tempfile.TemporaryDirectory(prefix="citytour-loadtest-") as workdir:
+        # vor dem ersten Import der App-Module, die lesen ihre Konfiguration beim Import
+        stubs = {} if args.no_stubs else start_stubs(workdir)
+        os.environ.setdefault("CITYTOUR_AQ_REFRESH_INTERVAL", "0")
+
+        if args.trace:
+            traces = [load_trace(path) for path in args.trace]
+        else:
+            traces = [synthesize_trace(args.ticks, seed=args.seed + i) for i in range(max(counts))]
+
+        report = {"driver": args.driver, "stubs": stubs, "ticks_per_trace": [len(t) for t in traces],
+                  "interval": args.interval, "modes": {}}
+        modes = MODES if args.mode == "both" else (args.mode,)
+        for mode in modes:
+            # Aufwaermen: Datensatz, Index, Walking-Matrix und Caches einmal pro Prozess
+            run_phase(1, mode, args.driver, [traces[0][:3]], visit_every=args.visit_every)
+            results = [run_phase(n, mode, args.driver, traces, args.interval, args.visit_every) for n in counts]
+            report["modes"][mode] = results
+            print_table(mode, results)
+
+        # wie viele externe Aufrufe sich Sessions geteilt haben (singleflight.py)
+        import singleflight
+        report["singleflight"] = singleflight.stats()
+        print("\nshared external calls")
+        for name, flight in sorted(report["singleflight"].items()):
+            print(f"  {name:12s} {flight['calls']:6d} calls  {flight['executions']:6d} executed  "
+                  f"dedup {flight['dedup_ratio']:.1%}")
+
+    if args.output:
+        tmp_path = f"{args.output}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, args.output)
+        print(f"\nResults written to {args.output}")
+    failed = any(r["errors"] for results in report["modes"].values() for r in results)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
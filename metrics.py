@@ -0,0 +1,248 @@
+"""
+Timing spans and counters for renders and external calls.
+
+    CITYTOUR_METRICS=1                   collect in memory (prometheus_text(), snapshot())
+    CITYTOUR_METRICS_FILE=metrics.jsonl  also append one JSON line per span / counter
+    CITYTOUR_METRICS_PORT=9108           also serve /metrics (Prometheus text) and /metrics.json
+
+Everything is off by default: span() then hands out one shared no-op
+context manager and inc() returns right away, so instrumented code pays a
+single attribute check per call.
+
+A span that exits with an exception also counts <name>.timeout (requests
+Timeout, TimeoutError) or <name>.error, so external calls need no extra
+bookkeeping for their failures.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_FILE = os.environ.get("CITYTOUR_METRICS_FILE", "")
+METRICS_PORT = int(os.environ.get("CITYTOUR_METRICS_PORT", 0) or 0)
+ENABLED = os.environ.get("CITYTOUR_METRICS", "") not in ("", "0", "off") or bool(METRICS_FILE) or bool(METRICS_PORT)
+# Histogramm-Grenzen in Sekunden
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "citytour"
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, exc_type)
+        return False
+
+
+def _is_timeout(exc_type):
+    return issubclass(exc_type, TimeoutError) or "Timeout" in exc_type.__name__
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Thread-safe span histograms and counters of one process.
+    - span(name): context manager timing a block
+    - timed(name): the same as a decorator
+    - inc(name, value): counter
+    - register(name, stats): callable returning {group: {metric: number}} (e.g. Caches.stats),
+      exported as gauges <name>_<metric>{<name>="<group>"}
+    """
+
+    def __init__(self, enabled=ENABLED, jsonl_path=METRICS_FILE):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._spans = {}  # name -> [count, sum, max, bucket counts...]
+        self._counters = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._jsonl = None
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name):
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        if self.jsonl_path:
+            self._write({"ts": time.time(), "counter": name, "value": value})
+
+    def observe(self, name, seconds, exc_type=None):
+        """Records one span duration (and its failure, if exc_type is set)"""
+        with self._lock:
+            entry = self._spans.get(name)
+            if entry is None:
+                entry = self._spans[name] = [0, 0.0, 0.0] + [0] * len(BUCKETS)
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[3 + i] += 1
+                    break
+        if exc_type is not None:
+            self.inc(f"{name}.timeout" if _is_timeout(exc_type) else f"{name}.error")
+        if self.jsonl_path:
+            record = {"ts": time.time(), "span": name, "ms": round(seconds * 1000, 3)}
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            self._write(record)
+
+    def _write(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            try:
+                if self._jsonl is None:
+                    self._jsonl = open(self.jsonl_path, "a", buffering=1)
+                self._jsonl.write(line)
+            except OSError as e:
+                print(f"Writing metrics to {self.jsonl_path} failed, disabling the file: {e}")
+                self.jsonl_path = ""
+
+    def register(self, name, stats):
+        with self._lock:
+            self._collectors[name] = stats
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def _collect(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        collected = {}
+        for name, stats in collectors:
+            try:
+                collected[name] = stats()
+            except Exception as e:
+                print(f"Metrics collector {name} failed: {e}")
+        return collected
+
+    def snapshot(self):
+        """All spans (count, total / mean / max ms), counters and collector stats as one dict"""
+        with self._lock:
+            spans = {
+                name: {
+                    "count": entry[0],
+                    "total_ms": entry[1] * 1000,
+                    "mean_ms": entry[1] * 1000 / entry[0],
+                    "max_ms": entry[2] * 1000,
+                }
+                for name, entry in self._spans.items()
+            }
+            counters = dict(self._counters)
+        return {"spans": spans, "counters": counters, **self._collect()}
+
+    def prometheus_text(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            spans = {name: list(entry) for name, entry in self._spans.items()}
+            counters = dict(self._counters)
+
+        metric = f"{PREFIX}_span_seconds"
+        lines.append(f"# HELP {metric} Duration of instrumented stages and external calls.")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, entry in sorted(spans.items()):
+            label = f'span="{_label(name)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, entry[3:]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {entry[0]}')
+            lines.append(f"{metric}_sum{{{label}}} {entry[1]}")
+            lines.append(f"{metric}_count{{{label}}} {entry[0]}")
+
+        metric = f"{PREFIX}_events_total"
+        lines.append(f"# HELP {metric} Cache hits, fallbacks, timeouts and errors.")
+        lines.append(f"# TYPE {metric} counter")
+        for name, value in sorted(counters.items()):
+            lines.append(f'{metric}{{event="{_label(name)}"}} {value}')
+
+        for name, groups in self._collect().items():
+            by_metric = {}
+            for group, stats in groups.items():
+                for key, value in stats.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        by_metric.setdefault(key, []).append((group, value))
+            for key, values in sorted(by_metric.items()):
+                metric = f"{PREFIX}_{name}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                for group, value in values:
+                    lines.append(f'{metric}{{{name}="{_label(group)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            payload = metrics.prometheus_text().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            payload = json.dumps(metrics.snapshot()).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404, f"unknown endpoint {path}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host="127.0.0.1", port=METRICS_PORT):
+    """Serves /metrics in a daemon thread, returns (server, base_url); port=0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
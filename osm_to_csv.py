@@ -1,58 +1,304 @@
+import argparse
+import codecs
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
 import requests
 import pandas as pd
 
-def fetch_osm_data():
-    query = """""
+from metrics import metrics
+from poi_store import write_poi_store
+
+# Munich bbox (south, west, north, east) for all Overpass queries
+MUNICH_BBOX = (48.061, 11.360, 48.220, 11.720)
+
+OVERPASS_URL = os.environ.get("CITYTOUR_OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+POI_FILTERS = (
+    '["tourism"]',
+    '["historic"]',
+    '["amenity"="park"]',
+    '["leisure"="park"]',
+    '["amenity"="museum"]',
+    '["artwork"]',
+)
+
+# Kacheln: TILE_ROWS x TILE_COLS Teil-Bboxen, parallel abgefragt
+TILE_ROWS = 4
+TILE_COLS = 4
+MAX_WORKERS = 4
+RETRIES = 3
+RETRY_BACKOFF = 2  # Sekunden, verdoppelt sich pro Versuch
+CHUNK_ROWS = 5000
+TILE_DIR = "osm_tiles"
+OUTPUT_CSV = "places-in-munich.csv"
+
+
+def split_bbox(bbox=MUNICH_BBOX, rows=TILE_ROWS, cols=TILE_COLS):
+    """Splits (south, west, north, east) into rows x cols tiles, returns [(tile_id, bbox), ...]"""
+    south, west, north, east = bbox
+    dlat = (north - south) / rows
+    dlon = (east - west) / cols
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            tile_bbox = (round(south + r * dlat, 6), round(west + c * dlon, 6),
+                         round(south + (r + 1) * dlat, 6), round(west + (c + 1) * dlon, 6))
+            tiles.append((f"{r}_{c}", tile_bbox))
+    return tiles
+
+
+def build_query(bbox, newer=None, ids_only=False):
+    """Overpass QL for all POI nodes in bbox (optionally only those changed since newer)"""
+    bbox_str = ",".join(str(c) for c in bbox)
+    newer_filter = f'(newer:"{newer}")' if newer else ""
+    lines = "\n".join(f"    node{f}{newer_filter}({bbox_str});" for f in POI_FILTERS)
+    return f"""
     [out:json][timeout:100];
     (
-        node["tourism"](48.061,11.360,48.220,11.720);
-    node["historic"](48.061,11.360,48.220,11.720);
-    node["amenity"="park"](48.061,11.360,48.220,11.720);
-    node["leisure"="park"](48.061,11.360,48.220,11.720);
-    node["amenity"="museum"](48.061,11.360,48.220,11.720);
-    node["artwork"](48.061,11.360,48.220,11.720);
+{lines}
     );
-    out body;
+    out {"ids" if ids_only else "body"};
+    """
+
+
+def iter_elements(chunks, key="elements"):
+    """
+    Incremental JSON parser: yields the objects of the top-level "elements"
+    array one by one while the response is still streaming in, without
+    ever holding the whole payload.
     """
-    url = "https://overpass-api.de/api/interpreter"
-    response = requests.post(url, data=query)
-    data = response.json()
-
-    rows = []
-    for element in data["elements"]:
-        name = element["tags"].get("name")
-        if not name:
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf = ""
+    marker = f'"{key}"'
+
+    # bis zum Anfang des Arrays lesen
+    while True:
+        idx = buf.find(marker)
+        start = buf.find("[", idx) if idx >= 0 else -1
+        if start >= 0:
+            pos = start + 1
+            break
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError(f"no {key} array in response")
+        buf += chunk
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("response ended inside the elements array")
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Objekt noch unvollstaendig -> naechsten Chunk anhaengen
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise
+            buf, pos = buf[pos:] + chunk, 0
             continue
+        yield obj
+        pos = end
+        if pos > 65536:
+            buf, pos = buf[pos:], 0
+
+
+def _decoded_chunks(response, chunk_size=65536):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def categorize(tags):
+    """OSM tags -> our category"""
+    if "museum" in tags.get("amenity", "") or tags.get("tourism") == "museum":
+        return "Art"
+    elif tags.get("historic"):
+        return "Historical"
+    elif tags.get("leisure") == "park" or tags.get("amenity") == "park":
+        return "Nature"
+    elif tags.get("tourism") == "attraction":
+        return "Sight"
+    else:
+        return "General"
+
+
+def element_to_row(element):
+    """One Overpass node -> CSV row dict, None if it has no name"""
+    tags = element.get("tags", {})
+    name = tags.get("name")
+    if not name:
+        return None
+    return {
+        "osm_id": element["id"],
+        "name": name,
+        "lat": element["lat"],
+        "lon": element["lon"],
+        "category": categorize(tags),
+        "desc": tags.get("description", "No description available"),
+        "noise_level": 50,
+        "air_quality": 50,
+        "shade_score": 50,
+        "barrier_free_score": 50
+    }
+
+
+def _post_with_retry(query, url, retries=RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            with metrics.span("external.overpass"):
+                response = requests.post(url, data=query, stream=True, timeout=120)
+                # 429 / 504: Overpass ist ueberlastet -> spaeter nochmal
+                response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            if attempt == retries:
+                raise
+            wait = RETRY_BACKOFF * 2 ** attempt
+            print(f"Overpass request failed ({e}), retrying in {wait}s")
+            metrics.inc("overpass.retry")
+            time.sleep(wait)
 
-        category = ""
-        tags = element["tags"]
-
-        # categorizing
-        if "museum" in tags.get("amenity", "") or tags.get("tourism") == "museum":
-            category = "Art"
-        elif tags.get("historic"):
-            category = "Historical"
-        elif tags.get("leisure") == "park" or tags.get("amenity") == "park":
-            category = "Nature"
-        elif tags.get("tourism") == "attraction":
-            category = "Sight"
-        else:
-            category = "General"
-
-        rows.append({
-            "name": name,
-            "lat": element["lat"],
-            "lon": element["lon"],
-            "category": category,
-            "desc": tags.get("description", "No description available"),
-            "noise_level": 50,
-            "air_quality": 50,
-            "shade_score": 50,
-            "barrier_free_score": 50
-        })
-    df = pd.DataFrame(rows)
-    df.to_csv("places-in-munich.csv", index = False)
-    print(("CSV successfully created with", len(df), "locations."))
-if __name__ == "__main__":
-    fetch_osm_data()
 
+def fetch_tile(tile_bbox, url=OVERPASS_URL):
+    """All named POI rows of one tile, stream-parsed"""
+    response = _post_with_retry(build_query(tile_bbox), url)
+    with response:
+        rows = [element_to_row(e) for e in iter_elements(_decoded_chunks(response))]
+    return [row for row in rows if row is not None]
+
+
+def tile_changed(tile_bbox, since, url=OVERPASS_URL):
+    """True if any POI node in the tile changed after since (ISO timestamp)"""
+    response = _post_with_retry(build_query(tile_bbox, newer=since, ids_only=True), url)
+    with response:
+        return next(iter_elements(_decoded_chunks(response)), None) is not None
+
+
+def tile_ids(tile_bbox, url=OVERPASS_URL):
+    """OSM ids of all POI nodes currently in the tile (out ids: no tags, no coordinates)"""
+    response = _post_with_retry(build_query(tile_bbox, ids_only=True), url)
+    with response:
+        return {e["id"] for e in iter_elements(_decoded_chunks(response))}
+
+
+def _load_manifest(tile_dir):
+    try:
+        with open(os.path.join(tile_dir, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_tile(tile_dir, tile_id, rows, manifest, fetched_at):
+    path = os.path.join(tile_dir, f"{tile_id}.jsonl")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(path + ".tmp", path)
+    manifest[tile_id] = fetched_at
+
+
+def _read_tile(tile_dir, tile_id):
+    with open(os.path.join(tile_dir, f"{tile_id}.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def ingest(bbox=MUNICH_BBOX, incremental=False, url=OVERPASS_URL, tile_dir=TILE_DIR, output_csv=OUTPUT_CSV,
+           rows=TILE_ROWS, cols=TILE_COLS):
+    """
+    Tiled Overpass ingestion:
+    - bbox split into rows x cols tiles, fetched concurrently with retry
+    - each response stream-parsed, elements categorized
+    - per-tile results kept in tile_dir; incremental=True only refetches
+      tiles with nodes changed since their last fetch. Deleted nodes (or ones
+      retagged out of POI_FILTERS) never show up as newer, so the stored ids
+      of an unchanged tile are checked against its current ids and the ones
+      that are gone are dropped
+    - merged, deduplicated by OSM id and written in chunks to output_csv,
+      then into the POI store
+    Returns the number of places written.
+    """
+    os.makedirs(tile_dir, exist_ok=True)
+    manifest = _load_manifest(tile_dir)
+    tiles = split_bbox(bbox, rows, cols)
+    fetched_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def process(tile):
+        tile_id, tile_bbox = tile
+        have_tile = tile_id in manifest and os.path.exists(os.path.join(tile_dir, f"{tile_id}.jsonl"))
+        if not incremental or not have_tile or tile_changed(tile_bbox, manifest[tile_id], url):
+            return tile_id, fetch_tile(tile_bbox, url)
+        current = tile_ids(tile_bbox, url)
+        stored = list(_read_tile(tile_dir, tile_id))
+        kept = [row for row in stored if row["osm_id"] in current]
+        return tile_id, (kept if len(kept) < len(stored) else None)
+
+    refetched = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for tile_id, tile_rows in pool.map(process, tiles):
+            if tile_rows is not None:
+                _save_tile(tile_dir, tile_id, tile_rows, manifest, fetched_at)
+                refetched += 1
+    with open(os.path.join(tile_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    print(f"{refetched} of {len(tiles)} tiles updated.")
+
+    # zusammenfuehren: Knoten auf Kachelgrenzen kommen doppelt vor
+    seen = set()
+    buffer = []
+    count = 0
+    tmp_csv = output_csv + ".tmp"
+    if os.path.exists(tmp_csv):
+        os.remove(tmp_csv)
+
+    def flush():
+        pd.DataFrame(buffer).drop(columns="osm_id").to_csv(tmp_csv, mode="a", header=(count == len(buffer)), index=False)
+        buffer.clear()
+
+    for tile_id, _ in tiles:
+        for row in _read_tile(tile_dir, tile_id):
+            if row["osm_id"] in seen:
+                continue
+            seen.add(row["osm_id"])
+            buffer.append(row)
+            count += 1
+            if len(buffer) >= CHUNK_ROWS:
+                flush()
+    if buffer:
+        flush()
+    if count == 0:
+        print("No places found, keeping the existing CSV.")
+        return 0
+    os.replace(tmp_csv, output_csv)
+    return count
+
+
+def fetch_osm_data(incremental=False, url=OVERPASS_URL):
+    count = ingest(incremental=incremental, url=url)
+    if count == 0:
+        return
+    print(("CSV successfully created with", count, "locations."))
+    version = write_poi_store(pd.read_csv(OUTPUT_CSV))
+    print(f"POI store version {version} written.")
+    print("Run walking_matrix.py to prebuild its walking matrix (otherwise built in the background on first use).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch Munich POIs from Overpass")
+    parser.add_argument("--incremental", action="store_true", help="only refetch tiles that changed")
+    parser.add_argument("--url", default=OVERPASS_URL, help="Overpass endpoint, e.g. a local fake_overpass.py")
+    args = parser.parse_args()
+    fetch_osm_data(incremental=args.incremental, url=args.url)
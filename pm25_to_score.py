@@ -11,3 +11,20 @@ def pm25_to_score(pm25):
     score = max(0, min(100, int(100 - (pm25 / 75) * 100)))
     return score
 
+
+def quality_category(pm25):
+    """
+    PM2.5 (µg/m³) -> category label, same thresholds as the map legend.
+    :param pm25:
+    :return:
+    """
+    if pm25 is None:
+        return "Unknown"
+    if pm25 < 12:
+        return "Good"
+    elif pm25 < 35:
+        return "Moderate"
+    elif pm25 < 55:
+        return "Sensitive"
+    else:
+        return "Unhealthy"
@@ -0,0 +1,153 @@
+"""
+Columnar POI store: one memory-mapped .npy file per column.
+
+    places/CURRENT              -> name of the current version directory
+    places/<version>/meta.json  -> row count, categories, column list
+    places/<version>/lat.npy    -> float32 (lon.npy likewise)
+    places/<version>/category.npy -> int16 codes into meta["categories"]
+    places/<version>/name.bin + name_offsets.npy -> UTF-8 blob (desc likewise)
+
+    python poi_store.py         # convert places-in-munich.csv into the store
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+POI_STORE_DIR = os.environ.get("CITYTOUR_POI_STORE", "places")
+PLACES_CSV = "places-in-munich.csv"
+# Textspalten als Blob + Offsets; desc wird erst bei Bedarf gelesen
+TEXT_COLUMNS = ("name", "desc")
+
+
+def _write_text(directory, name, values):
+    encoded = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+
+def write_poi_store(df, directory=POI_STORE_DIR):
+    """
+    Writes df (name, lat, lon, category, desc, numeric scores) as a new version
+    and switches CURRENT to it with an atomic rename. Returns the version.
+    """
+    csv_bytes = df.to_csv(index=False).encode("utf-8")
+    version = hashlib.sha1(csv_bytes).hexdigest()[:12]
+    version_dir = os.path.join(directory, version)
+    if not os.path.exists(os.path.join(version_dir, "meta.json")):
+        _write_version(df, version, version_dir)
+
+    tmp_current = os.path.join(directory, "CURRENT.tmp")
+    with open(tmp_current, "w") as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(directory, "CURRENT"))
+    return version
+
+
+def _write_version(df, version, version_dir):
+    # existing versions are never rewritten, running readers may have them mapped
+    os.makedirs(version_dir, exist_ok=True)
+
+    np.save(os.path.join(version_dir, "lat.npy"), df['lat'].to_numpy(dtype=np.float32))
+    np.save(os.path.join(version_dir, "lon.npy"), df['lon'].to_numpy(dtype=np.float32))
+
+    category = pd.Categorical(df['category'].fillna(""))
+    np.save(os.path.join(version_dir, "category.npy"), category.codes.astype(np.int16))
+
+    for name in TEXT_COLUMNS:
+        if name in df.columns:
+            _write_text(version_dir, name, df[name].fillna(""))
+
+    numeric = [c for c in df.columns
+               if c not in TEXT_COLUMNS + ("lat", "lon", "category") and pd.api.types.is_numeric_dtype(df[c])]
+    for name in numeric:
+        np.save(os.path.join(version_dir, f"{name}.npy"), df[name].to_numpy())
+
+    meta = {
+        "version": version,
+        "rows": len(df),
+        "categories": [str(c) for c in category.categories],
+        "text_columns": [c for c in TEXT_COLUMNS if c in df.columns],
+        "numeric_columns": numeric,
+    }
+    # meta.json last: a version directory without it is incomplete
+    with open(os.path.join(version_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+class TextColumn:
+    """UTF-8 strings in one memory-mapped blob, decoded only when accessed"""
+
+    def __init__(self, directory, name):
+        blob_path = os.path.join(directory, f"{name}.bin")
+        # np.memmap kann keine leeren Dateien mappen
+        if os.path.getsize(blob_path):
+            self._blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.empty(0, dtype=np.uint8)
+        self._offsets = np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode("utf-8")
+
+    def to_list(self):
+        return [self[i] for i in range(len(self))]
+
+
+class PoiStore:
+    """Read-only view on the current version of the POI store"""
+
+    def __init__(self, directory=POI_STORE_DIR):
+        with open(os.path.join(directory, "CURRENT")) as f:
+            self.version = f.read().strip()
+        self.path = os.path.join(directory, self.version)
+        with open(os.path.join(self.path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+        self.lat = np.load(os.path.join(self.path, "lat.npy"), mmap_mode="r")
+        self.lon = np.load(os.path.join(self.path, "lon.npy"), mmap_mode="r")
+        self.category_codes = np.load(os.path.join(self.path, "category.npy"), mmap_mode="r")
+        self.categories = self.meta["categories"]
+        self.text = {name: TextColumn(self.path, name) for name in self.meta["text_columns"]}
+        self._df = None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def desc(self, poi_id):
+        """Description of one POI, read lazily from the mapped blob"""
+        if "desc" not in self.text:
+            return "No description available"
+        return self.text["desc"][int(poi_id)]
+
+    def to_dataframe(self):
+        """
+        DataFrame of all POIs without desc (see desc()); built once per store.
+        lat/lon/scores wrap the memory maps without copying, category is a
+        Categorical on the stored codes, poi_id is the row position.
+        """
+        if self._df is None:
+            columns = {
+                "poi_id": np.arange(len(self), dtype=np.int32),
+                "name": self.text["name"].to_list() if "name" in self.text else [""] * len(self),
+                "lat": self.lat,
+                "lon": self.lon,
+                "category": pd.Categorical.from_codes(self.category_codes, categories=self.categories),
+            }
+            for name in self.meta["numeric_columns"]:
+                columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            self._df = pd.DataFrame(columns, copy=False)
+        return self._df
+
+
+if __name__ == "__main__":
+    version = write_poi_store(pd.read_csv(PLACES_CSV))
+    print(f"POI store written to {POI_STORE_DIR}/{version}")
@@ -0,0 +1,306 @@
+"""
+On-demand profiling of single app reruns.
+
+    CITYTOUR_PROFILE=5 streamlit run app.py          # the next 5 reruns of any session
+    CITYTOUR_PROFILE_TOKEN=s3cret streamlit run app.py
+        -> https://.../?profile=5&profile_token=s3cret   # the next 5 reruns of this session
+
+Each profiled run writes to profiles/ (CITYTOUR_PROFILE_DIR):
+
+    <run>.folded     sampled stacks, one "frame;frame;... count" line each
+                     (flamegraph.pl, speedscope, inferno)
+    <run>.top.txt    functions by own / total samples
+    <run>.alloc.txt  tracemalloc: peak, top allocations by line and by stack
+
+<run> is <time>-<pid>-<n>-<label>, label "rerun" for a whole script run or
+"render_map_section" for a fragment rerun.
+
+Safe to leave switched on: nothing runs unless a run is requested, the
+query parameter only works with a configured token, one profile runs at a
+time per process (others are skipped, not queued), a profile stops itself
+after MAX_SECONDS and only the newest KEEP_PROFILES runs stay on disk.
+The sampler reads the profiled thread's stack every SAMPLE_INTERVAL from
+its own thread, so the rerun itself is not traced call by call.
+"""
+import functools
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILE_DIR = os.environ.get("CITYTOUR_PROFILE_DIR", "profiles")
+PROFILE_RUNS = int(os.environ.get("CITYTOUR_PROFILE", 0) or 0)
+PROFILE_TOKEN = os.environ.get("CITYTOUR_PROFILE_TOKEN", "")
+MAX_RUNS = 20
+MAX_SECONDS = 60
+SAMPLE_INTERVAL = 0.005
+TOP_ENTRIES = 25
+TRACEMALLOC_FRAMES = 16
+KEEP_PROFILES = 50
+
+# Schluessel im Session State
+RUNS_KEY = "_profile_runs"
+ARMED_KEY = "_profile_armed"
+ACTIVE_KEY = "_profile_active"
+
+_lock = threading.Lock()  # ein Profil gleichzeitig pro Prozess
+_env_lock = threading.Lock()
+_env_remaining = min(PROFILE_RUNS, MAX_RUNS)
+_active_threads = set()
+_sequence = itertools.count(1)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """
+    Counts the stacks of one thread every interval seconds until stop().
+    If it ends on its own (max_seconds passed, thread gone) it calls on_done.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL, max_seconds=MAX_SECONDS, on_done=None):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.on_done = on_done
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or time.monotonic() > deadline:
+                if self.on_done is not None:
+                    threading.Thread(target=self.on_done, name="profile-done", daemon=True).start()
+                return
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        if self is not threading.current_thread():
+            self.join()
+
+
+class Profile:
+    """
+    One profiled run of the calling thread: start() ... stop().
+    stop() is idempotent and returns the written paths ([] if nothing was recorded).
+    """
+
+    def __init__(self, label, directory=PROFILE_DIR):
+        self.label = label
+        self.directory = directory
+        self.paths = []
+        self.started = False
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+        self._thread_id = None
+        self._sampler = None
+        self._owns_tracemalloc = False
+        self._start_snapshot = None
+        self._start_time = None
+
+    def start(self):
+        """False if another profile is running in this process"""
+        if not _lock.acquire(blocking=False):
+            return False
+        self.started = True
+        self._thread_id = threading.get_ident()
+        _active_threads.add(self._thread_id)
+        self._start_time = time.time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start_snapshot = tracemalloc.take_snapshot()
+        self._sampler = Sampler(self._thread_id, on_done=self.stop)
+        self._sampler.start()
+        return True
+
+    def stop(self):
+        with self._stop_lock:
+            if not self.started or self._stopped:
+                return self.paths
+            self._stopped = True
+        try:
+            self._sampler.stop()
+            duration = time.time() - self._start_time
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            self.paths = self._write(duration, peak, snapshot)
+        except Exception as e:
+            print(f"Writing profile {self.label} failed: {e}")
+        finally:
+            _active_threads.discard(self._thread_id)
+            _lock.release()
+        return self.paths
+
+    def _write(self, duration, peak, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._start_time))
+        base = os.path.join(self.directory, f"{stamp}-{os.getpid()}-{next(_sequence)}-{self.label}")
+        stacks = self._sampler.stacks
+
+        folded = "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+        own = Counter()
+        total = Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        samples = sum(stacks.values()) or 1
+        top = [f"{self.label}: {duration * 1000:.0f} ms, {sum(stacks.values())} samples "
+               f"every {SAMPLE_INTERVAL * 1000:.0f} ms", "", "own %   total %  function"]
+        for name, count in own.most_common(TOP_ENTRIES):
+            top.append(f"{count / samples * 100:5.1f}   {total[name] / samples * 100:6.1f}   {name}")
+        top += ["", "total %  function"]
+        for name, count in total.most_common(TOP_ENTRIES):
+            top.append(f"{count / samples * 100:6.1f}   {name}")
+
+        # nur was waehrend des Laufs dazukam; Dateien des Profilers selbst ausblenden
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = snapshot.filter_traces(filters).compare_to(self._start_snapshot.filter_traces(filters), "lineno")
+        alloc = [f"{self.label}: peak {peak / 2 ** 20:.1f} MB traced", "",
+                 f"top {TOP_ENTRIES} allocations by line (still alive at the end of the run):"]
+        alloc += [f"  {stat}" for stat in diff[:TOP_ENTRIES] if stat.size_diff > 0]
+        alloc += ["", "top 5 allocation stacks:"]
+        stack_diff = snapshot.filter_traces(filters).compare_to(
+            self._start_snapshot.filter_traces(filters), "traceback")
+        for stat in stack_diff[:5]:
+            if stat.size_diff <= 0:
+                continue
+            alloc.append(f"  {stat.size_diff / 1024:.1f} KiB in {stat.count_diff} blocks")
+            alloc += [f"    {line}" for line in stat.traceback.format(most_recent_first=True)]
+
+        paths = []
+        for suffix, text in ((".folded", folded), (".top.txt", "\n".join(top) + "\n"),
+                             (".alloc.txt", "\n".join(alloc) + "\n")):
+            path = base + suffix
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            paths.append(path)
+        _prune(self.directory)
+        print(f"Profile written: {base}.*")
+        return paths
+
+
+def _prune(directory, keep=KEEP_PROFILES):
+    """Deletes all but the newest keep runs (3 files each)"""
+    runs = sorted({f.rsplit(".", 2)[0] if f.endswith(".txt") else f.rsplit(".", 1)[0]
+                   for f in os.listdir(directory) if not f.endswith(".tmp")})
+    for run in runs[:-keep]:
+        for suffix in (".folded", ".top.txt", ".alloc.txt"):
+            try:
+                os.remove(os.path.join(directory, run + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def _arm(state, params):
+    """?profile=N&profile_token=... arms N runs of this session, once per distinct value"""
+    if not PROFILE_TOKEN or params is None:
+        return
+    value = params.get("profile")
+    token = params.get("profile_token") or ""
+    if not value or not hmac.compare_digest(token, PROFILE_TOKEN) or state.get(ARMED_KEY) == value:
+        return
+    state[ARMED_KEY] = value
+    state[RUNS_KEY] = min(int(value), MAX_RUNS) if value.isdigit() else 1
+
+
+def _take(state):
+    """Consumes one requested run (session first, then CITYTOUR_PROFILE); returns a give-back callable or None"""
+    global _env_remaining
+    if state is not None and state.get(RUNS_KEY, 0) > 0:
+        state[RUNS_KEY] -= 1
+
+        def give_back():
+            state[RUNS_KEY] = state.get(RUNS_KEY, 0) + 1
+        return give_back
+    with _env_lock:
+        if _env_remaining > 0:
+            _env_remaining -= 1
+
+            def give_back():
+                global _env_remaining
+                with _env_lock:
+                    _env_remaining += 1
+            return give_back
+    return None
+
+
+def start_run(label, state=None, params=None):
+    """
+    Starts a Profile of the calling thread if a run was requested (state: the
+    session state, params: the query parameters), else returns None.
+    """
+    if state is not None:
+        _arm(state, params)
+    if threading.get_ident() in _active_threads:
+        return None  # laeuft schon, z. B. Fragment innerhalb eines profilierten Reruns
+    give_back = _take(state)
+    if give_back is None:
+        return None
+    profile = Profile(label)
+    if not profile.start():
+        give_back()  # anderes Profil aktiv -> beim naechsten Lauf nochmal
+        return None
+    return profile
+
+
+def begin_rerun(state, params=None):
+    """
+    start_run for a whole script rerun, called at the top of the script.
+    A profile of the previous rerun that never reached finish() (st.rerun,
+    st.stop) is written first.
+    """
+    leftover = state.get(ACTIVE_KEY)
+    if leftover is not None:
+        state[ACTIVE_KEY] = None
+        leftover.stop()
+    profile = start_run("rerun", state, params)
+    if profile is not None:
+        state[ACTIVE_KEY] = profile
+    return profile
+
+
+def finish(profile, state=None):
+    if profile is None:
+        return []
+    if state is not None and state.get(ACTIVE_KEY) is profile:
+        state[ACTIVE_KEY] = None
+    return profile.stop()
+
+
+def profiled(label, get_state=None):
+    """Decorator: profiles a call if a run was requested; get_state() returns the session state"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _env_remaining and get_state is None:
+                return func(*args, **kwargs)
+            state = get_state() if get_state is not None else None
+            profile = start_run(label, state)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                finish(profile, state)
+        return wrapper
+    return decorate
@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import threading
+import time
+
+import polyline
+import requests
+
+from metrics import metrics
+from singleflight import group
+from walk_graph import get_walk_graph
+
+OSRM_BASE_URL = os.environ.get("CITYTOUR_OSRM_URL", "http://router.project-osrm.org")
+OSRM_URL = f"{OSRM_BASE_URL}/route/v1/foot"
+OSRM_TIMEOUT = 2
+# "osrm": OSRM first, local walking graph as fallback; "local": only the local graph
+ROUTER = os.environ.get("CITYTOUR_ROUTER", "osrm")
+DEFAULT_DB_PATH = os.environ.get("CITYTOUR_ROUTE_CACHE_DB", "route_cache.db")
+# Legs aus dem lokalen Graphen nur so lange und nur im Speicher: danach wieder OSRM versuchen
+LOCAL_LEG_TTL = 300
+
+# Sessions, die gleichzeitig dieselben Legs brauchen, teilen sich eine Abfrage
+_flight = group("osrm_route")
+
+
+def leg_key(a, b):
+    """Cache key of the leg a -> b, coordinates rounded to ~10 cm"""
+    return f"{a[0]:.6f},{a[1]:.6f};{b[0]:.6f},{b[1]:.6f}"
+
+
+class RouteCache:
+    """
+    Persistent store of walking legs between two stops.
+    Each leg geometry is kept as an encoded polyline in SQLite (and in a
+    dict in front of it), so routes that share legs reuse them and the
+    cache survives restarts. db_path=":memory:" keeps it process-local.
+    Legs put with a ttl (offline walking graph) stay in the dict only.
+    The database is opened on first use, importing the module creates no file.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._legs = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def _db(self):
+        # nur unter self._lock aufrufen
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS legs ("
+                " key TEXT PRIMARY KEY, geometry TEXT, fetched_at REAL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, a, b):
+        """Encoded polyline of the leg a -> b, or None"""
+        return self.lookup(a, b)[0]
+
+    def lookup(self, a, b):
+        """(encoded polyline or None, source): "local" for legs put with a ttl, else "osrm" """
+        key = leg_key(a, b)
+        with self._lock:
+            if key in self._expires and time.time() >= self._expires[key]:
+                del self._expires[key]
+                del self._legs[key]
+            encoded = self._legs.get(key)
+            if encoded is None:
+                row = self._db.execute("SELECT geometry FROM legs WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    encoded = row[0]
+                    self._legs[key] = encoded
+            if encoded is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return encoded, "local" if key in self._expires else "osrm"
+
+    def put(self, a, b, encoded, ttl=None):
+        """Stores the leg a -> b; with ttl only in memory and for ttl seconds"""
+        key = leg_key(a, b)
+        with self._lock:
+            self._legs[key] = encoded
+            if ttl is not None:
+                self._expires[key] = time.time() + ttl
+                return
+            self._expires.pop(key, None)
+            self._db.execute("INSERT OR REPLACE INTO legs VALUES (?, ?, ?)", (key, encoded, time.time()))
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._legs)}
+
+
+route_cache = RouteCache()
+
+
+def fetch_osrm_legs(locations, timeout=OSRM_TIMEOUT):
+    """
+    One OSRM request through all locations (lat, lon).
+    Returns one [(lat, lon), ...] geometry per leg, built from the leg's steps.
+    """
+    loc_string = ";".join([f"{lon},{lat}" for lat, lon in locations])
+    url = f"{OSRM_URL}/{loc_string}?overview=false&steps=true&geometries=polyline"
+    with metrics.span("external.osrm_route"):
+        r = requests.get(url, timeout=timeout)
+        r.raise_for_status()
+    res = r.json()
+
+    legs = []
+    for leg in res['routes'][0]['legs']:
+        coords = []
+        for step in leg['steps']:
+            decoded = polyline.decode(step['geometry'])
+            # Schritte teilen sich den Endpunkt mit dem naechsten Schritt
+            if coords and decoded and coords[-1] == decoded[0]:
+                decoded = decoded[1:]
+            coords.extend(decoded)
+        legs.append(coords)
+    if len(legs) != len(locations) - 1:
+        raise ValueError(f"expected {len(locations) - 1} legs, got {len(legs)}")
+    return legs
+
+
+def route_legs(locations):
+    """
+    Leg geometries through locations and where they came from ("osrm" or
+    "local", the offline walking graph of walk_graph.py) depending on ROUTER.
+    Raises if neither can route them.
+    """
+    error = None
+    if ROUTER != "local":
+        try:
+            return fetch_osrm_legs(locations), "osrm"
+        except Exception as e:
+            error = e
+
+    graph = get_walk_graph()
+    if graph is not None:
+        legs = [graph.route_leg(a, b) for a, b in zip(locations[:-1], locations[1:])]
+        if all(leg is not None for leg in legs):
+            return legs, "local"
+        error = ValueError("no walking path in the local graph")
+    raise error or ValueError("no local walking graph, run walk_graph.py first")
+
+
+def get_route_legs(locations, cache=route_cache):
+    """
+    Leg geometries [[(lat, lon), ...], ...] between consecutive locations.
+    Legs come from the cache; only runs of consecutive missing legs are routed
+    (one OSRM request per run, see route_legs; concurrent callers routing the
+    same run share that request). Legs from the local walking graph are cached
+    for LOCAL_LEG_TTL seconds only, legs that cannot be routed are straight
+    lines and not cached.
+    """
+    return route_legs_with_sources(locations, cache)[0]
+
+
+def route_legs_with_sources(locations, cache=route_cache):
+    """get_route_legs plus the source of every leg: "osrm", "local" or "straight" """
+    locations = [tuple(loc) for loc in locations]
+    pairs = list(zip(locations[:-1], locations[1:]))
+    found = [cache.lookup(a, b) for a, b in pairs]
+    legs = [polyline.decode(encoded) if encoded is not None else None for encoded, _ in found]
+    sources = [source for _, source in found]
+
+    i = 0
+    while i < len(pairs):
+        if legs[i] is not None:
+            i += 1
+            continue
+        j = i
+        while j < len(pairs) and legs[j] is None:
+            j += 1
+        # Legs i..j-1 fehlen -> Wegpunkte i..j in einer Abfrage
+        try:
+            key = (id(cache),) + tuple(leg_key(a, b) for a, b in pairs[i:j])
+            fetched, source = _flight.do(key, _route_and_store, locations[i:j + 1], cache)
+            legs[i:j] = fetched
+            sources[i:j] = [source] * (j - i)
+        except Exception as e:
+            print(f"Routing failed for legs {i}-{j - 1}, drawing straight lines: {e}")
+            metrics.inc("route.fallback_legs", j - i)
+            for k in range(i, j):
+                legs[k] = list(pairs[k])
+                sources[k] = "straight"
+        i = j
+    return legs, sources
+
+
+def _route_and_store(locations, cache):
+    legs, source = route_legs(locations)
+    ttl = LOCAL_LEG_TTL if source == "local" else None
+    for a, b, coords in zip(locations[:-1], locations[1:], legs):
+        cache.put(a, b, polyline.encode(coords), ttl)
+    return legs, source
+
+
+def join_legs(legs):
+    """Leg geometries -> one [[lon, lat], ...] path for the PathLayer"""
+    path = []
+    for coords in legs:
+        if path and coords and tuple(path[-1]) == tuple(coords[0]):
+            coords = coords[1:]
+        path.extend(coords)
+    return [[lon, lat] for lat, lon in path]
+
+
+def get_osrm_route(locations, cache=route_cache):
+    """
+    Walking route through locations [(lat, lon), ...] as [[lon, lat], ...] for the PathLayer.
+    See get_route_legs for caching and fallbacks.
+    """
+    locations = [tuple(loc) for loc in locations]
+    if not locations: return []
+    if len(locations) == 1:
+        return [[locations[0][1], locations[0][0]]]
+    return join_legs(get_route_legs(locations, cache))
@@ -0,0 +1,139 @@
+import time
+
+import numpy as np
+
+# Verbesserungen kleiner als das ignorieren (Rundungsrauschen)
+EPS = 1e-9
+
+
+def tour_length(order, dist):
+    """Total length of an open path visiting order, in the units of dist"""
+    order = np.asarray(order, dtype=np.int64)
+    if len(order) < 2:
+        return 0.0
+    return float(dist[order[:-1], order[1:]].sum())
+
+
+def _with_dummy(dist):
+    """
+    Append a dummy node with zero distance to every other node.
+    A free start or end is modelled as a fixed dummy endpoint, so the
+    improvement moves only ever deal with paths whose ends are fixed.
+    """
+    n = len(dist)
+    ext = np.zeros((n + 1, n + 1), dtype=np.float64)
+    ext[:n, :n] = dist
+    return ext, n
+
+
+def nearest_neighbour(dist, head, inner):
+    """Greedy construction: from head, always walk to the closest unvisited inner node"""
+    inner = np.asarray(inner, dtype=np.int64)
+    remaining = np.ones(len(inner), dtype=bool)
+    path = []
+    current = head
+    for _ in range(len(inner)):
+        row = np.where(remaining, dist[current, inner], np.inf)
+        nxt = int(row.argmin())
+        remaining[nxt] = False
+        current = int(inner[nxt])
+        path.append(current)
+    return path
+
+
+def two_opt(seq, dist, deadline):
+    """
+    2-opt on a path with fixed first and last node: reverse seq[i:j+1]
+    whenever that shortens the path. Returns True if anything changed.
+    """
+    m = len(seq)
+    improved = False
+    for i in range(1, m - 2):
+        if time.perf_counter() > deadline:
+            break
+        a, b = seq[i - 1], seq[i]
+        c = seq[i + 1:m - 1]
+        nxt = seq[i + 2:m]
+        delta = dist[a, c] + dist[b, nxt] - dist[a, b] - dist[c, nxt]
+        k = int(delta.argmin())
+        if delta[k] < -EPS:
+            j = i + 1 + k
+            seq[i:j + 1] = seq[i:j + 1][::-1].copy()
+            improved = True
+    return improved
+
+
+def or_opt(seq, dist, deadline, max_segment=3):
+    """
+    Or-opt on a path with fixed first and last node: move a segment of
+    1..max_segment nodes (optionally reversed) to its cheapest position.
+    Returns True if anything changed.
+    """
+    improved = False
+    for seg_len in range(1, max_segment + 1):
+        i = 1
+        while i + seg_len <= len(seq) - 1:
+            if time.perf_counter() > deadline:
+                return improved
+            prev, nxt = seq[i - 1], seq[i + seg_len]
+            first, last = seq[i], seq[i + seg_len - 1]
+            gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+            rest = np.concatenate([seq[:i], seq[i + seg_len:]])
+            p, q = rest[:-1], rest[1:]
+            cost_fwd = dist[p, first] + dist[last, q] - dist[p, q]
+            cost_rev = dist[p, last] + dist[first, q] - dist[p, q]
+            k_fwd = int(cost_fwd.argmin())
+            k_rev = int(cost_rev.argmin())
+
+            if cost_rev[k_rev] < cost_fwd[k_fwd]:
+                k, cost, segment = k_rev, cost_rev[k_rev], seq[i:i + seg_len][::-1]
+            else:
+                k, cost, segment = k_fwd, cost_fwd[k_fwd], seq[i:i + seg_len]
+
+            if cost - gain < -EPS:
+                seq[:] = np.concatenate([rest[:k + 1], segment, rest[k + 1:]])
+                improved = True
+            else:
+                i += 1
+    return improved
+
+
+def improve_path(seq, dist, deadline):
+    """Alternates 2-opt and Or-opt on seq (fixed ends) until neither helps or the deadline passes"""
+    while time.perf_counter() < deadline:
+        changed = two_opt(seq, dist, deadline)
+        changed = or_opt(seq, dist, deadline) or changed
+        if not changed:
+            break
+    return seq
+
+
+def solve_tour(dist, start=None, end=None, time_budget=0.05):
+    """
+    Order all nodes of a distance matrix into a short open path.
+    - start / end: optional fixed first / last node (same node = round trip)
+    - time_budget: wall-clock seconds for the 2-opt / Or-opt improvement,
+      None = until no move helps (deterministic, for benchmarks and tests)
+    Returns (order, total_length).
+    """
+    dist = np.asarray(dist, dtype=np.float64)
+    n = len(dist)
+    if n == 0:
+        return [], 0.0
+    if n == 1:
+        return [0], 0.0
+
+    deadline = time.perf_counter() + time_budget if time_budget is not None else float("inf")
+    ext, dummy = _with_dummy(dist)
+    head = dummy if start is None else start
+    tail = dummy if end is None else end
+    inner = [i for i in range(n) if i != start and i != end]
+
+    seq = np.array([head] + nearest_neighbour(ext, head, inner) + [tail], dtype=np.int64)
+
+    improve_path(seq, ext, deadline)
+
+    # bei start == end (Rundweg) steht der Startpunkt am Anfang und am Ende
+    order = [int(i) for i in seq if i != dummy]
+    return order, tour_length(order, dist)
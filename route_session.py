@@ -0,0 +1,185 @@
+"""
+Stateful guided tour.
+
+The tour is optimized once; afterwards stops are visited, skipped or added
+with local moves (removal / cheapest insertion plus a few milliseconds of
+2-opt / Or-opt from the current anchor) instead of re-solving everything.
+Leg geometries and AQ values are kept per stop pair / stop, so a change
+only fetches the legs that did not exist before; fallback legs (straight
+lines, offline walking graph) only until they are worth routing again.
+"""
+import math
+import time
+
+import numpy as np
+
+from route_cache import LOCAL_LEG_TTL, join_legs, route_legs_with_sources
+from route_optimizer import improve_path, solve_tour, tour_length
+
+# Zeitbudget fuer die lokale Verbesserung nach einer Aenderung (Sekunden)
+REOPTIMIZE_BUDGET = 0.005
+# AQ-Werte der Stopps so lange wiederverwenden (Sekunden)
+AQ_MAX_AGE = 900
+# Luftlinien-Ersatz fuer nicht routbare Legs nach so vielen Sekunden erneut versuchen
+LEG_RETRY_AFTER = 300
+# Ersatz-Legs pro Quelle so lange behalten, danach neu routen (OSRM-Legs bleiben)
+FALLBACK_LEG_TTL = {"straight": LEG_RETRY_AFTER, "local": LOCAL_LEG_TTL}
+
+
+class RouteSession:
+    """
+    Tour over a fixed set of candidate stops (positions 0..n-1 into lats / lons / dist).
+    - order: remaining stops in walking order
+    - anchor: position of the last visited stop (where the user is), or None before the first visit
+    - visited / skipped: stops taken out of the tour
+    - version: bumped on every change
+    - walking: dist are walking distances (not straight lines)
+    """
+
+    def __init__(self, lats, lons, dist, start=None, time_budget=0.05, walking=False):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.dist = np.asarray(dist, dtype=np.float64)
+        n = len(self.dist)
+        # Dummy-Knoten n mit Abstand 0 zu allen: freies Tour-Ende
+        self._ext = np.pad(self.dist, ((0, 1), (0, 1)))
+        self._dummy = n
+
+        self.order = solve_tour(self.dist, start=start, time_budget=time_budget)[0] if n else []
+        self.walking = walking
+        self.anchor = None
+        self.visited = []
+        self.skipped = set()
+        self.version = 0
+        self.legs_fetched = 0
+        self._legs = {}
+        self._leg_expires = {}  # pair -> Zeitpunkt, ab dem ein Ersatz-Leg neu geroutet wird
+        self._aq = {}
+        self._aq_fetched_at = 0.0
+
+    def __len__(self):
+        return len(self.order)
+
+    def _head(self):
+        return self.anchor if self.anchor is not None else (self.order[0] if self.order else None)
+
+    def _reoptimize(self, budget=REOPTIMIZE_BUDGET):
+        """Local 2-opt / Or-opt with the head fixed and a free end, a few milliseconds at most"""
+        head = self._head()
+        if head is None:
+            self.version += 1
+            return
+        inner = [p for p in self.order if p != head]
+        if len(inner) >= 2:
+            seq = np.array([head] + inner + [self._dummy], dtype=np.int64)
+            improve_path(seq, self._ext, time.perf_counter() + budget)
+            inner = [int(p) for p in seq[1:-1]]
+        self.order = inner if self.anchor is not None else [head] + inner
+        self.version += 1
+
+    def set_distances(self, dist, walking=True, time_budget=0.05):
+        """
+        Switches to a new distance matrix over the same stops (walking distances
+        that became available mid-tour) and re-optimizes only the remaining
+        stops from the current head. Visits, skips, anchor and legs are kept.
+        """
+        self.dist = np.asarray(dist, dtype=np.float64)
+        self._ext = np.pad(self.dist, ((0, 1), (0, 1)))
+        self.walking = walking
+        self._reoptimize(time_budget)
+
+    def visit(self, pos):
+        """The user reached stop pos: it leaves the tour and becomes the new anchor"""
+        if pos in self.order:
+            self.order.remove(pos)
+        self.visited.append(pos)
+        self.anchor = pos
+        self._reoptimize()
+
+    def skip(self, pos):
+        """Drops stop pos from the tour; the neighbours are joined and the tour locally repaired"""
+        if pos not in self.order:
+            return
+        self.order.remove(pos)
+        self.skipped.add(pos)
+        self._reoptimize()
+
+    def add(self, pos):
+        """Puts stop pos back into the tour at its cheapest insertion point"""
+        if pos in self.order:
+            return
+        self.skipped.discard(pos)
+        path = self.route()
+        if not path:
+            self.order = [pos]
+        else:
+            d = self.dist
+            a, b = np.array(path[:-1], dtype=np.int64), np.array(path[1:], dtype=np.int64)
+            costs = np.append(d[a, pos] + d[pos, b] - d[a, b], d[path[-1], pos])
+            k = int(costs.argmin())
+            # Position k im Pfad -> Index in order (der Anker steht nicht in order)
+            offset = 1 if self.anchor is not None else 0
+            self.order.insert(k + 1 - offset, pos)
+        self._reoptimize()
+
+    def route(self):
+        """Stop positions the path is drawn through: anchor (if any) and the remaining stops"""
+        return ([self.anchor] if self.anchor is not None else []) + list(self.order)
+
+    def length(self):
+        return tour_length(self.route(), self.dist)
+
+    def path(self, get_legs=route_legs_with_sources):
+        """
+        Walking path [[lon, lat], ...] through route(). Only legs this session
+        has not seen yet (or whose fallback has expired, see FALLBACK_LEG_TTL)
+        are requested, runs of them in one call; get_legs returns (legs, sources).
+        """
+        stops = self.route()
+        if not stops:
+            return []
+        if len(stops) == 1:
+            return [[float(self.lons[stops[0]]), float(self.lats[stops[0]])]]
+
+        pairs = list(zip(stops[:-1], stops[1:]))
+        now = time.time()
+
+        def missing(pair):
+            if pair not in self._legs and pair[::-1] in self._legs:
+                # Fusswege sind symmetrisch: Rueckrichtung wiederverwenden
+                self._legs[pair] = self._legs[pair[::-1]][::-1]
+                if pair[::-1] in self._leg_expires:
+                    self._leg_expires[pair] = self._leg_expires[pair[::-1]]
+            return pair not in self._legs or now >= self._leg_expires.get(pair, math.inf)
+
+        i = 0
+        while i < len(pairs):
+            if not missing(pairs[i]):
+                i += 1
+                continue
+            j = i
+            while j < len(pairs) and missing(pairs[j]):
+                j += 1
+            run = [(float(self.lats[p]), float(self.lons[p])) for p in stops[i:j + 1]]
+            legs, sources = get_legs(run)
+            for pair, coords, source in zip(pairs[i:j], legs, sources):
+                self._legs[pair] = coords
+                ttl = FALLBACK_LEG_TTL.get(source)
+                if ttl is not None:
+                    self._leg_expires[pair] = now + ttl
+                else:
+                    self._leg_expires.pop(pair, None)
+            self.legs_fetched += j - i
+            i = j
+        return join_legs([self._legs[pair] for pair in pairs])
+
+    def air_quality(self, fetch_many, max_age=AQ_MAX_AGE):
+        """AQ dicts (or None) for the remaining stops; fetched for new stops, all again after max_age"""
+        if time.time() - self._aq_fetched_at > max_age:
+            self._aq = {}
+            self._aq_fetched_at = time.time()
+        missing = [p for p in self.order if p not in self._aq]
+        if missing:
+            results = fetch_many([(float(self.lats[p]), float(self.lons[p])) for p in missing])
+            self._aq.update(zip(missing, results))
+        return [self._aq[p] for p in self.order]
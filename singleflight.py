@@ -0,0 +1,114 @@
+"""
+Single-flight: concurrent calls for the same key share one execution.
+
+When a tour group starts at the same landmark every session asks for the
+same AQ cell, route legs and audio at once. The first caller of a key runs
+the call, everybody arriving while it is in flight waits for it and gets
+the same result (or the same exception). Nothing is kept afterwards -
+caching stays with aq_cache, route_cache and tts_cache.
+
+The process-wide groups (group(name)) are exported through metrics as
+citytour_singleflight_<stat>{singleflight="<name>"}, dedup_ratio being the
+share of calls that did not go out themselves.
+"""
+import threading
+
+from metrics import metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    do(key, fn, *args) runs fn(*args) unless a call for key is already in
+    flight, in which case it waits for that call and returns its result.
+    Results must be treated as read-only: all callers share the object.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.max_waiters = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        return self.do_timeout(key, None, fn, *args, **kwargs)
+
+    def do_timeout(self, key, timeout, fn, *args, **kwargs):
+        """
+        Like do(), but a caller that waits for somebody else's call gives up
+        after timeout seconds with TimeoutError (the call itself goes on).
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            if call is None:
+                call = self._in_flight[key] = _Call()
+                self.executions += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                leader = False
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"no shared result for {key!r} within {timeout:.2f} s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            shared = self.calls - self.executions
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "shared": shared,
+                "dedup_ratio": shared / self.calls if self.calls else 0.0,
+                "max_waiters": self.max_waiters,
+                "in_flight": len(self._in_flight),
+            }
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def group(name):
+    """The process-wide SingleFlight called name (created on first use)"""
+    with _groups_lock:
+        flight = _groups.get(name)
+        if flight is None:
+            flight = _groups[name] = SingleFlight()
+        return flight
+
+
+def stats():
+    """{group name: stats} of all process-wide groups"""
+    with _groups_lock:
+        groups = list(_groups.items())
+    return {name: flight.stats() for name, flight in groups}
+
+
+metrics.register("singleflight", stats)
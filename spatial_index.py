@@ -0,0 +1,106 @@
+import numpy as np
+
+from distance import EARTH_RADIUS_KM, distances_km
+
+
+class SpatialIndex:
+    """
+    Uniform lat/lon grid over a fixed set of points (places, landmarks).
+    Points are projected to local km around the mean latitude, bucketed into
+    square cells of cell_size_km and sorted by cell id, so a query only looks
+    at the handful of cells that overlap the search circle.
+    Positions returned by the queries are row positions of the input arrays.
+    """
+
+    def __init__(self, lats, lons, cell_size_km=0.25):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_size_km = cell_size_km
+
+        if len(self.lats) == 0:
+            self._lat0 = 0.0
+            self._x0 = self._y0 = 0.0
+            self._nx = self._ny = 1
+            self._keys = np.empty(0, dtype=np.int64)
+            self._order = np.empty(0, dtype=np.int64)
+            return
+
+        self._lat0 = float(np.radians(self.lats.mean()))
+        x, y = self._project(self.lats, self.lons)
+        self._x0 = float(x.min())
+        self._y0 = float(y.min())
+
+        ix = ((x - self._x0) // cell_size_km).astype(np.int64)
+        iy = ((y - self._y0) // cell_size_km).astype(np.int64)
+        self._nx = int(ix.max()) + 1
+        self._ny = int(iy.max()) + 1
+
+        keys = iy * self._nx + ix
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _project(self, lats, lons):
+        """Equirectangular projection to km, good enough for bucketing within a city"""
+        x = np.radians(lons) * EARTH_RADIUS_KM * np.cos(self._lat0)
+        y = np.radians(lats) * EARTH_RADIUS_KM
+        return x, y
+
+    def _candidates(self, lat, lon, radius_km):
+        """Positions of all points in the cells overlapping the search circle"""
+        x, y = self._project(lat, lon)
+        ix0 = max(int((x - radius_km - self._x0) // self.cell_size_km), 0)
+        ix1 = min(int((x + radius_km - self._x0) // self.cell_size_km), self._nx - 1)
+        iy0 = max(int((y - radius_km - self._y0) // self.cell_size_km), 0)
+        iy1 = min(int((y + radius_km - self._y0) // self.cell_size_km), self._ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+
+        # one contiguous key range per grid row
+        rows = np.arange(iy0, iy1 + 1, dtype=np.int64) * self._nx
+        starts = np.searchsorted(self._keys, rows + ix0, side="left")
+        ends = np.searchsorted(self._keys, rows + ix1, side="right")
+        if len(rows) == 1:
+            return self._order[starts[0]:ends[0]]
+        return np.concatenate([self._order[s:e] for s, e in zip(starts, ends)])
+
+    def query_radius(self, lat, lon, radius_km):
+        """
+        All points within radius_km of (lat, lon), sorted by distance.
+        Returns (positions, distances_km).
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        # kleiner Puffer, damit Projektionsfehler am Rand nichts abschneiden
+        cand = self._candidates(lat, lon, radius_km * 1.01)
+        dist = distances_km(lat, lon, self.lats[cand], self.lons[cand])
+        mask = dist <= radius_km
+        cand, dist = cand[mask], dist[mask]
+        order = np.argsort(dist, kind="stable")
+        return cand[order], dist[order]
+
+    def query_knn(self, lat, lon, k):
+        """
+        The k nearest points to (lat, lon), sorted by distance.
+        Returns (positions, distances_km).
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        # Suchradius verdoppeln, bis genug Punkte gefunden sind
+        extent_km = (self._nx + self._ny) * self.cell_size_km
+        radius_km = self.cell_size_km
+        while radius_km < extent_km:
+            positions, dist = self.query_radius(lat, lon, radius_km)
+            if len(positions) >= k:
+                return positions[:k], dist[:k]
+            radius_km *= 2
+
+        # Punkt liegt weit ausserhalb des Grids -> alle Punkte pruefen
+        dist = distances_km(lat, lon, self.lats, self.lons)
+        positions = np.argsort(dist, kind="stable")[:k]
+        return positions, dist[positions]
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+import aq_providers
+from aq_cache import AirQualityCache
+from aq_providers import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, FallbackProvider, Provider, ProviderChain, aq_budget,
+)
+
+MEASUREMENTS = {"pm25": 10.0, "pm10": 17.0, "no2": 20.0}
+
+
+class FakeProvider(Provider):
+    """Remote provider answering after delays[i] seconds on call i (the last delay repeats), or raising error"""
+    name = "fake"
+    remote = True
+
+    def __init__(self, delays=(0.0,), error=None):
+        super().__init__()
+        self.delays = list(delays)
+        self.error = error
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+
+    def fetch_many(self, coords, timeout):
+        with self._requests_lock:
+            delay = self.delays[min(self.requests, len(self.delays) - 1)]
+            self.requests += 1
+        time.sleep(delay)
+        if self.error is not None:
+            raise self.error
+        return [dict(MEASUREMENTS) for _ in coords]
+
+
+def chain_of(provider):
+    return ProviderChain([provider, FallbackProvider()], cache=AirQualityCache(), workers=4)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, cooldown=60)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()  # Erfolg setzt den Zaehler zurueck
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN and breaker.opened == 1
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()  # genau ein Versuch
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.failure()  # Versuch gescheitert -> wieder offen
+    assert breaker.state == OPEN and breaker.opened == 2
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_breaker_release_frees_the_trial():
+    breaker = CircuitBreaker(failures=1, cooldown=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_failing_provider_is_skipped_once_open():
+    provider = FakeProvider(error=ConnectionError("down"))
+    provider.breaker = CircuitBreaker(failures=3, cooldown=60)
+    chain = chain_of(provider)
+    for i in range(5):
+        assert chain.get(48.0 + i, 11.5) is not None  # Fallback antwortet
+    assert provider.breaker.state == OPEN
+    assert provider.requests == 3
+    assert provider.skipped == 2
+
+
+def test_hedge_wins_against_slow_first_request(monkeypatch):
+    monkeypatch.setattr(aq_providers, "HEDGE_AFTER", 0.05)
+    provider = FakeProvider(delays=(1.0, 0.0))
+    chain = chain_of(provider)
+    started = time.monotonic()
+    with aq_budget(2.0):
+        result = chain.get(48.137, 11.575)
+    assert time.monotonic() - started < 0.5
+    assert result == MEASUREMENTS
+    assert provider.hedges == 1 and provider.hedge_wins == 1
+    assert provider.breaker.state == CLOSED
+
+
+def test_no_hedge_for_fast_answers(monkeypatch):
+    monkeypatch.setattr(aq_providers, "HEDGE_AFTER", 0.2)
+    provider = FakeProvider(delays=(0.0,))
+    assert chain_of(provider).get(48.137, 11.575) == MEASUREMENTS
+    assert provider.hedges == 0 and provider.requests == 1
+
+
+def test_budget_starved_timeouts_do_not_open_the_breaker():
+    provider = FakeProvider(delays=(1.0,))
+    chain = chain_of(provider)
+    for i in range(5):
+        with aq_budget(0.01):
+            assert chain.get(40.0 + i, 11.5) is not None
+    assert provider.timeouts == 5
+    assert provider.breaker.state == CLOSED
+
+
+def test_waiter_falls_back_within_its_own_budget(monkeypatch):
+    monkeypatch.setattr(aq_providers, "HEDGE_AFTER", 5.0)
+    provider = FakeProvider(delays=(1.0,))
+    chain = chain_of(provider)
+
+    def leader():
+        with aq_budget(2.0):
+            chain.get(46.0, 11.0)
+    thread = threading.Thread(target=leader)
+    thread.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    with aq_budget(0.2):
+        result = chain.get(46.0, 11.0)
+    waited = time.monotonic() - started
+    thread.join()
+    assert result is not None
+    assert waited == pytest.approx(0.2, abs=0.1)
+    assert provider.requests == 1  # der Wartende schickt keine eigene Abfrage
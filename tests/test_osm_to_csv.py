@@ -0,0 +1,36 @@
+import pandas as pd
+
+from fake_overpass import FIXTURE_TIMESTAMP, start_fake_overpass
+from osm_to_csv import MUNICH_BBOX, ingest
+
+
+def node(osm_id, lat, lon, name, timestamp=FIXTURE_TIMESTAMP):
+    return {"type": "node", "id": osm_id, "lat": lat, "lon": lon, "timestamp": timestamp,
+            "tags": {"name": name, "tourism": "attraction"}}
+
+
+def run_ingest(url, tmp_path, incremental):
+    csv_path = tmp_path / "places.csv"
+    ingest(MUNICH_BBOX, incremental=incremental, url=url, tile_dir=str(tmp_path / "tiles"),
+           output_csv=str(csv_path), rows=2, cols=2)
+    return sorted(pd.read_csv(csv_path)["name"])
+
+
+def test_incremental_ingest_drops_deleted_nodes(tmp_path):
+    elements = [
+        node(1, 48.10, 11.40, "Southwest"),
+        node(2, 48.11, 11.41, "Gone later"),
+        node(3, 48.20, 11.70, "Northeast"),
+    ]
+    server, url = start_fake_overpass(elements)
+    try:
+        assert run_ingest(url, tmp_path, incremental=False) == ["Gone later", "Northeast", "Southwest"]
+
+        # geloescht bzw. aus dem Filter umgetaggt: taucht bei newer: nie auf
+        del elements[1]
+        assert run_ingest(url, tmp_path, incremental=True) == ["Northeast", "Southwest"]
+
+        elements.append(node(4, 48.21, 11.71, "New", timestamp="2999-01-01T00:00:00Z"))
+        assert run_ingest(url, tmp_path, incremental=True) == ["New", "Northeast", "Southwest"]
+    finally:
+        server.shutdown()
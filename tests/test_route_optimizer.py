@@ -0,0 +1,70 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from route_optimizer import solve_tour, tour_length
+
+ENDPOINTS = [(None, None), ("first", None), (None, "last"), ("first", "last"), ("first", "first")]
+
+
+def random_dist(n, seed):
+    points = np.random.default_rng(seed).random((n, 2))
+    return np.sqrt(((points[:, None] - points[None]) ** 2).sum(-1))
+
+
+def brute_force(dist, start, end):
+    """Shortest open path over all orders of the inner nodes"""
+    n = len(dist)
+    inner = [i for i in range(n) if i != start and i != end]
+    head = [start] if start is not None else []
+    tail = [end] if end is not None else []
+    return min(tour_length(head + list(p) + tail, dist) for p in itertools.permutations(inner))
+
+
+def endpoints(n, start, end):
+    resolve = {None: None, "first": 0, "last": n - 1}
+    return resolve[start], resolve[end]
+
+
+@pytest.mark.parametrize("n", range(2, 9))
+@pytest.mark.parametrize("start, end", ENDPOINTS)
+def test_fixed_endpoints_respected(n, start, end):
+    start, end = endpoints(n, start, end)
+    dist = random_dist(n, seed=n)
+    order, length = solve_tour(dist, start, end, time_budget=None)
+
+    if start is not None:
+        assert order[0] == start
+    if end is not None:
+        assert order[-1] == end
+    # jeder Knoten genau einmal, beim Rundweg der Start zusaetzlich am Ende
+    expected = sorted(range(n)) + ([start] if start is not None and start == end else [])
+    assert sorted(order) == sorted(expected)
+    assert length == pytest.approx(tour_length(order, dist))
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("start, end", ENDPOINTS)
+def test_optimal_for_tiny_tours(seed, start, end):
+    # bis 4 Knoten findet 2-opt / Or-opt immer das Optimum
+    for n in range(2, 5):
+        s, e = endpoints(n, start, end)
+        dist = random_dist(n, seed)
+        _, length = solve_tour(dist, s, e, time_budget=None)
+        assert length == pytest.approx(brute_force(dist, s, e))
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("start, end", ENDPOINTS)
+def test_close_to_optimal_for_small_tours(seed, start, end):
+    for n in range(5, 9):
+        s, e = endpoints(n, start, end)
+        dist = random_dist(n, seed)
+        _, length = solve_tour(dist, s, e, time_budget=None)
+        assert length <= brute_force(dist, s, e) * 1.15 + 1e-9
+
+
+def test_empty_and_single_node():
+    assert solve_tour(np.zeros((0, 0))) == ([], 0.0)
+    assert solve_tour(np.zeros((1, 1))) == ([0], 0.0)
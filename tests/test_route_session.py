@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+
+import route_session
+from distance import distance_matrix_km
+from route_session import RouteSession
+
+
+def session(n=4):
+    lats = 48.13 + np.arange(n) * 0.002
+    lons = 11.57 + np.arange(n) * 0.001
+    return RouteSession(lats, lons, distance_matrix_km(lats, lons), start=0, time_budget=None)
+
+
+class FakeLegs:
+    """get_legs for RouteSession.path: every leg bent through a midpoint, from source"""
+
+    def __init__(self, source):
+        self.source = source
+        self.requested = []
+
+    def __call__(self, locations):
+        self.requested.append(len(locations) - 1)
+        legs = [[a, ((a[0] + b[0]) / 2 + 1e-4, (a[1] + b[1]) / 2), b] for a, b in zip(locations[:-1], locations[1:])]
+        return legs, [self.source] * len(legs)
+
+
+def test_osrm_legs_are_kept_for_the_session():
+    route = session()
+    get_legs = FakeLegs("osrm")
+    first = route.path(get_legs)
+    assert route.path(get_legs) == first
+    assert get_legs.requested == [3]
+
+
+def test_fallback_legs_are_routed_again_after_their_ttl(monkeypatch):
+    monkeypatch.setitem(route_session.FALLBACK_LEG_TTL, "local", 0.05)
+    monkeypatch.setitem(route_session.FALLBACK_LEG_TTL, "straight", 0.05)
+    route = session()
+    for source in ("straight", "local"):
+        get_legs = FakeLegs(source)
+        route.path(get_legs)
+        route.path(get_legs)  # innerhalb der TTL aus der Sitzung
+        assert get_legs.requested == [3]
+        time.sleep(0.06)
+
+    # OSRM ist zurueck: die abgelaufenen Ersatz-Legs werden ersetzt und dann behalten
+    get_legs = FakeLegs("osrm")
+    route.path(get_legs)
+    route.path(get_legs)
+    assert get_legs.requested == [3]
+    assert route._leg_expires == {}
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from citytour.tour import session_route
+from distance import distance_matrix_km
+from walking_matrix import WalkingMatrix, _tri_offsets
+
+
+class FakeDataset:
+    version = "v1"
+
+
+def places(n=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "poi_id": np.arange(n),
+        "lat": 48.13 + rng.random(n) * 0.02,
+        "lon": 11.56 + rng.random(n) * 0.03,
+    })
+
+
+def walking_matrix(df, seed=1):
+    """Packed triangle of straight-line distances with random detours"""
+    n = len(df)
+    full = distance_matrix_km(df['lat'].to_numpy(), df['lon'].to_numpy())
+    full = full * np.random.default_rng(seed).uniform(1.1, 2.0, (n, n))
+    i, j = np.triu_indices(n, 1)
+    tri = np.empty(n * (n - 1) // 2, dtype=np.float32)
+    tri[_tri_offsets(n)[i] + j] = full[i, j]
+    return WalkingMatrix(tri, n)
+
+
+def test_progress_kept_when_walking_matrix_arrives():
+    df = places()
+    state = {}
+    route = session_route(state, FakeDataset(), df, None)
+    assert not route.walking
+    first = route.order[0]
+    route.visit(first)
+    route.skip(route.order[-1])
+    skipped = set(route.skipped)
+    remaining = set(route.order)
+
+    matrix = walking_matrix(df)
+    again = session_route(state, FakeDataset(), df, matrix)
+    assert again is route
+    assert again.walking
+    assert again.visited == [first] and again.anchor == first
+    assert again.skipped == skipped
+    assert set(again.order) == remaining
+    np.testing.assert_allclose(again.dist, matrix.submatrix(df['poi_id'].to_numpy()))
+
+    # spaetere Renders aendern nichts mehr
+    order = list(again.order)
+    assert session_route(state, FakeDataset(), df, matrix).order == order
+
+
+def test_new_filter_plans_a_new_route():
+    df = places()
+    state = {}
+    route = session_route(state, FakeDataset(), df, None)
+    route.visit(route.order[0])
+    other = session_route(state, FakeDataset(), df.iloc[:5], None)
+    assert other is not route and other.visited == []
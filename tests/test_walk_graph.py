@@ -0,0 +1,92 @@
+import heapq
+import math
+
+import numpy as np
+import pytest
+
+from walk_graph import WalkGraph
+
+GRID = 12
+
+
+def grid_elements(seed, drop=0.25):
+    """Overpass-style elements: a jittered GRID x GRID street grid around Marienplatz with gaps and diagonals"""
+    rng = np.random.default_rng(seed)
+    elements = []
+    for r in range(GRID):
+        for c in range(GRID):
+            lat = 48.130 + r * 0.001 + rng.uniform(-0.0003, 0.0003)
+            lon = 11.570 + c * 0.0015 + rng.uniform(-0.0003, 0.0003)
+            elements.append({"type": "node", "id": r * GRID + c, "lat": lat, "lon": lon})
+    # Insel ohne Verbindung zum Gitter
+    elements.append({"type": "node", "id": 1000, "lat": 48.2, "lon": 11.7})
+    elements.append({"type": "node", "id": 1001, "lat": 48.201, "lon": 11.7})
+    elements.append({"type": "way", "nodes": [1000, 1001]})
+
+    for r in range(GRID):
+        for c in range(GRID):
+            u = r * GRID + c
+            for v in (u + 1 if c + 1 < GRID else None, u + GRID if r + 1 < GRID else None,
+                      u + GRID + 1 if c + 1 < GRID and r + 1 < GRID and rng.random() < 0.2 else None):
+                if v is not None and rng.random() >= drop:
+                    elements.append({"type": "way", "nodes": [u, v]})
+    return elements
+
+
+def dijkstra(graph, s):
+    dist = {s: 0.0}
+    heap = [(0.0, s)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        lo, hi = graph.indptr[u], graph.indptr[u + 1]
+        for v, w in zip(graph.indices[lo:hi].tolist(), graph.weights[lo:hi].tolist()):
+            if d + w < dist.get(v, math.inf):
+                dist[v] = d + w
+                heapq.heappush(heap, (d + w, v))
+    return dist
+
+
+def path_length(graph, path):
+    total = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        lo, hi = graph.indptr[u], graph.indptr[u + 1]
+        neighbours = graph.indices[lo:hi]
+        assert v in neighbours, f"{u} -> {v} is not an edge"
+        total += float(graph.weights[lo:hi][neighbours == v].min())
+    return total
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_astar_matches_dijkstra(seed):
+    graph = WalkGraph.from_elements(grid_elements(seed))
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(len(graph), 5, replace=False)
+    for s in sources.tolist():
+        reference = dijkstra(graph, s)
+        for t in rng.choice(len(graph), 20, replace=False).tolist():
+            path = graph.shortest_path(s, t)
+            if t not in reference:
+                assert path is None
+                continue
+            assert path[0] == s and path[-1] == t
+            assert path_length(graph, path) == pytest.approx(reference[t], abs=1e-3)
+
+
+def test_unreachable_and_trivial():
+    graph = WalkGraph.from_elements(grid_elements(0))
+    island = int(np.argmax(graph.lat))
+    grid_node = int(np.argmin(graph.lat))
+    assert graph.shortest_path(grid_node, island) is None
+    assert graph.shortest_path(island, grid_node) is None
+    assert graph.shortest_path(grid_node, grid_node) == [grid_node]
+
+
+def test_saved_graph_routes_the_same(tmp_path):
+    graph = WalkGraph.from_elements(grid_elements(1))
+    graph.save(str(tmp_path))
+    loaded = WalkGraph.load(str(tmp_path))
+    a, b = (48.1301, 11.5701), (48.1405, 11.5855)
+    assert loaded.route_leg(a, b) == graph.route_leg(a, b)
+    assert graph.route_leg(a, b)[0] == a and graph.route_leg(a, b)[-1] == b
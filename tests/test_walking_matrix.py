@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import walking_matrix
+from walking_matrix import WalkingMatrix, _tri_offsets
+
+
+def packed(full):
+    n = len(full)
+    i, j = np.triu_indices(n, 1)
+    tri = np.empty(n * (n - 1) // 2, dtype=np.float32)
+    tri[_tri_offsets(n)[i] + j] = full[i, j]
+    return tri
+
+
+def test_submatrix_symmetric_with_zero_diagonal():
+    rng = np.random.default_rng(0)
+    full = rng.random((7, 7))
+    full = (full + full.T) / 2
+    np.fill_diagonal(full, 0)
+    matrix = WalkingMatrix(packed(full), 7)
+    positions = [5, 0, 3, 3]
+    np.testing.assert_allclose(matrix.submatrix(positions), full[np.ix_(positions, positions)], rtol=1e-6)
+
+
+@pytest.mark.parametrize("positions", [[0], [0, 0], []])
+def test_submatrix_of_single_place_dataset(positions):
+    matrix = WalkingMatrix(np.zeros(0, np.float32), 1)
+    assert matrix.submatrix(positions).tolist() == np.zeros((len(positions), len(positions))).tolist()
+
+
+def test_load_single_place_matrix(tmp_path):
+    path = str(tmp_path / "walking-x.npy")
+    np.save(path, np.zeros(0, np.float32))
+    matrix = WalkingMatrix.load(path)
+    assert matrix.n == 1 and matrix.submatrix([0]).tolist() == [[0.0]]
+
+
+def test_no_build_for_fewer_than_two_places():
+    assert walking_matrix.start_build(np.array([48.1]), np.array([11.5]), "single") is False
+
+
+def test_failed_build_leaves_no_temp_file(tmp_path, monkeypatch):
+    def replace_fails(src, dst):
+        raise PermissionError("read-only directory")
+    monkeypatch.setattr(walking_matrix, "fetch_osrm_block",
+                        lambda lats, lons, points, *args, **kwargs: np.ones((len(points), len(points))))
+    monkeypatch.setattr(walking_matrix.os, "replace", replace_fails)
+    with pytest.raises(PermissionError):
+        walking_matrix.build_matrix_file(np.arange(5.0), np.arange(5.0), str(tmp_path / "walking-x.npy"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_build_requests_only_stored_cells(tmp_path, monkeypatch):
+    n = 23
+    rng = np.random.default_rng(2)
+    directed = rng.uniform(0.1, 3.0, (n, n))  # Hin- und Rueckweg verschieden
+    requested = []
+
+    def fetch(lats, lons, points, sources=None, destinations=None, base_url=None, timeout=None):
+        points = np.asarray(points)
+        src = points if sources is None else points[list(sources)]
+        dst = points if destinations is None else points[list(destinations)]
+        requested.append((len(points), len(src), len(dst)))
+        return directed[np.ix_(src, dst)]
+
+    monkeypatch.setattr(walking_matrix, "TABLE_BLOCK", 5)
+    monkeypatch.setattr(walking_matrix, "fetch_osrm_block", fetch)
+    path = str(tmp_path / "walking-x.npy")
+    walking_matrix.build_matrix_file(np.zeros(n), np.zeros(n), path)
+
+    expected = (directed + directed.T) / 2
+    np.fill_diagonal(expected, 0)
+    np.testing.assert_allclose(WalkingMatrix.load(path).submatrix(np.arange(n)), expected, rtol=1e-6)
+    # jede Zelle der n x n Matrix genau einmal angefragt (Diagonalbloecke quadratisch)
+    assert sum(s * d for _, s, d in requested) == n * n
+    assert max(points for points, _, _ in requested) <= 10
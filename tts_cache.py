@@ -0,0 +1,225 @@
+"""
+Cache of spoken place descriptions.
+
+    tts_cache/<sha1(lang, text)>.mp3
+
+MP3 bytes live on disk (shared by all sessions and restarts) with an
+in-memory LRU in front. A small worker pool renders audio in the
+background so "Listen" is usually served straight from the cache.
+"""
+import hashlib
+import io
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from gtts import gTTS
+
+from metrics import metrics
+from singleflight import SingleFlight, group
+
+AUDIO_DIR = os.environ.get("CITYTOUR_TTS_DIR", "tts_cache")
+# "gtts": Google TTS over the network, "stub": offline silence for tests
+SYNTHESIZER = os.environ.get("CITYTOUR_TTS", "gtts")
+DEFAULT_LANG = "en"
+MAX_WORKERS = 4
+MAX_MEMORY_ENTRIES = 128
+# nach einem Fehlschlag pausieren die Hintergrund-Jobs so lange (Sekunden)
+RETRY_AFTER = 300
+
+# Prioritaeten der Hintergrund-Jobs, kleiner = frueher
+PRIORITY_ROUTE = 0
+PRIORITY_PLACES = 1
+
+# one silent MPEG-1 Layer III frame (128 kbit/s, 44.1 kHz, ~26 ms)
+_SILENT_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+
+
+def audio_key(text, lang=DEFAULT_LANG):
+    return hashlib.sha1(f"{lang}\n{text}".encode("utf-8")).hexdigest()
+
+
+def gtts_synthesize(text, lang=DEFAULT_LANG):
+    """MP3 bytes from Google TTS"""
+    audio_fp = io.BytesIO()
+    with metrics.span("external.gtts"):
+        gTTS(text=text, lang=lang).write_to_fp(audio_fp)
+    return audio_fp.getvalue()
+
+
+def stub_synthesize(text, lang=DEFAULT_LANG):
+    """Offline stand-in: silent MP3, roughly as long as reading text aloud"""
+    return _SILENT_FRAME * max(1, len(text) // 2)
+
+
+SYNTHESIZERS = {"gtts": gtts_synthesize, "stub": stub_synthesize}
+
+
+class AudioCache:
+    """
+    Thread-safe MP3 cache keyed by audio_key(text, lang).
+    - get(): memory, then disk, else None
+    - get_or_create(): like get(), synthesizes and stores on a miss; concurrent
+      misses for the same text wait for one synthesis (flight, a SingleFlight)
+    - prefetch(): queues texts for the background workers
+    """
+
+    def __init__(self, directory=AUDIO_DIR, synthesize=None, max_entries=MAX_MEMORY_ENTRIES, workers=MAX_WORKERS,
+                 flight=None):
+        self.directory = directory
+        self.synthesize = synthesize or SYNTHESIZERS[SYNTHESIZER]
+        self.max_entries = max_entries
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._flight = flight if flight is not None else SingleFlight()
+        self._failed_at = 0
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _remember(self, key, audio):
+        self._entries[key] = audio
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, text, lang=DEFAULT_LANG):
+        """Cached MP3 bytes of text, or None"""
+        key = audio_key(text, lang)
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self._remember(key, audio)
+            self.hits += 1
+        return audio
+
+    def get_or_create(self, text, lang=DEFAULT_LANG):
+        """MP3 bytes of text; synthesized and stored on a miss, None if synthesis fails"""
+        audio = self.get(text, lang)
+        if audio is not None:
+            return audio
+
+        # pro Text nur eine Synthese gleichzeitig, die anderen bekommen deren Ergebnis
+        key = audio_key(text, lang)
+        return self._flight.do(key, self._get_or_generate, key, text, lang)
+
+    def _get_or_generate(self, key, text, lang):
+        # ein vorheriger Flug fuer den Text kann seit dem get() in get_or_create fertig sein
+        audio = self.get(text, lang)
+        if audio is None:
+            audio = self._generate(key, text, lang)
+        return audio
+
+    def _generate(self, key, text, lang):
+        try:
+            audio = self.synthesize(text, lang)
+        except Exception as e:
+            print(f"Text-to-speech failed: {e}")
+            metrics.inc("tts.failure")
+            with self._lock:
+                self.failures += 1
+                self._failed_at = time.time()
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._remember(key, audio)
+            self.generated += 1
+            self._failed_at = 0  # wieder erreichbar, Hintergrund-Jobs laufen weiter
+        return audio
+
+    def prefetch(self, texts, lang=DEFAULT_LANG, priority=PRIORITY_PLACES):
+        """Queues texts that are not on disk yet for background synthesis"""
+        self._start_workers()
+        queued = 0
+        for text in texts:
+            if not text:
+                continue
+            key = audio_key(text, lang)
+            with self._lock:
+                if key in self._pending or key in self._entries:
+                    continue
+                self._pending.add(key)
+            if os.path.exists(self._path(key)):
+                with self._lock:
+                    self._pending.discard(key)
+                continue
+            self._queue.put((priority, next(self._counter), key, text, lang))
+            queued += 1
+        return queued
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"tts-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            priority, _, key, text, lang = self._queue.get()
+            retry = False
+            try:
+                # offline: bis zum Ende des Retry-Fensters pausieren statt ins Timeout zu laufen oder
+                # Jobs zu verwerfen - prefetch_place_audio stellt sie nicht noch einmal ein
+                wait = self._failed_at + RETRY_AFTER - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                retry = self.get_or_create(text, lang) is None
+                if retry:
+                    self._queue.put((priority, next(self._counter), key, text, lang))
+            finally:
+                if not retry:
+                    with self._lock:
+                        self._pending.discard(key)
+                self._queue.task_done()
+
+    def join(self):
+        """Blocks until all queued texts are synthesized (not while synthesis keeps failing)"""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "generated": self.generated,
+                "failures": self.failures,
+                "queued": self._queue.qsize(),
+                "size": len(self._entries),
+            }
+
+
+audio_cache = AudioCache(flight=group("tts"))
@@ -0,0 +1,237 @@
+"""
+Offline pedestrian routing over an OSM walking graph.
+
+    python walk_graph.py            # fetch walkable ways in MUNICH_BBOX, save to walk_graph/
+
+The graph is a compact CSR adjacency (indptr / indices / weights in metres)
+stored as NumPy arrays; routes are found with bidirectional A*.
+"""
+import heapq
+import math
+import os
+import threading
+
+import numpy as np
+import requests
+
+from distance import EARTH_RADIUS_KM, haversine_km
+from osm_to_csv import MUNICH_BBOX
+from spatial_index import SpatialIndex
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+GRAPH_DIR = os.environ.get("CITYTOUR_WALK_GRAPH_DIR", "walk_graph")
+# Wege, die zu Fuss benutzbar sind
+WALKABLE_HIGHWAYS = ("footway|pedestrian|path|steps|living_street|residential|service|"
+                     "unclassified|tertiary|secondary|primary|track|cycleway")
+# Stops weiter als das vom naechsten Graph-Knoten werden nicht geroutet
+MAX_SNAP_KM = 0.5
+
+
+def fetch_walking_ways(bbox=MUNICH_BBOX, timeout=300):
+    """All walkable ways plus their nodes in bbox from Overpass (raw elements list)"""
+    bbox_str = ",".join(str(c) for c in bbox)
+    query = f"""
+    [out:json][timeout:{timeout}];
+    way["highway"~"^({WALKABLE_HIGHWAYS})$"]["foot"!~"^no$"]["access"!~"^(private|no)$"]({bbox_str});
+    (._;>;);
+    out skel qt;
+    """
+    response = requests.post(OVERPASS_URL, data=query, timeout=timeout)
+    response.raise_for_status()
+    return response.json()["elements"]
+
+
+class WalkGraph:
+    """
+    Undirected walking graph in CSR form.
+    - lat, lon: node coordinates
+    - indptr, indices: neighbours of node u are indices[indptr[u]:indptr[u + 1]]
+    - weights: edge lengths in metres, aligned with indices
+    """
+
+    FILES = ("lat", "lon", "indptr", "indices", "weights")
+
+    def __init__(self, lat, lon, indptr, indices, weights):
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._node_index = None
+
+    @classmethod
+    def from_elements(cls, elements):
+        """Builds the graph from Overpass node / way elements"""
+        coords = {}
+        ways = []
+        for element in elements:
+            if element["type"] == "node":
+                coords[element["id"]] = (element["lat"], element["lon"])
+            elif element["type"] == "way":
+                ways.append(element["nodes"])
+
+        # nur Knoten, die auf einem Weg liegen, kompakt durchnummerieren
+        node_ids = {}
+        src, dst = [], []
+        for way in ways:
+            way = [n for n in way if n in coords]
+            for a, b in zip(way[:-1], way[1:]):
+                src.append(node_ids.setdefault(a, len(node_ids)))
+                dst.append(node_ids.setdefault(b, len(node_ids)))
+
+        n = len(node_ids)
+        lat = np.empty(n, dtype=np.float64)
+        lon = np.empty(n, dtype=np.float64)
+        for osm_id, idx in node_ids.items():
+            lat[idx], lon[idx] = coords[osm_id]
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weights = haversine_km(lat[src], lon[src], lat[dst], lon[dst]) * 1000
+
+        # beide Richtungen, nach Startknoten sortiert -> CSR
+        all_src = np.concatenate([src, dst])
+        all_dst = np.concatenate([dst, src])
+        all_w = np.concatenate([weights, weights])
+        order = np.argsort(all_src, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_src, minlength=n), out=indptr[1:])
+        return cls(lat, lon, indptr, all_dst[order].astype(np.int32), all_w[order].astype(np.float32))
+
+    def save(self, directory=GRAPH_DIR):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory=GRAPH_DIR):
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in cls.FILES]
+        return cls(*arrays)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def nearest_node(self, lat, lon):
+        """Closest graph node to (lat, lon) and its distance in km"""
+        if self._node_index is None:
+            self._node_index = SpatialIndex(self.lat, self.lon, cell_size_km=0.1)
+        positions, dist = self._node_index.query_knn(lat, lon, 1)
+        if len(positions) == 0:
+            return None, math.inf
+        return int(positions[0]), float(dist[0])
+
+    def _straight_m(self, u, v):
+        """Great-circle distance in metres between two nodes (A* heuristic)"""
+        lat1, lat2 = math.radians(float(self.lat[u])), math.radians(float(self.lat[v]))
+        dlat = lat2 - lat1
+        dlon = math.radians(float(self.lon[v]) - float(self.lon[u]))
+        a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * 1000 * math.asin(min(1.0, math.sqrt(a)))
+
+    def shortest_path(self, s, t):
+        """
+        Node ids of the shortest walk from s to t, or None if unreachable.
+        Bidirectional A* with average potentials p(v) = (h_t(v) - h_s(v)) / 2:
+        both searches run Dijkstra on the same reduced edge costs, so the
+        usual bidirectional stopping rule stays exact.
+        """
+        if s == t:
+            return [s]
+
+        potentials = {}
+
+        def p(v):
+            val = potentials.get(v)
+            if val is None:
+                val = (self._straight_m(v, t) - self._straight_m(v, s)) / 2
+                potentials[v] = val
+            return val
+
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        dist = ({s: 0.0}, {t: 0.0})
+        parent = ({s: None}, {t: None})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        best, meet = math.inf, None
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+            other = dist[1 - side]
+            pu = p(u)
+            lo, hi = indptr[u], indptr[u + 1]
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                # reduzierte Kosten, vorwaerts: w - p(u) + p(v), rueckwaerts: w + p(u) - p(v)
+                reduced = w - pu + p(v) if side == 0 else w + pu - p(v)
+                nd = d + max(reduced, 0.0)
+                if nd < dist[side].get(v, math.inf):
+                    dist[side][v] = nd
+                    parent[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+                    if v in other and nd + other[v] < best:
+                        best, meet = nd + other[v], v
+
+        if meet is None:
+            return None
+
+        path = []
+        v = meet
+        while v is not None:
+            path.append(v)
+            v = parent[0][v]
+        path.reverse()
+        v = parent[1][meet]
+        while v is not None:
+            path.append(v)
+            v = parent[1][v]
+        return path
+
+    def route_leg(self, a, b):
+        """Walking geometry [(lat, lon), ...] from stop a to stop b, or None"""
+        s, ds = self.nearest_node(*a)
+        t, dt = self.nearest_node(*b)
+        if s is None or t is None or ds > MAX_SNAP_KM or dt > MAX_SNAP_KM:
+            return None
+        nodes = self.shortest_path(s, t)
+        if nodes is None:
+            return None
+        return [tuple(a)] + [(float(self.lat[v]), float(self.lon[v])) for v in nodes] + [tuple(b)]
+
+    def route(self, locations):
+        """
+        Multi-stop walking route through locations [(lat, lon), ...] in the
+        [[lon, lat], ...] format of the PathLayer, or None if a leg fails.
+        """
+        path = []
+        for a, b in zip(locations[:-1], locations[1:]):
+            leg = self.route_leg(a, b)
+            if leg is None:
+                return None
+            path.extend(leg[1:] if path else leg)
+        return [[lon, lat] for lat, lon in path]
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_walk_graph():
+    """The saved walking graph, loaded once per process (None if it was never built)"""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                try:
+                    _graph = WalkGraph.load(GRAPH_DIR)
+                except FileNotFoundError:
+                    return None
+    return _graph
+
+
+if __name__ == "__main__":
+    graph = WalkGraph.from_elements(fetch_walking_ways())
+    graph.save(GRAPH_DIR)
+    print(f"Walking graph saved to {GRAPH_DIR}/ with {len(graph)} nodes and {len(graph.indices) // 2} edges.")
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+
+from metrics import metrics
+from route_cache import OSRM_BASE_URL
+
+OSRM_TABLE_TIMEOUT = 10
+# the public OSRM server accepts at most ~100 coordinates per table request
+TABLE_BLOCK = 50
+MATRIX_DIR = os.environ.get("CITYTOUR_MATRIX_DIR", "matrices")
+# nach einem Fehlschlag so lange nicht erneut versuchen (Sekunden)
+RETRY_AFTER = 300
+# (n / TABLE_BLOCK)^2 / 2 Abfragen und n^2 * 2 Byte auf der Platte: darueber keine Matrix
+MAX_PLACES = int(os.environ.get("CITYTOUR_MATRIX_MAX_PLACES", 5000))
+
+
+def fetch_osrm_block(lats, lons, points, sources=None, destinations=None, base_url=None,
+                     timeout=OSRM_TABLE_TIMEOUT):
+    """
+    Walking distances in km from sources to destinations (positions in points,
+    default all) via one request to OSRM's /table/v1/foot; points are indices
+    into lats / lons. Returns a (sources, destinations) float64 matrix, inf
+    where OSRM found no path.
+    """
+    base_url = base_url or OSRM_BASE_URL
+    loc_string = ";".join(f"{lons[p]},{lats[p]}" for p in points)
+    url = f"{base_url}/table/v1/foot/{loc_string}?annotations=distance"
+    if sources is not None:
+        url += "&sources=" + ";".join(str(i) for i in sources)
+    if destinations is not None:
+        url += "&destinations=" + ";".join(str(i) for i in destinations)
+    with metrics.span("external.osrm_table"):
+        r = requests.get(url, timeout=timeout)
+        r.raise_for_status()
+    block = np.array(r.json()['distances'], dtype=np.float64)  # Meter, null = unerreichbar
+    return np.where(np.isnan(block), np.inf, block) / 1000
+
+
+def build_matrix_file(lats, lons, path, base_url=None, timeout=OSRM_TABLE_TIMEOUT):
+    """
+    Writes the walking matrix of all points to path as the packed float32
+    upper triangle, filled TABLE_BLOCK x TABLE_BLOCK block by block through a
+    memory map, so no full (n, n) matrix is ever held. Only blocks on or above
+    the diagonal are requested, off the diagonal as source x destination
+    rectangles in both directions; directions are averaged to make it symmetric.
+    The file appears with an atomic rename once it is complete.
+    """
+    n = len(lats)
+    offsets = _tri_offsets(n)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp.npy"
+    tri = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n * (n - 1) // 2,))
+    try:
+        try:
+            _fill_triangle(tri, lats, lons, offsets, base_url, timeout)
+            tri.flush()
+        finally:
+            tri = None  # Memory-Map schliessen, vor dem Umbenennen bzw. Aufraeumen
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _fill_triangle(tri, lats, lons, offsets, base_url, timeout):
+    """Requests the blocks on or above the diagonal and writes their cells into tri"""
+    n = len(lats)
+    for s0 in range(0, n, TABLE_BLOCK):
+        s1 = min(s0 + TABLE_BLOCK, n)
+        for d0 in range(s0, n, TABLE_BLOCK):
+            d1 = min(d0 + TABLE_BLOCK, n)
+            if d0 == s0:
+                # Diagonalblock: eine quadratische Abfrage liefert beide Richtungen
+                block = fetch_osrm_block(lats, lons, list(range(s0, s1)), base_url=base_url, timeout=timeout)
+                block = (block + block.T) / 2
+            else:
+                # nur die Quell x Ziel-Zellen, hin und zurueck
+                points = list(range(s0, s1)) + list(range(d0, d1))
+                src, dst = range(s1 - s0), range(s1 - s0, len(points))
+                forward = fetch_osrm_block(lats, lons, points, src, dst, base_url, timeout)
+                backward = fetch_osrm_block(lats, lons, points, dst, src, base_url, timeout)
+                block = (forward + backward.T) / 2
+            for i in range(s0, s1):
+                j = np.arange(max(i + 1, d0), d1)
+                if len(j):
+                    tri[offsets[i] + j] = block[i - s0, j - d0]
+
+
+def _tri_offsets(n):
+    """Offset of row i in the packed upper triangle (without diagonal)"""
+    i = np.arange(n, dtype=np.int64)
+    return i * n - i * (i + 1) // 2 - i - 1
+
+
+class WalkingMatrix:
+    """
+    Symmetric POI-to-POI walking distances (km) of one dataset version,
+    stored as the packed float32 upper triangle (n * (n - 1) / 2 values).
+    The array is usually a read-only memory map of the .npy file.
+    """
+
+    def __init__(self, tri, n):
+        self.tri = tri
+        self.n = n
+        self._offsets = _tri_offsets(n)
+
+    @classmethod
+    def load(cls, path):
+        tri = np.load(path, mmap_mode="r")
+        # n aus n * (n - 1) / 2 zurueckrechnen
+        n = int(round((1 + np.sqrt(1 + 8 * len(tri))) / 2)) if len(tri) else 1
+        return cls(tri, n)
+
+    def submatrix(self, positions):
+        """Full (m, m) float64 distance matrix between the POIs at positions"""
+        positions = np.asarray(positions, dtype=np.int64)
+        i = positions[:, None]
+        j = positions[None, :]
+        lo = np.minimum(i, j)
+        hi = np.maximum(i, j)
+        # nur ausserhalb der Diagonale lesen: bei n < 2 ist das Dreieck leer
+        off = lo != hi
+        out = np.zeros((len(positions), len(positions)), dtype=np.float64)
+        out[off] = np.asarray(self.tri)[self._offsets[lo[off]] + hi[off]]
+        return out
+
+
+def matrix_path(dataset_version):
+    return os.path.join(MATRIX_DIR, f"walking-{dataset_version}.npy")
+
+
+def _build(lats, lons, dataset_version, base_url=None):
+    path = matrix_path(dataset_version)
+    try:
+        os.makedirs(MATRIX_DIR, exist_ok=True)
+        started = time.time()
+        build_matrix_file(lats, lons, path, base_url=base_url)
+        print(f"Walking matrix {path} built for {len(lats)} places in {time.time() - started:.0f} s")
+    except Exception as e:
+        print(f"Walking matrix unavailable, using straight-line distances: {e}")
+        metrics.inc("walking_matrix.fallback")
+        with _lock:
+            _failed_at[dataset_version] = time.time()
+    finally:
+        with _lock:
+            _building.discard(dataset_version)
+
+
+def start_build(lats, lons, dataset_version, base_url=None):
+    """Builds the matrix of dataset_version in a background thread (once at a time); False if not started"""
+    if len(lats) < 2 or len(lats) > MAX_PLACES:
+        return False
+    with _lock:
+        if dataset_version in _building:
+            return False
+        _building.add(dataset_version)
+    thread = threading.Thread(target=_build, name=f"walking-matrix-{dataset_version}", daemon=True,
+                              args=(np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64),
+                                    dataset_version, base_url))
+    thread.start()
+    return True
+
+
+_matrices = {}
+_failed_at = {}
+_building = set()
+_lock = threading.Lock()
+
+
+def get_walking_matrix(lats, lons, dataset_version):
+    """
+    Walking matrix of a dataset version, memory-mapped once per process.
+    Never waits for OSRM: without a finished file it starts a background
+    build (retried RETRY_AFTER seconds after a failure) and returns None,
+    callers then use straight-line distances until the file is there.
+    """
+    with _lock:
+        matrix = _matrices.get(dataset_version)
+        if matrix is not None:
+            return matrix
+        if dataset_version in _building or time.time() - _failed_at.get(dataset_version, 0) < RETRY_AFTER:
+            return None
+
+    path = matrix_path(dataset_version)
+    if os.path.exists(path):
+        matrix = WalkingMatrix.load(path)
+        with _lock:
+            return _matrices.setdefault(dataset_version, matrix)
+    start_build(lats, lons, dataset_version)
+    return None
+
+
+if __name__ == "__main__":
+    # nach einem Ingest (osm_to_csv.py) vorab bauen, statt beim ersten Guided-Render
+    from citytour.dataset import load_dataset
+
+    dataset = load_dataset()
+    if os.path.exists(matrix_path(dataset.version)):
+        print(f"{matrix_path(dataset.version)} already exists.")
+    else:
+        os.makedirs(MATRIX_DIR, exist_ok=True)
+        build_matrix_file(dataset.places['lat'].to_numpy(), dataset.places['lon'].to_numpy(),
+                          matrix_path(dataset.version))
+        print(f"{matrix_path(dataset.version)} written.")